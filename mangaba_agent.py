@@ -5,13 +5,18 @@ from config import config
 from utils.logger import get_logger
 from protocols.a2a import A2AAgent, A2AMessage, MessageType
 from protocols.mcp import MCPProtocol, MCPContext, ContextType, ContextPriority
+from protocols.mcp_budget import ContextAssembly, assemble_contexts
+from protocols.mcp_log import MCPLog
+from protocols.mcp_sqlite import SQLiteMCPProtocol
 import uuid
 
 class MangabaAgent(A2AAgent):
     """Agente de IA inteligente e versátil com protocolos A2A e MCP"""
     
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None, 
-                 agent_id: Optional[str] = None, enable_mcp: bool = True):
+                 agent_id: Optional[str] = None, enable_mcp: bool = True,
+                 mcp_db_path: Optional[str] = None, mcp_log_dir: Optional[str] = None,
+                 context_token_budget: int = 1000, context_candidates: int = 20):
         """Inicializa o agente com capacidades A2A e MCP."""
         
         # Inicializa A2A
@@ -29,8 +34,21 @@ class MangabaAgent(A2AAgent):
         # Protocolo MCP
         self.mcp_enabled = enable_mcp
         if self.mcp_enabled:
-            self.mcp = MCPProtocol()
-            self.current_session_id = self.mcp.create_session(f"session_{self.agent_id}")
+            # Com mcp_db_path o contexto é persistido em SQLite
+            self.mcp = SQLiteMCPProtocol(mcp_db_path) if mcp_db_path else MCPProtocol()
+            # Com mcp_log_dir o contexto em memória é recuperado do log de mutações
+            self.mcp_log = None
+            if mcp_log_dir and not mcp_db_path:
+                self.mcp_log = MCPLog(mcp_log_dir)
+                self.mcp_log.recover(self.mcp)
+            # Com contexto persistido, o agente retoma a própria sessão
+            self.current_session_id = self._resume_session(f"session_{self.agent_id}")
+            # Sessões de conhecimento compartilhado consultadas junto com a sessão atual
+            self.shared_session_ids: List[str] = []
+            # Orçamento de tokens dos contextos incluídos no prompt do chat
+            self.context_token_budget = context_token_budget
+            self.context_candidates = context_candidates
+            self.last_context_assembly: Optional[ContextAssembly] = None
         
         # Logger
         self.logger = get_logger(f"MangabaAgent[{self.agent_id}]")
@@ -39,6 +57,13 @@ class MangabaAgent(A2AAgent):
         # Configurações A2A específicas
         self.setup_mangaba_handlers()
     
+    def _resume_session(self, name: str) -> str:
+        """Retorna a sessão mais recente com o nome dado, criando-a se não existir"""
+        sessions = [session for session in self.mcp.sessions.values() if session.name == name]
+        if sessions:
+            return max(sessions, key=lambda session: session.updated_ts).id
+        return self.mcp.create_session(name)
+    
     def setup_mangaba_handlers(self):
         """Configura handlers específicos do Mangaba para A2A"""
         # Sobrescreve handlers padrão com versões específicas do Mangaba
@@ -104,11 +129,10 @@ class MangabaAgent(A2AAgent):
                 )
                 self.mcp.add_context(user_context, self.current_session_id)
                 
-                # Busca contexto relevante
-                relevant_contexts = self.mcp.get_relevant_contexts(message, max_results=5)
-                if relevant_contexts:
-                    context_info = "\n".join([f"- {ctx.content}" for ctx in relevant_contexts[:3]])
-                    enhanced_message = f"Contexto relevante:\n{context_info}\n\nPergunta atual: {message}"
+                # Busca contexto relevante dentro do orçamento de tokens
+                assembly = self.assemble_context(message)
+                if assembly.contexts:
+                    enhanced_message = f"Contexto relevante:\n{assembly.render()}\n\nPergunta atual: {message}"
                 else:
                     enhanced_message = message
             else:
@@ -139,6 +163,39 @@ class MangabaAgent(A2AAgent):
             self.logger.error(f"❌ Erro no chat: {e}")
             return f"Erro: {str(e)}"
     
+    def assemble_context(self, query: str) -> ContextAssembly:
+        """Seleciona os contextos do prompt dentro de ``context_token_budget``
+
+        Candidatos vêm da busca na sessão atual e nas compartilhadas; os
+        contextos CRITICAL dessas sessões sempre entram.
+        """
+        scope = [self.current_session_id] + list(self.shared_session_ids)
+        if hasattr(self.mcp, 'score_relevant_contexts'):
+            candidates = self.mcp.score_relevant_contexts(
+                query, max_results=self.context_candidates,
+                session_id=self.current_session_id,
+                shared_session_ids=self.shared_session_ids
+            )
+        else:
+            # Backends sem pontuação exposta: valor decrescente pela posição
+            contexts = self.mcp.get_relevant_contexts(
+                query, max_results=self.context_candidates,
+                session_id=self.current_session_id,
+                shared_session_ids=self.shared_session_ids
+            )
+            candidates = [(1.0 / (rank + 1), ctx) for rank, ctx in enumerate(contexts)]
+        critical = [ctx for session_id in scope
+                    for ctx in self.mcp.query_contexts(min_priority=ContextPriority.CRITICAL,
+                                                       session_id=session_id)]
+
+        # Contagens de tokens vêm do estimador local, em cache em cada contexto
+        assembly = assemble_contexts(candidates, self.context_token_budget, required=critical,
+                                     estimator=getattr(self.mcp, 'token_estimator', None))
+        self.last_context_assembly = assembly
+        self.logger.info(f"🧮 Contexto: {assembly.tokens_used}/{assembly.token_budget} tokens, "
+                         f"{len(assembly.contexts)} de {assembly.candidates} contextos")
+        return assembly
+
     def analyze_text(self, text: str, instruction: str = "Analise este texto") -> str:
         """Analisa texto com instrução específica"""
         try:
@@ -227,10 +284,11 @@ class MangabaAgent(A2AAgent):
             for ctx in contexts[-10:]:  # Últimos 10 contextos
                 ctx_type = ctx.context_type.value
                 if ctx_type in context_summary:
+                    content_str = str(ctx.content)
                     context_summary[ctx_type].append({
-                        "content": str(ctx.content)[:100] + "..." if len(str(ctx.content)) > 100 else str(ctx.content),
+                        "content": content_str[:100] + "..." if len(content_str) > 100 else content_str,
                         "priority": ctx.priority.value,
-                        "tags": ctx.tags
+                        "tags": list(ctx.iter_tags())
                     })
             
             summary_parts = []
@@ -1,7 +1,12 @@
 """Protocolos A2A e MCP para Mangaba AI"""
 
 from .a2a import A2AProtocol, A2AMessage, A2AAgent
-from .mcp import MCPProtocol, MCPContext, MCPSession
+from .mcp import MCPProtocol, MCPContext, MCPSession, ScoringMethod
+from .mcp_async import AsyncMCPProtocol
+from .mcp_eviction import EvictionMethod
+from .mcp_log import MCPLog
+from .mcp_sharded import ShardedMCPProtocol
+from .mcp_sqlite import SQLiteMCPProtocol
 
 __all__ = [
     "A2AProtocol",
@@ -9,5 +14,11 @@ __all__ = [
     "A2AAgent",
     "MCPProtocol",
     "MCPContext",
-    "MCPSession"
+    "MCPSession",
+    "ScoringMethod",
+    "AsyncMCPProtocol",
+    "EvictionMethod",
+    "MCPLog",
+    "ShardedMCPProtocol",
+    "SQLiteMCPProtocol"
 ]
\ No newline at end of file
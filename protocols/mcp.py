@@ -1,12 +1,35 @@
 """Protocolo MCP (Model Context Protocol) para gerenciamento de contexto avançado"""
 
+import copy
+import functools
+import heapq
 import json
+import math
+import re
+import sys
+import threading
+import time
 import uuid
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
+from itertools import islice
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Union
-from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Iterable, List, Optional, Any, Union, Tuple
+from dataclasses import dataclass
 from enum import Enum
-import hashlib
+
+from .mcp_dedup import PayloadStore, content_digest
+from .mcp_eviction import EvictionMethod, EvictionPolicy, create_eviction_policy
+from .mcp_lock import ReadWriteLock
+from .mcp_vector import HashedEmbedder, IVFIndex, VectorIndex
+from utils.token_estimator import TokenEstimator, default_estimator
+
+# Tokens indexados: sequências de caracteres de palavra do conteúdo serializado
+_TOKEN_RE = re.compile(r"\w+")
+
+# Parâmetros padrão do BM25 (saturação de frequência e normalização de tamanho)
+BM25_K1 = 1.2
+BM25_B = 0.75
 
 class ContextType(Enum):
     """Tipos de contexto MCP"""
@@ -24,29 +47,193 @@ class ContextPriority(Enum):
     HIGH = 3
     CRITICAL = 4
 
-@dataclass
+class ScoringMethod(Enum):
+    """Métodos de pontuação para busca de contextos relevantes"""
+    KEYWORD = "keyword"
+    BM25 = "bm25"
+    VECTOR = "vector"
+
+Timestamp = Union[str, float, datetime]
+
+
+def _to_timestamp(value: Optional[Timestamp]) -> Optional[float]:
+    """Converte ISO, datetime ou epoch para epoch em segundos (resolução de µs)"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime):
+        value = datetime.fromtimestamp(value)
+    return value.timestamp()
+
+
+def _epoch(value: Optional[Timestamp], alias: Optional[Timestamp], name: str) -> Optional[float]:
+    """Epoch de um argumento de data, aceito também pelo nome antigo ``*_at``"""
+    if alias is not None:
+        if value is not None:
+            raise TypeError(f"Informe apenas {name}_ts ou {name}_at")
+        value = alias
+    return value if value.__class__ is float else _to_timestamp(value)
+
+
+def _to_iso(timestamp: Optional[float]) -> Optional[str]:
+    """Formata um epoch em ISO 8601 (horário local)"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+class _LazyContent:
+    """Conteúdo ainda não lido: posição do JSON canônico em um arquivo mapeado
+
+    ``source`` é qualquer objeto com o atributo ``buffer`` e o método
+    ``decode(context, lazy)`` (ver ``mcp_store``). Strings grandes gravadas
+    uma única vez ficam fora do trecho do contexto: ``shared`` tem, em
+    sequência, a posição do corte no trecho e o início e o tamanho da
+    string no arquivo.
+    """
+
+    __slots__ = ('source', 'offset', 'length', 'shared')
+
+    def __init__(self, source: Any, offset: int, length: int, shared: Tuple[int, ...] = ()):
+        self.source = source
+        self.offset = offset
+        self.length = length
+        self.shared = shared
+
+    def raw(self) -> bytes:
+        """Bytes do JSON do conteúdo"""
+        buffer = self.source.buffer
+        start = self.offset
+        if not self.shared:
+            return buffer[start:start + self.length]
+        parts = []
+        previous = 0
+        shared = self.shared
+        for i in range(0, len(shared), 3):
+            cut, offset, length = shared[i:i + 3]
+            parts.append(buffer[start + previous:start + cut])
+            parts.append(buffer[offset:offset + length])
+            previous = cut
+        parts.append(buffer[start + previous:start + self.length])
+        return b"".join(parts)
+
+
 class MCPContext:
-    """Contexto individual no protocolo MCP"""
-    id: str
-    context_type: ContextType
-    content: Dict[str, Any]
-    priority: ContextPriority
-    created_at: str
-    updated_at: str
-    expires_at: Optional[str] = None
-    tags: List[str] = None
-    metadata: Dict[str, Any] = None
-    parent_id: Optional[str] = None
-    children_ids: List[str] = None
-    
-    def __post_init__(self):
-        if self.tags is None:
-            self.tags = []
-        if self.metadata is None:
-            self.metadata = {}
-        if self.children_ids is None:
-            self.children_ids = []
-    
+    """Contexto individual no protocolo MCP
+
+    Datas são mantidas como epoch (``created_ts``, ``updated_ts``,
+    ``expires_ts``); ``created_at``, ``updated_at`` e ``expires_at`` expõem
+    e aceitam strings ISO, inclusive no construtor.
+
+    Para caber milhões de contextos em memória a classe usa ``__slots__``
+    (sem ``__dict__`` por instância), tags são internadas e ``tags``,
+    ``metadata`` e ``children_ids`` só são alocados quando usados.
+    """
+
+    _FIELDS = ('id', 'context_type', 'content', 'priority', 'created_ts', 'updated_ts',
+               'expires_ts', 'tags', 'metadata', 'parent_id', 'children_ids')
+
+    __slots__ = ('id', 'context_type', '_content', 'priority', 'created_ts', 'updated_ts',
+                 'expires_ts', '_tags', '_metadata', 'parent_id', '_children_ids',
+                 '_serialized', '_search_text', '_terms', '_hash', '_tokens')
+
+    def __init__(self, id: str, context_type: ContextType, content: Dict[str, Any],
+                 priority: ContextPriority, created_ts: Optional[Timestamp] = None,
+                 updated_ts: Optional[Timestamp] = None, expires_ts: Optional[Timestamp] = None,
+                 tags: Optional[List[str]] = None, metadata: Optional[Dict[str, Any]] = None,
+                 parent_id: Optional[str] = None, children_ids: Optional[List[str]] = None, *,
+                 created_at: Optional[Timestamp] = None, updated_at: Optional[Timestamp] = None,
+                 expires_at: Optional[Timestamp] = None):
+        self.id = id
+        self.context_type = context_type
+        self.content = content
+        self.priority = priority
+        self.created_ts = _epoch(created_ts, created_at, "created")
+        self.updated_ts = _epoch(updated_ts, updated_at, "updated")
+        self.expires_ts = _epoch(expires_ts, expires_at, "expires")
+        if self.created_ts is None or self.updated_ts is None:
+            raise TypeError("MCPContext requer created_at e updated_at")
+        self.tags = tags
+        self._metadata = metadata or None
+        self.parent_id = parent_id
+        self._children_ids = children_ids or None
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._FIELDS)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._FIELDS)
+        return f"{self.__class__.__name__}({fields})"
+
+    def __getstate__(self):
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state['_content'] = self.content
+        return state
+
+    @property
+    def content(self) -> Dict[str, Any]:
+        """Conteúdo do contexto (lido do arquivo no primeiro acesso, se carregado com ``load``)"""
+        content = self._content
+        if content.__class__ is _LazyContent:
+            content = content.source.decode(self, content)
+        return content
+
+    @content.setter
+    def content(self, content: Dict[str, Any]):
+        self._content = content
+        self.invalidate_cache()
+
+    @property
+    def content_loaded(self) -> bool:
+        """Indica se o conteúdo já está em memória"""
+        return self._content.__class__ is not _LazyContent
+
+    def __setstate__(self, state: Dict[str, Any]):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def tags(self) -> List[str]:
+        """Tags do contexto (lista criada sob demanda)"""
+        if self._tags is None:
+            self._tags = []
+        return self._tags
+
+    @tags.setter
+    def tags(self, tags: Optional[List[str]]):
+        self._tags = [sys.intern(tag) for tag in tags] if tags else None
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """Metadados do contexto (dicionário criado sob demanda)"""
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, metadata: Optional[Dict[str, Any]]):
+        self._metadata = metadata or None
+
+    @property
+    def children_ids(self) -> List[str]:
+        """IDs dos contextos filhos (lista criada sob demanda)"""
+        if self._children_ids is None:
+            self._children_ids = []
+        return self._children_ids
+
+    @children_ids.setter
+    def children_ids(self, children_ids: Optional[List[str]]):
+        self._children_ids = children_ids or None
+
+    def iter_tags(self) -> Union[List[str], Tuple[()]]:
+        """Tags para leitura, sem alocar a lista quando não há nenhuma"""
+        return self._tags or ()
+
     @classmethod
     def create(cls, context_type: ContextType, content: Dict[str, Any], 
                priority: ContextPriority = ContextPriority.MEDIUM,
@@ -54,243 +241,1456 @@ class MCPContext:
                tags: List[str] = None,
                parent_id: Optional[str] = None) -> 'MCPContext':
         """Cria um novo contexto MCP"""
-        now = datetime.now().isoformat()
-        expires_at = None
+        now = datetime.now()
+        expires_ts = None
         if expires_in_hours:
-            expires_at = (datetime.now() + timedelta(hours=expires_in_hours)).isoformat()
-        
+            expires_ts = (now + timedelta(hours=expires_in_hours)).timestamp()
+
         return cls(
             id=str(uuid.uuid4()),
             context_type=context_type,
             content=content,
             priority=priority,
-            created_at=now,
-            updated_at=now,
-            expires_at=expires_at,
-            tags=tags or [],
+            created_ts=now.timestamp(),
+            updated_ts=now.timestamp(),
+            expires_ts=expires_ts,
+            tags=tags,
             parent_id=parent_id
         )
     
     def update_content(self, new_content: Dict[str, Any]):
         """Atualiza o conteúdo do contexto"""
         self.content.update(new_content)
-        self.updated_at = datetime.now().isoformat()
+        self.updated_ts = datetime.now().timestamp()
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        """Descarta as representações derivadas do conteúdo"""
+        self._serialized: Optional[str] = None
+        self._search_text: Optional[str] = None
+        self._terms: Optional[Tuple[bool, Dict[str, int]]] = None  # (escaped, contagens)
+        self._hash: Optional[str] = None
+        # (coeficientes do estimador, tokens), preenchido por utils.token_estimator
+        self._tokens: Optional[Tuple[Tuple[float, ...], int]] = None
+
+    def release_text(self):
+        """Libera o texto serializado em cache, mantendo tokens e hash"""
+        self._serialized = None
+        self._search_text = None
+
+    def serialized_content(self, cache: bool = True) -> str:
+        """JSON canônico do conteúdo, calculado uma vez por versão do conteúdo
+
+        Com ``cache=False`` o texto não fica retido no contexto (útil ao
+        persistir contextos cujo texto já foi liberado).
+        """
+        if self._serialized is not None:
+            return self._serialized
+        if self._content.__class__ is _LazyContent:
+            # O arquivo guarda exatamente o JSON canônico
+            serialized = self._content.raw().decode()
+        else:
+            serialized = json.dumps(self._content, sort_keys=True)
+        if cache:
+            self._serialized = serialized
+        return serialized
+
+    def searchable_text(self, escaped: bool = True) -> str:
+        """Texto normalizado (minúsculas) usado nas buscas
+
+        O padrão é o JSON canônico, com caracteres não ASCII escapados como
+        na busca por palavras-chave original. Com ``escaped=False`` esses
+        caracteres ficam literais (``ensure_ascii=False``), para que termos
+        acentuados sejam encontrados pelo BM25 e pela busca vetorial.
+        """
+        text = self._search_text
+        if text is None:
+            serialized = self.serialized_content()
+            lowered = serialized.lower()
+            text = self._search_text = serialized if lowered == serialized else lowered
+        if escaped or "\\u" not in text:
+            return text
+        return json.dumps(self.content, sort_keys=True, ensure_ascii=False).lower()
+
+    def term_counts(self, escaped: bool = True) -> Dict[str, int]:
+        """Contagem dos tokens do texto normalizado (ver ``searchable_text``)"""
+        cached = self._terms
+        if cached is not None and cached[0] == escaped:
+            return cached[1]
+        terms = dict(Counter(_TOKEN_RE.findall(self.searchable_text(escaped))))
+        self._terms = (escaped, terms)
+        return terms
+
+    def text_cache_size(self) -> int:
+        """Bytes ocupados pelo texto serializado em cache"""
+        size = 0
+        if self._serialized is not None:
+            size += sys.getsizeof(self._serialized)
+        if self._search_text is not None and self._search_text is not self._serialized:
+            size += sys.getsizeof(self._search_text)
+        return size
     
     def add_tag(self, tag: str):
         """Adiciona uma tag ao contexto"""
         if tag not in self.tags:
-            self.tags.append(tag)
-            self.updated_at = datetime.now().isoformat()
-    
-    def is_expired(self) -> bool:
+            self.tags.append(sys.intern(tag))
+            self.updated_ts = datetime.now().timestamp()
+
+    @property
+    def created_at(self) -> str:
+        """Data de criação em ISO 8601"""
+        return _to_iso(self.created_ts)
+
+    @created_at.setter
+    def created_at(self, value: Timestamp):
+        self.created_ts = _to_timestamp(value)
+
+    @property
+    def updated_at(self) -> str:
+        """Data da última atualização em ISO 8601"""
+        return _to_iso(self.updated_ts)
+
+    @updated_at.setter
+    def updated_at(self, value: Timestamp):
+        self.updated_ts = _to_timestamp(value)
+
+    @property
+    def expires_at(self) -> Optional[str]:
+        """Data de expiração em ISO 8601, se houver"""
+        return _to_iso(self.expires_ts)
+
+    @expires_at.setter
+    def expires_at(self, value: Optional[Timestamp]):
+        self.expires_ts = _to_timestamp(value)
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
         """Verifica se o contexto expirou"""
-        if not self.expires_at:
+        if self.expires_ts is None:
             return False
-        return datetime.now() > datetime.fromisoformat(self.expires_at)
+        return (time.time() if now is None else now) > self.expires_ts
     
     def get_hash(self) -> str:
         """Gera hash do conteúdo para detecção de mudanças"""
-        content_str = json.dumps(self.content, sort_keys=True)
-        return hashlib.md5(content_str.encode()).hexdigest()
+        if self._hash is None:
+            self._hash = content_digest(self.serialized_content().encode()).hex()
+        return self._hash
     
+    def to_record(self) -> Dict[str, Any]:
+        """Campos do contexto, exceto o conteúdo, em tipos JSON e datas em epoch
+
+        Aceito por ``from_dict`` depois de acrescentado ``content``; usado
+        para persistir contextos sem copiar o conteúdo.
+        """
+        return {
+            'id': self.id,
+            'context_type': self.context_type.value,
+            'priority': self.priority.value,
+            'created_ts': self.created_ts,
+            'updated_ts': self.updated_ts,
+            'expires_ts': self.expires_ts,
+            'tags': self._tags,
+            'metadata': self._metadata,
+            'parent_id': self.parent_id,
+            'children_ids': self._children_ids,
+        }
+
     def to_dict(self) -> Dict[str, Any]:
         """Converte contexto para dicionário"""
-        data = asdict(self)
+        data = {name: copy.deepcopy(getattr(self, name)) for name in self._FIELDS}
         data['context_type'] = self.context_type.value
         data['priority'] = self.priority.value
+        for name in ('created', 'updated', 'expires'):
+            data[f'{name}_at'] = _to_iso(data.pop(f'{name}_ts'))
         return data
-    
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'MCPContext':
-        """Cria contexto a partir de dicionário"""
+        """Cria contexto a partir de dicionário (datas em ISO ou epoch)"""
+        data = dict(data)
         data['context_type'] = ContextType(data['context_type'])
         data['priority'] = ContextPriority(data['priority'])
+        for name in ('created', 'updated', 'expires'):
+            if f'{name}_at' in data:
+                data[f'{name}_ts'] = _to_timestamp(data.pop(f'{name}_at'))
         return cls(**data)
 
-@dataclass
+class _ReadOnlyList(list):
+    """Lista que recusa alterações, para cópias que não refletem a origem"""
+
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Lista somente leitura; use MCPSession.add_context_id/remove_context_id")
+
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+    def __reduce__(self):
+        # Cópias e pickles viram listas comuns
+        return list, (list(self),)
+
+
+@dataclass(init=False)
 class MCPSession:
-    """Sessão MCP para agrupamento de contextos"""
+    """Sessão MCP para agrupamento de contextos
+
+    O construtor aceita a forma anterior (datas ISO em ``created_at`` e
+    ``updated_at`` e a lista ``context_ids``), posicional ou nomeada.
+    """
     id: str
     name: str
-    created_at: str
-    updated_at: str
-    context_ids: List[str]
-    metadata: Dict[str, Any] = None
-    
-    def __post_init__(self):
-        if self.metadata is None:
-            self.metadata = {}
-    
+    created_ts: float
+    updated_ts: float
+    members: Dict[str, None]  # context_ids em ordem de inserção
+    metadata: Dict[str, Any]
+
+    def __init__(self, id: str, name: str, created_ts: Optional[Timestamp] = None,
+                 updated_ts: Optional[Timestamp] = None,
+                 members: Optional[Union[Dict[str, None], Iterable[str]]] = None,
+                 metadata: Optional[Dict[str, Any]] = None, *,
+                 created_at: Optional[Timestamp] = None, updated_at: Optional[Timestamp] = None,
+                 context_ids: Optional[Iterable[str]] = None):
+        self.id = id
+        self.name = name
+        self.created_ts = _epoch(created_ts, created_at, "created")
+        self.updated_ts = _epoch(updated_ts, updated_at, "updated")
+        if self.created_ts is None or self.updated_ts is None:
+            raise TypeError("MCPSession requer created_at e updated_at")
+        if context_ids is not None:
+            if members is not None:
+                raise TypeError("Informe apenas members ou context_ids")
+            members = context_ids
+        self.members = members if isinstance(members, dict) else dict.fromkeys(members or ())
+        self.metadata = metadata if metadata is not None else {}
+
+    @property
+    def created_at(self) -> str:
+        """Data de criação em ISO 8601"""
+        return _to_iso(self.created_ts)
+
+    @created_at.setter
+    def created_at(self, value: Timestamp):
+        self.created_ts = _to_timestamp(value)
+
+    @property
+    def updated_at(self) -> str:
+        """Data da última atualização em ISO 8601"""
+        return _to_iso(self.updated_ts)
+
+    @updated_at.setter
+    def updated_at(self, value: Timestamp):
+        self.updated_ts = _to_timestamp(value)
+
+    @property
+    def context_ids(self) -> List[str]:
+        """IDs dos contextos da sessão, em ordem de inserção (somente leitura)
+
+        A lista é uma cópia de ``members``; alterá-la levanta ``TypeError``.
+        Use ``add_context_id``/``remove_context_id`` ou atribua uma nova lista.
+        """
+        return _ReadOnlyList(self.members)
+
+    @context_ids.setter
+    def context_ids(self, context_ids: List[str]):
+        self.members = dict.fromkeys(context_ids)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Converte sessão para dicionário (sem os membros)"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'metadata': dict(self.metadata),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MCPSession':
+        """Cria sessão a partir de dicionário (datas em ISO ou epoch)"""
+        return cls(
+            id=data['id'],
+            name=data['name'],
+            created_ts=_to_timestamp(data['created_at']),
+            updated_ts=_to_timestamp(data['updated_at']),
+            metadata=data.get('metadata')
+        )
+
+    def add_context_id(self, context_id: str):
+        """Adiciona um contexto à sessão"""
+        self.members[context_id] = None
+        self.updated_ts = datetime.now().timestamp()
+
+    def remove_context_id(self, context_id: str) -> bool:
+        """Remove um contexto da sessão em O(1)"""
+        if context_id not in self.members:
+            return False
+        del self.members[context_id]
+        self.updated_ts = datetime.now().timestamp()
+        return True
+
     @classmethod
     def create(cls, name: str) -> 'MCPSession':
         """Cria uma nova sessão MCP"""
-        now = datetime.now().isoformat()
+        now = datetime.now().timestamp()
         return cls(
             id=str(uuid.uuid4()),
             name=name,
-            created_at=now,
-            updated_at=now,
-            context_ids=[]
+            created_ts=now,
+            updated_ts=now
         )
 
+class InvertedIndex:
+    """Índice invertido token -> postings mantido incrementalmente.
+
+    Cada posting guarda quantas vezes o token aparece no contexto. Um índice
+    de trigramas sobre o vocabulário permite localizar os tokens que contêm
+    uma palavra da query, preservando a semântica de busca por substring.
+    Tamanhos de documento e frequências de documento (tamanho dos postings)
+    ficam sempre atualizados para a pontuação BM25. O maior tf de cada token
+    e o menor tamanho de documento só são relaxados em remoções, servindo
+    como limites superiores válidos para a poda MaxScore. Em um índice
+    carregado de uma gravação (ver ``mcp_store``), ``postings`` e
+    ``doc_terms`` são lidos entrada a entrada e o índice de trigramas só é
+    montado no primeiro ``expand``.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}  # token -> {context_id: tf}
+        self.doc_terms: Dict[str, Dict[str, int]] = {}  # context_id -> {token: tf}
+        self.doc_lengths: Dict[str, int] = {}  # context_id -> total de tokens
+        self.total_length = 0
+        self.max_tf: Dict[str, int] = {}  # token -> limite superior do tf
+        self.min_length = 0
+        # trigrama -> tokens do vocabulário; None enquanto não montado
+        self._trigrams: Optional[Dict[str, set]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_terms
+
+    def add(self, doc_id: str, terms: Dict[str, int]):
+        """Indexa um documento a partir da contagem de seus tokens"""
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        self.doc_terms[doc_id] = terms
+        length = sum(terms.values())
+        self.min_length = length if len(self.doc_terms) == 1 else min(self.min_length, length)
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        for term, tf in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                self.max_tf[term] = tf
+                if self._trigrams is not None:
+                    for gram in self._grams(term):
+                        self._trigrams.setdefault(gram, set()).add(term)
+            elif tf > self.max_tf[term]:
+                self.max_tf[term] = tf
+            postings[doc_id] = tf
+
+    def remove(self, doc_id: str) -> bool:
+        """Remove um documento do índice"""
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return False
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+                del self.max_tf[term]
+                if self._trigrams is not None:
+                    for gram in self._grams(term):
+                        vocab = self._trigrams[gram]
+                        vocab.discard(term)
+                        if not vocab:
+                            del self._trigrams[gram]
+        return True
+
+    def expand(self, word: str) -> List[Tuple[str, int]]:
+        """Retorna (token, ocorrências de word no token) para os tokens que contêm word"""
+        if len(word) < 3:
+            vocab = self.postings.keys()
+        else:
+            trigrams = self._trigrams
+            if trigrams is None:
+                trigrams = {}
+                for term in self.postings:
+                    for gram in self._grams(term):
+                        trigrams.setdefault(gram, set()).add(term)
+                self._trigrams = trigrams
+            grams = self._grams(word)
+            vocab = min((trigrams.get(g, ()) for g in grams), key=len)
+        return [(term, term.count(word)) for term in vocab if word in term]
+
+    @property
+    def average_length(self) -> float:
+        """Tamanho médio dos documentos indexados"""
+        return self.total_length / len(self.doc_terms) if self.doc_terms else 0.0
+
+    def document_frequency(self, term: str) -> int:
+        """Número de documentos que contêm o token"""
+        return len(self.postings.get(term, ()))
+
+    def idf(self, term: str) -> float:
+        """IDF do BM25 (variante sempre positiva)"""
+        df = self.document_frequency(term)
+        return math.log(1 + (len(self.doc_terms) - df + 0.5) / (df + 0.5))
+
+    def bm25_scores(self, terms: List[str], k1: float = BM25_K1, b: float = BM25_B) -> Dict[str, float]:
+        """Pontua por BM25 apenas os documentos presentes nos postings dos termos"""
+        scores: Dict[str, float] = {}
+        if not self.doc_terms:
+            return scores
+        average_length = self.average_length or 1.0
+        for term, query_tf in Counter(terms).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            weight = self.idf(term) * query_tf
+            for doc_id, tf in postings.items():
+                norm = k1 * (1 - b + b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def bm25_top_k(self, terms: List[str], k: int, accept: Optional[Callable[[str], bool]] = None,
+                   order: Optional[Dict[str, int]] = None,
+                   k1: float = BM25_K1, b: float = BM25_B,
+                   corpus: Optional['InvertedIndex'] = None) -> List[Tuple[float, str]]:
+        """Seleciona os k melhores documentos por BM25 com poda MaxScore
+
+        Os termos são ordenados pelo limite superior de contribuição. Listas
+        cuja soma de limites não alcança o k-ésimo melhor escore (termos não
+        essenciais) deixam de gerar candidatos, e a pontuação de um candidato
+        é abandonada assim que o escore parcial mais os limites restantes
+        ficam abaixo desse patamar. Empates são resolvidos por ``order``.
+        Com ``corpus``, IDF e tamanho médio vêm desse índice maior (por
+        exemplo, o global), deixando os escores comparáveis entre subíndices.
+        """
+        if k <= 0 or not self.doc_terms:
+            return []
+        corpus = corpus or self
+        average_length = corpus.average_length or 1.0
+        min_norm = k1 * (1 - b + b * self.min_length / average_length)
+        weighted = []
+        for term, query_tf in Counter(terms).items():
+            if term not in self.postings:
+                continue
+            weight = corpus.idf(term) * query_tf * (k1 + 1)
+            max_tf = self.max_tf[term]
+            weighted.append((weight * max_tf / (max_tf + min_norm), weight, term))
+        if not weighted:
+            return []
+
+        # Do maior para o menor limite; suffix[i] = soma dos limites de i em diante
+        weighted.sort(reverse=True)
+        lists = [(self.postings[term], weight) for _, weight, term in weighted]
+        suffix = [0.0] * (len(weighted) + 1)
+        for i in range(len(weighted) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + weighted[i][0]
+        order = order or {}
+        heap: List[Tuple[float, int, str]] = []  # (escore, -ordem, doc): pior no topo
+        threshold = -1.0
+        seen = set()
+
+        for position, (postings, _) in enumerate(lists):
+            # Documentos ainda não vistos só aparecem deste termo em diante
+            if suffix[position] < threshold:
+                break
+            for doc_id in postings:
+                if doc_id in seen:
+                    continue
+                if suffix[position] < threshold:
+                    break
+                seen.add(doc_id)
+                if accept is not None and not accept(doc_id):
+                    continue
+                norm = k1 * (1 - b + b * self.doc_lengths[doc_id] / average_length)
+                score = 0.0
+                for index, (other, weight) in enumerate(lists):
+                    if score + suffix[index] < threshold:
+                        break
+                    tf = other.get(doc_id)
+                    if tf:
+                        score += weight * tf / (tf + norm)
+                else:
+                    entry = (score, -order.get(doc_id, 0), doc_id)
+                    if len(heap) < k:
+                        heapq.heappush(heap, entry)
+                    elif entry > heap[0]:
+                        heapq.heapreplace(heap, entry)
+                    if len(heap) == k:
+                        threshold = heap[0][0]
+
+        heap.sort(reverse=True)
+        return [(score, doc_id) for score, _, doc_id in heap]
+
+    @staticmethod
+    def _grams(term: str) -> set:
+        return {term[i:i + 3] for i in range(len(term) - 2)}
+
+class _UnionView:
+    """União somente leitura de conjuntos disjuntos (ex.: faixas de prioridade)"""
+
+    def __init__(self, parts: List[Dict[str, None]]):
+        self.parts = parts
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self.parts)
+
+    def __contains__(self, item: str) -> bool:
+        return any(item in part for part in self.parts)
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+_NO_LOCK = nullcontext()
+
+
+def _reads(method):
+    """Executa o método com a trava de leitura quando o protocolo é thread-safe"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        lock = self._lock
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+    return wrapper
+
+
+def _writes(method):
+    """Executa o método com a trava de escrita quando o protocolo é thread-safe"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        lock = self._lock
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_write()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_write()
+    return wrapper
+
+
 class MCPProtocol:
     """Protocolo de gerenciamento de contexto MCP"""
-    
-    def __init__(self, max_contexts: int = 1000):
+
+    def __init__(self, max_contexts: int = 1000,
+                 scoring: Union[ScoringMethod, str] = ScoringMethod.KEYWORD,
+                 embedder: Optional[HashedEmbedder] = None,
+                 vector_index: Optional[Union[VectorIndex, IVFIndex]] = None,
+                 text_cache_limit: int = 64 * 1024 * 1024,
+                 query_cache_size: int = 256,
+                 eviction: Union[EvictionMethod, str, EvictionPolicy] = EvictionMethod.PRIORITY,
+                 dedup_min_length: int = 256, thread_safe: bool = False,
+                 token_estimator: Optional[TokenEstimator] = None):
         self.contexts: Dict[str, MCPContext] = {}
         self.sessions: Dict[str, MCPSession] = {}
         self.max_contexts = max_contexts
-        self.context_index: Dict[str, List[str]] = {}  # tag -> context_ids
-        
+        # Política de despejo aplicada ao atingir max_contexts
+        self.eviction = create_eviction_policy(eviction)
+        self.term_index = InvertedIndex()
+
+        # Índices secundários: chave -> conjunto ordenado (dict) de context_ids
+        self.context_index: Dict[str, Dict[str, None]] = {}  # tag -> context_ids
+        self._type_index: Dict[ContextType, Dict[str, None]] = {t: {} for t in ContextType}
+        self._priority_index: Dict[int, Dict[str, None]] = {p.value: {} for p in ContextPriority}
+        self._context_sessions: Dict[str, Dict[str, None]] = {}  # context_id -> session_ids
+        self._session_term_index: Dict[str, InvertedIndex] = {}  # session_id -> postings da sessão
+        self._parent_index: Dict[str, Dict[str, None]] = {}  # parent_id -> context_ids
+
+        # Agenda de expiração: heap de (expires_ts, sequência, context_id).
+        # Entradas de contextos removidos ou com expiração alterada ficam obsoletas
+        # e são descartadas quando chegam ao topo.
+        self._expiry_heap: List[Tuple[float, int, str]] = []
+        self._sequence: Dict[str, int] = {}  # context_id -> ordem de inserção
+        self._next_sequence = 0
+        self.scoring = ScoringMethod(scoring)
+        # Estimativa local de tokens (contagem em cache em cada contexto)
+        self.token_estimator = token_estimator or default_estimator
+
+        # Strings de conteúdo a partir de dedup_min_length caracteres são
+        # guardadas uma vez e compartilhadas entre contextos
+        self.payloads = PayloadStore(dedup_min_length)
+        self._payload_refs: Dict[str, List[bytes]] = {}  # context_id -> digests referenciados
+
+        # Textos serializados mantidos em cache nos contextos (LRU limitado em bytes)
+        self.text_cache_limit = text_cache_limit
+        self._text_cache: "OrderedDict[str, int]" = OrderedDict()  # context_id -> bytes
+        self._text_cache_bytes = 0
+
+        # Cache LRU de resultados de busca, invalidado pelo contador de geração
+        # (incrementado a cada mutação do acervo)
+        self.generation = 0
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[Tuple[str, int], Tuple[int, List[MCPContext]]]" = OrderedDict()
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+
+        # Observadores de mutações (ex.: log de recuperação), chamados como
+        # listener(evento, objeto, session_id) com evento em
+        # "add", "update", "remove" ou "session"
+        self._listeners: List[Callable[[str, Any, Optional[str]], None]] = []
+
+        # Com thread_safe, leituras compartilham e mutações tomam com
+        # exclusividade a trava leitor-escritor. Efeitos colaterais das
+        # leituras (acessos da política de despejo, caches) ficam sob uma
+        # trava curta; expirados encontrados em leituras são deixados para a
+        # limpeza feita pelas escritas. Acertos no cache de buscas não tomam
+        # a trava leitor-escritor.
+        self._lock: Optional[ReadWriteLock] = ReadWriteLock() if thread_safe else None
+        self._side_lock = threading.Lock() if thread_safe else _NO_LOCK
+
+        # Busca vetorial local (requer NumPy), ativada apenas quando escolhida.
+        # Um IVFIndex pode ser passado em vector_index para busca aproximada.
+        self.embedder: Optional[HashedEmbedder] = None
+        self.vector_index: Optional[Union[VectorIndex, IVFIndex]] = None
+        if self.scoring == ScoringMethod.VECTOR:
+            self.embedder = embedder or HashedEmbedder()
+            self.vector_index = vector_index if vector_index is not None else VectorIndex(self.embedder.dim)
+
+    @_writes
     def add_context(self, context: MCPContext, session_id: Optional[str] = None) -> str:
         """Adiciona um contexto ao protocolo MCP"""
         # Remove contextos expirados se necessário
         self._cleanup_expired_contexts()
         
-        # Remove contextos antigos se exceder o limite
-        if len(self.contexts) >= self.max_contexts:
-            self._remove_oldest_contexts()
-        
+        # Despeja contextos, um por vez, se exceder o limite
+        if context.id not in self.contexts:
+            self._evict_contexts(len(self.contexts) - self.max_contexts + 1)
+
+        self.generation += 1
+        session = self.sessions.get(session_id) if session_id else None
+        self._insert_context(context, session)
+        return context.id
+
+    def add_contexts(self, contexts: Iterable[MCPContext], session_id: Optional[str] = None,
+                     batch_size: int = 1000) -> List[str]:
+        """Adiciona vários contextos de uma vez
+
+        Aceita qualquer iterável (inclusive geradores), consumido em lotes:
+        a limpeza de expirados roda uma vez e o despejo é decidido uma vez
+        por lote, em vez de a cada contexto.
+        """
+        with self._writing():
+            self._cleanup_expired_contexts()
+        batch_size = max(1, min(batch_size, self.max_contexts))
+        iterator = iter(contexts)
+        added: List[str] = []
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            # A trava de escrita é tomada por lote, para não bloquear
+            # leituras durante a carga inteira
+            with self._writing():
+                session = self.sessions.get(session_id) if session_id else None
+                new = len({context.id for context in batch if context.id not in self.contexts})
+                self._evict_contexts(len(self.contexts) + new - self.max_contexts)
+                for context in batch:
+                    self._insert_context(context, session)
+                    added.append(context.id)
+                self.generation += 1
+        return added
+
+    def _insert_context(self, context: MCPContext, session: Optional[MCPSession] = None):
+        """Registra um contexto no acervo e em todos os índices"""
+        if context.id not in self._sequence:
+            self._sequence[context.id] = self._next_sequence
+            self._next_sequence += 1
+        previous = self.contexts.get(context.id)
+        if previous is not None and previous is not context:
+            # Substituição: mantém ordem e sessões, descarta índices da versão anterior
+            self._unindex_attributes(previous, keep=context)
         self.contexts[context.id] = context
-        
+        self._intern_payloads(context)
+        self._index_content(context)
+        self._schedule_expiry(context)
+        self.eviction.add(context.id, context.priority.value)
+        self._type_index[context.context_type][context.id] = None
+        self._priority_index[context.priority.value][context.id] = None
+        self._link_family(context)
+
         # Adiciona à sessão se especificada
-        if session_id and session_id in self.sessions:
-            self.sessions[session_id].context_ids.append(context.id)
-            self.sessions[session_id].updated_at = datetime.now().isoformat()
-        
+        if session is not None:
+            self._attach_session(context, session)
+
         # Atualiza índice de tags
-        for tag in context.tags:
-            if tag not in self.context_index:
-                self.context_index[tag] = []
-            self.context_index[tag].append(context.id)
-        
-        return context.id
-    
+        for tag in context.iter_tags():
+            self.context_index.setdefault(tag, {})[context.id] = None
+
+        if self._listeners:
+            self._notify("add", context, session.id if session is not None else None)
+
+    def _link_family(self, context: MCPContext):
+        """Registra o contexto como filho do pai e reconstrói seus ``children_ids``
+
+        ``children_ids`` é mantido pelo protocolo a partir do ``parent_id``
+        dos filhos presentes no acervo, inclusive filhos adicionados antes do pai.
+        """
+        if context.parent_id:
+            self._parent_index.setdefault(context.parent_id, {})[context.id] = None
+            parent = self.contexts.get(context.parent_id)
+            if parent is not None and parent is not context and context.id not in (parent._children_ids or ()):
+                parent.children_ids.append(context.id)
+        context.children_ids = list(self._parent_index.get(context.id, ()))
+
+    def _attach_session(self, context: MCPContext, session: MCPSession):
+        session.add_context_id(context.id)
+        self._context_sessions.setdefault(context.id, {})[session.id] = None
+        # Os tokens vêm do índice global, que já tem o contexto (mesmo após load)
+        self._session_term_index.setdefault(session.id, InvertedIndex()).add(
+            context.id, self.term_index.doc_terms[context.id])
+
+    @_writes
+    def add_context_to_session(self, context_id: str, session_id: str) -> bool:
+        """Inclui um contexto já existente em uma sessão"""
+        context = self.contexts.get(context_id)
+        session = self.sessions.get(session_id)
+        if context is None or session is None:
+            return False
+        if session_id not in self._context_sessions.get(context_id, ()):
+            self._attach_session(context, session)
+            self.generation += 1
+            if self._listeners:
+                self._notify("add", context, session_id)
+        return True
+
+    @_reads
+    def get_context_session_ids(self, context_id: str) -> List[str]:
+        """IDs das sessões que contêm o contexto"""
+        return list(self._context_sessions.get(context_id, ()))
+
+    @_reads
+    def count_tokens(self, context_ids: Iterable[str]) -> Dict[str, int]:
+        """Tokens estimados do conteúdo de cada contexto existente, calculados em lote"""
+        contexts = [self.contexts[cid] for cid in context_ids if cid in self.contexts]
+        counts = self.token_estimator.context_tokens_many(contexts)
+        return {context.id: count for context, count in zip(contexts, counts)}
+
+    @_reads
+    def get_subtree(self, context_id: str, max_depth: Optional[int] = None) -> List[MCPContext]:
+        """Contexto e seus descendentes em pré-ordem (cada pai antes dos filhos)
+
+        Percorre o índice de filhos, com custo proporcional à subárvore.
+        ``max_depth`` limita os níveis abaixo do contexto (0 retorna só ele).
+        Descendentes expirados são omitidos junto com seus próprios filhos.
+        """
+        return self._live_contexts(self._subtree_ids(context_id, max_depth, time.time()))
+
+    @_reads
+    def get_ancestors(self, context_id: str, max_depth: Optional[int] = None) -> List[MCPContext]:
+        """Cadeia de ancestrais, do pai à raiz
+
+        Para no primeiro ancestral ausente ou expirado, ou após ``max_depth`` níveis.
+        """
+        return self._ancestors(context_id, max_depth, time.time())
+
+    def _subtree_ids(self, context_id: str, max_depth: Optional[int] = None,
+                     now: Optional[float] = None) -> List[str]:
+        """IDs da subárvore em pré-ordem, ignorando ciclos de ``parent_id``
+
+        Com ``now``, descendentes expirados (e o que está abaixo deles) ficam de fora.
+        """
+        if context_id not in self.contexts:
+            return []
+        ids: List[str] = []
+        seen = {context_id}
+        stack = [(context_id, 0)]
+        while stack:
+            current, depth = stack.pop()
+            ids.append(current)
+            if max_depth is not None and depth >= max_depth:
+                continue
+            children = [child for child in self._parent_index.get(current, ())
+                        if child not in seen and (now is None or not self.contexts[child].is_expired(now))]
+            seen.update(children)
+            stack.extend((child, depth + 1) for child in reversed(children))
+        return ids
+
+    def _ancestors(self, context_id: str, max_depth: Optional[int], now: float) -> List[MCPContext]:
+        ancestors: List[MCPContext] = []
+        context = self.contexts.get(context_id)
+        seen = {context_id}
+        while context is not None and context.parent_id and context.parent_id not in seen:
+            if max_depth is not None and len(ancestors) >= max_depth:
+                break
+            context = self.contexts.get(context.parent_id)
+            if context is None or context.is_expired(now):
+                break
+            seen.add(context.id)
+            ancestors.append(context)
+        return ancestors
+
+    @_writes
+    def add_listener(self, listener: Callable[[str, Any, Optional[str]], None]):
+        """Registra um observador das mutações do acervo"""
+        self._listeners.append(listener)
+
+    @_writes
+    def remove_listener(self, listener: Callable[[str, Any, Optional[str]], None]):
+        """Remove um observador registrado"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, event: str, subject: Any, session_id: Optional[str] = None):
+        for listener in self._listeners:
+            listener(event, subject, session_id)
+
+    @_reads
     def get_context(self, context_id: str) -> Optional[MCPContext]:
         """Recupera um contexto pelo ID"""
         context = self.contexts.get(context_id)
         if context and context.is_expired():
-            self.remove_context(context_id)
+            if self._can_mutate():
+                self.remove_context(context_id)
             return None
+        if context:
+            with self._side_lock:
+                self.eviction.touch(context_id)
         return context
     
+    @_writes
     def update_context(self, context_id: str, new_content: Dict[str, Any]) -> bool:
         """Atualiza o conteúdo de um contexto"""
         context = self.get_context(context_id)
         if context:
             context.update_content(new_content)
+            self.generation += 1
+            self._intern_payloads(context)
+            self._index_content(context)
+            if self._listeners:
+                self._notify("update", context)
             return True
         return False
     
-    def remove_context(self, context_id: str) -> bool:
-        """Remove um contexto"""
+    @_writes
+    def remove_context(self, context_id: str, cascade: bool = False) -> bool:
+        """Remove um contexto
+
+        Com ``cascade`` remove também toda a subárvore de descendentes; sem
+        ele os filhos continuam no acervo com ``parent_id`` apontando para o
+        contexto removido.
+        """
         if context_id in self.contexts:
-            context = self.contexts[context_id]
-            
-            # Remove das tags
-            for tag in context.tags:
-                if tag in self.context_index:
-                    self.context_index[tag] = [cid for cid in self.context_index[tag] if cid != context_id]
-                    if not self.context_index[tag]:
-                        del self.context_index[tag]
-            
-            # Remove das sessões
-            for session in self.sessions.values():
-                if context_id in session.context_ids:
-                    session.context_ids.remove(context_id)
-                    session.updated_at = datetime.now().isoformat()
-            
-            del self.contexts[context_id]
+            if cascade:
+                for descendant_id in self._subtree_ids(context_id)[1:]:
+                    self._delete_context(descendant_id)
+            self._delete_context(context_id)
+            self.generation += 1
             return True
         return False
+
+    @_writes
+    def remove_contexts(self, context_ids: Iterable[str], cascade: bool = False) -> int:
+        """Remove vários contextos de uma vez e retorna quantos foram removidos"""
+        removed = 0
+        for context_id in context_ids:
+            if context_id in self.contexts:
+                targets = self._subtree_ids(context_id) if cascade else [context_id]
+                for target_id in targets:
+                    if target_id in self.contexts:
+                        self._delete_context(target_id)
+                        removed += 1
+        if removed:
+            self.generation += 1
+        return removed
+
+    def _unindex_attributes(self, context: MCPContext, keep: Optional[MCPContext] = None):
+        """Retira o contexto dos índices de tags, pai, tipo e prioridade
+
+        Com ``keep`` (a nova versão do contexto), entradas que continuam
+        válidas são mantidas, preservando sua ordem nos índices.
+        """
+        kept_tags = keep.iter_tags() if keep is not None else ()
+        for tag in context.iter_tags():
+            if tag not in kept_tags:
+                self._discard_from_index(self.context_index, tag, context.id)
+        if context.parent_id and (keep is None or keep.parent_id != context.parent_id):
+            self._discard_from_index(self._parent_index, context.parent_id, context.id)
+            parent = self.contexts.get(context.parent_id)
+            if parent is not None and parent._children_ids and context.id in parent._children_ids:
+                parent._children_ids.remove(context.id)
+                if not parent._children_ids:
+                    parent._children_ids = None
+        for value, bucket in self._priority_index.items():
+            if keep is None or keep.priority.value != value:
+                bucket.pop(context.id, None)
+        for context_type, bucket in self._type_index.items():
+            if keep is None or keep.context_type != context_type:
+                bucket.pop(context.id, None)
+
+    def _delete_context(self, context_id: str):
+        """Retira um contexto do acervo e de todos os índices"""
+        context = self.contexts[context_id]
+        self._unindex_attributes(context)
+
+        # Remove das sessões que contêm o contexto
+        for session_id in self._context_sessions.pop(context_id, ()):
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.remove_context_id(context_id)
+            session_index = self._session_term_index.get(session_id)
+            if session_index is not None:
+                session_index.remove(context_id)
+
+        self.term_index.remove(context_id)
+        self._untrack_text(context_id)
+        if self.vector_index is not None:
+            self.vector_index.remove(context_id)
+        self.eviction.remove(context_id)
+        self.payloads.release(self._payload_refs.pop(context_id, ()))
+        del self._sequence[context_id]
+        del self.contexts[context_id]
+        if self._listeners:
+            self._notify("remove", context_id)
     
+    @_reads
     def find_contexts_by_tag(self, tag: str) -> List[MCPContext]:
         """Encontra contextos por tag"""
-        context_ids = self.context_index.get(tag, [])
-        return [self.get_context(cid) for cid in context_ids if self.get_context(cid)]
-    
+        return self._live_contexts(self.context_index.get(tag, {}))
+
+    @_reads
     def find_contexts_by_type(self, context_type: ContextType) -> List[MCPContext]:
         """Encontra contextos por tipo"""
-        return [ctx for ctx in self.contexts.values() if ctx.context_type == context_type and not ctx.is_expired()]
-    
+        return self._live_contexts(self._type_index[context_type])
+
+    @_reads
     def find_contexts_by_priority(self, min_priority: ContextPriority) -> List[MCPContext]:
         """Encontra contextos por prioridade mínima"""
-        return [ctx for ctx in self.contexts.values() 
-                if ctx.priority.value >= min_priority.value and not ctx.is_expired()]
-    
+        return self.query_contexts(min_priority=min_priority)
+
+    @_reads
+    def query_contexts(self, context_type: Optional[ContextType] = None,
+                       min_priority: Optional[ContextPriority] = None,
+                       tags: Optional[List[str]] = None,
+                       session_id: Optional[str] = None,
+                       parent_id: Optional[str] = None) -> List[MCPContext]:
+        """Encontra contextos que atendem a todos os filtros informados
+
+        Cada filtro corresponde a um índice secundário; a interseção começa
+        pelo menor conjunto e testa pertinência nos demais, então o custo é
+        proporcional ao menor índice envolvido e não ao acervo. Exemplo:
+        ``query_contexts(ContextType.TASK, ContextPriority.HIGH, tags=["analysis"])``.
+        """
+        candidate_sets: List[Any] = []
+        if context_type is not None:
+            candidate_sets.append(self._type_index[context_type])
+        if min_priority is not None:
+            buckets = [ids for value, ids in self._priority_index.items() if value >= min_priority.value]
+            candidate_sets.append(buckets[0] if len(buckets) == 1 else _UnionView(buckets))
+        for tag in tags or []:
+            candidate_sets.append(self.context_index.get(tag, {}))
+        if session_id is not None:
+            session = self.sessions.get(session_id)
+            candidate_sets.append(session.members if session else {})
+        if parent_id is not None:
+            candidate_sets.append(self._parent_index.get(parent_id, {}))
+
+        if not candidate_sets:
+            return self._live_contexts(self.contexts)
+
+        candidate_sets.sort(key=len)
+        smallest, others = candidate_sets[0], candidate_sets[1:]
+        matches = [cid for cid in smallest if all(cid in other for other in others)]
+        matches.sort(key=self._sequence.__getitem__)
+        return self._live_contexts(matches)
+
+    def _live_contexts(self, context_ids) -> List[MCPContext]:
+        """Resolve ids em contextos, removendo os expirados encontrados"""
+        live, expired = [], []
+        now = time.time()
+        for context_id in context_ids:
+            context = self.contexts[context_id]
+            if context.is_expired(now):
+                expired.append(context_id)
+            else:
+                live.append(context)
+        if self._can_mutate():
+            for context_id in expired:
+                self.remove_context(context_id)
+        return live
+
+    @property
+    def _escaped_text(self) -> bool:
+        """Indica se os índices usam o texto com escapes (busca por palavras-chave)"""
+        return self.scoring == ScoringMethod.KEYWORD
+
+    @property
+    def thread_safe(self) -> bool:
+        """Indica se o protocolo aceita chamadas simultâneas de várias threads"""
+        return self._lock is not None
+
+    def _can_mutate(self) -> bool:
+        """Leituras só removem expirados sem trava ou sob a trava de escrita"""
+        return self._lock is None or self._lock.owns_write()
+
+    def _reading(self):
+        return self._lock.read() if self._lock is not None else _NO_LOCK
+
+    def _writing(self):
+        return self._lock.write() if self._lock is not None else _NO_LOCK
+
+    @staticmethod
+    def _discard_from_index(index: Dict[str, Dict[str, None]], key: str, context_id: str):
+        """Remove um id de um índice secundário, descartando chaves vazias"""
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(context_id, None)
+            if not bucket:
+                del index[key]
+
+    @_writes
     def create_session(self, name: str) -> str:
         """Cria uma nova sessão"""
         session = MCPSession.create(name)
         self.sessions[session.id] = session
+        if self._listeners:
+            self._notify("session", session)
         return session.id
     
+    @_reads
     def get_session_contexts(self, session_id: str) -> List[MCPContext]:
         """Recupera todos os contextos de uma sessão"""
         session = self.sessions.get(session_id)
         if not session:
             return []
         
-        return [self.get_context(cid) for cid in session.context_ids if self.get_context(cid)]
+        contexts = (self.get_context(cid) for cid in session.context_ids)
+        return [context for context in contexts if context]
     
-    def get_relevant_contexts(self, query: str, max_results: int = 10) -> List[MCPContext]:
-        """Encontra contextos relevantes para uma query (busca simples por palavras-chave)"""
+    def get_relevant_contexts(self, query: str, max_results: int = 10,
+                              session_id: Optional[str] = None,
+                              shared_session_ids: Optional[List[str]] = None,
+                              parent_depth: int = 0) -> List[MCPContext]:
+        """Encontra contextos relevantes para uma query
+
+        Usa o método de pontuação configurado na instância (``scoring``).
+        Com ``session_id`` (e opcionalmente sessões compartilhadas de
+        conhecimento em ``shared_session_ids``) a busca fica restrita a essas
+        sessões e usa os postings de cada uma, com custo proporcional ao
+        tamanho delas e não ao acervo inteiro. Resultados ficam em cache por
+        query normalizada, ``max_results`` e escopo até a próxima mutação.
+
+        Com ``parent_depth`` cada resultado vem precedido de até esse número
+        de ancestrais (da raiz para o resultado), sem repetições, para montar
+        conversas encadeadas; os ancestrais não contam em ``max_results``.
+        """
+        if max_results <= 0:
+            return []
+        results = self._cached_relevant_contexts(query, max_results, session_id, shared_session_ids)
+        if parent_depth > 0:
+            with self._reading():
+                results = self._with_ancestors(results, parent_depth)
+        return results
+
+    def _with_ancestors(self, results: List[MCPContext], depth: int) -> List[MCPContext]:
+        now = time.time()
+        threaded: Dict[str, MCPContext] = {}
+        for context in results:
+            for ancestor in reversed(self._ancestors(context.id, depth, now)):
+                threaded.setdefault(ancestor.id, ancestor)
+            threaded.setdefault(context.id, context)
+        return list(threaded.values())
+
+    def _cached_relevant_contexts(self, query: str, max_results: int, session_id: Optional[str],
+                                  shared_session_ids: Optional[List[str]]) -> List[MCPContext]:
+
+        scope = self._query_scope(session_id, shared_session_ids)
+        key = (" ".join(query.lower().split()), max_results, scope)
+        cached = self._query_cache.get(key)
+        now = time.time()
+        if cached is not None and cached[0] == self.generation \
+                and not any(ctx.is_expired(now) for ctx in cached[1]):
+            with self._side_lock:
+                if key in self._query_cache:
+                    self._query_cache.move_to_end(key)
+                self.query_cache_hits += 1
+            return list(cached[1])
+
+        with self._reading():
+            generation = self.generation
+            results = self._rank_contexts(query, max_results, scope)
+            with self._side_lock:
+                self.query_cache_misses += 1
+                if self.query_cache_size > 0:
+                    self._query_cache[key] = (generation, results)
+                    self._query_cache.move_to_end(key)
+                    while len(self._query_cache) > self.query_cache_size:
+                        self._query_cache.popitem(last=False)
+        return list(results)
+
+    @_reads
+    def score_relevant_contexts(self, query: str, max_results: int = 10,
+                                session_id: Optional[str] = None,
+                                shared_session_ids: Optional[List[str]] = None) -> List[Tuple[float, MCPContext]]:
+        """Como ``get_relevant_contexts``, mas retorna pares (pontuação, contexto) e não usa cache
+
+        Permite combinar resultados de vários protocolos (ver ``mcp_sharded``).
+        """
+        if max_results <= 0:
+            return []
+        return self._rank_scored(query, max_results, self._query_scope(session_id, shared_session_ids))
+
+    @staticmethod
+    def _query_scope(session_id: Optional[str],
+                     shared_session_ids: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+        if session_id is None and not shared_session_ids:
+            return None
+        return tuple(dict.fromkeys(([session_id] if session_id is not None else [])
+                                   + list(shared_session_ids or [])))
+
+    def _rank_contexts(self, query: str, max_results: int,
+                       scope: Optional[Tuple[str, ...]] = None) -> List[MCPContext]:
+        """Pontua e seleciona os contextos com o método configurado"""
+        return [ctx for _, ctx in self._rank_scored(query, max_results, scope)]
+
+    def _rank_scored(self, query: str, max_results: int,
+                     scope: Optional[Tuple[str, ...]] = None) -> List[Tuple[float, MCPContext]]:
+        if self.scoring == ScoringMethod.BM25:
+            scored_contexts = self._score_bm25(query, max_results, scope)
+        elif self.scoring == ScoringMethod.VECTOR:
+            scored_contexts = self._score_vector(query, max_results, scope)
+        else:
+            scored_contexts = self._score_keyword(query, max_results, scope)
+
+        # Seleciona os melhores com heap limitado (desempate pela ordem de inserção)
+        best = heapq.nsmallest(max_results, scored_contexts, key=lambda x: (-x[0], x[1]))
+        return [(score, ctx) for score, _, ctx in best]
+
+    def _scope_indexes(self, scope: Optional[Tuple[str, ...]]) -> List[InvertedIndex]:
+        """Índices invertidos a consultar: o global ou os das sessões do escopo"""
+        if scope is None:
+            return [self.term_index]
+        return [self._session_term_index[sid] for sid in scope if sid in self._session_term_index]
+
+    def _scope_members(self, scope: Tuple[str, ...]) -> Dict[str, None]:
+        """União ordenada dos contextos das sessões do escopo"""
+        if len(scope) == 1:
+            session = self.sessions.get(scope[0])
+            return session.members if session else {}
+        members: Dict[str, None] = {}
+        for session_id in scope:
+            session = self.sessions.get(session_id)
+            if session:
+                members.update(session.members)
+        return members
+
+    def _score_keyword(self, query: str, max_results: int,
+                       scope: Optional[Tuple[str, ...]] = None) -> List[Tuple[float, int, MCPContext]]:
+        """Busca simples por palavras-chave
+
+        A pontuação é a soma das ocorrências de cada palavra da query no
+        conteúdo, mais 2 por tag que contém alguma palavra (tags repetidas
+        contam uma vez cada), mais a prioridade.
+        Apenas os contextos presentes nos postings das palavras da query são
+        pontuados; os demais entram somente pela prioridade, na ordem de inserção.
+        """
         query_words = query.lower().split()
+        scores: Dict[str, int] = {}
+        indexes = self._scope_indexes(scope)
+
+        # Pontuação por palavras-chave no conteúdo
+        for word in query_words:
+            if len(indexes) == 1:
+                matches = self._keyword_matches(word, indexes[0])
+            else:
+                # Um contexto em várias sessões do escopo conta uma vez
+                matches = {}
+                for index in indexes:
+                    matches.update(self._keyword_matches(word, index))
+                matches = matches.items()
+            for context_id, count in matches:
+                scores[context_id] = scores.get(context_id, 0) + count
+
+        # Pontuação por tags
+        if scope is None:
+            for tag, context_ids in self.context_index.items():
+                tag_lower = tag.lower()
+                if any(word in tag_lower for word in query_words):
+                    for context_id in context_ids:
+                        # O índice guarda o contexto uma vez por tag distinta
+                        bonus = 2 * self.contexts[context_id].iter_tags().count(tag)
+                        scores[context_id] = scores.get(context_id, 0) + bonus
+            buckets = [(priority, self._priority_index[priority])
+                       for priority in sorted(self._priority_index, reverse=True)]
+        else:
+            members = self._scope_members(scope)
+            by_priority: Dict[int, List[str]] = {}
+            for context_id in sorted(members, key=self._sequence.__getitem__):
+                context = self.contexts[context_id]
+                by_priority.setdefault(context.priority.value, []).append(context_id)
+                for tag in context.iter_tags():
+                    tag_lower = tag.lower()
+                    if any(word in tag_lower for word in query_words):
+                        scores[context_id] = scores.get(context_id, 0) + 2
+            buckets = [(priority, by_priority[priority]) for priority in sorted(by_priority, reverse=True)]
+
         scored_contexts = []
-        
-        for context in self.contexts.values():
-            if context.is_expired():
+        now = time.time()
+        for context_id, score in scores.items():
+            context = self.contexts.get(context_id)
+            if context is None or context.is_expired(now):
                 continue
-                
-            score = 0
-            content_str = json.dumps(context.content).lower()
-            
-            # Pontuação por palavras-chave no conteúdo
-            for word in query_words:
-                score += content_str.count(word)
-            
-            # Pontuação por tags
-            for tag in context.tags:
-                if any(word in tag.lower() for word in query_words):
-                    score += 2
-            
-            # Pontuação por prioridade
-            score += context.priority.value
-            
-            if score > 0:
-                scored_contexts.append((score, context))
-        
-        # Ordena por pontuação e retorna os melhores
-        scored_contexts.sort(key=lambda x: x[0], reverse=True)
-        return [ctx for _, ctx in scored_contexts[:max_results]]
+            scored_contexts.append((score + context.priority.value, self._sequence[context_id], context))
+
+        # Completa com contextos sem correspondência, pontuados apenas pela prioridade
+        for priority, bucket in buckets:
+            filled = 0
+            for context_id in bucket:
+                if filled >= max_results:
+                    break
+                if context_id in scores:
+                    continue
+                context = self.contexts[context_id]
+                if context.is_expired(now):
+                    continue
+                scored_contexts.append((priority, self._sequence[context_id], context))
+                filled += 1
+        return scored_contexts
+
+    def _score_bm25(self, query: str, max_results: int,
+                    scope: Optional[Tuple[str, ...]] = None) -> List[Tuple[float, int, MCPContext]]:
+        """Pontuação BM25 sobre os tokens da query
+
+        Só retorna contextos com pelo menos um token em comum com a query,
+        evitando que contextos irrelevantes entrem apenas pela prioridade.
+        Com escopo, cada sessão é pontuada com IDF e tamanho médio globais,
+        então os escores são os mesmos da busca sem escopo.
+        """
+        now = time.time()
+        terms = _TOKEN_RE.findall(query.lower())
+        top: Dict[str, float] = {}
+        for index in self._scope_indexes(scope):
+            for score, context_id in index.bm25_top_k(
+                terms, max_results,
+                accept=lambda context_id: not self.contexts[context_id].is_expired(now),
+                order=self._sequence,
+                corpus=self.term_index
+            ):
+                top[context_id] = score
+        return [(score, self._sequence[cid], self.contexts[cid]) for cid, score in top.items()]
+
+    def _score_vector(self, query: str, max_results: int,
+                      scope: Optional[Tuple[str, ...]] = None) -> List[Tuple[float, int, MCPContext]]:
+        """Similaridade de cosseno entre embeddings por feature hashing
+
+        Com VectorIndex um produto matriz-vetor pontua todos os contextos; com
+        IVFIndex apenas as listas mais próximas da query. Contextos expirados
+        ou sem similaridade positiva são descartados. Com escopo, apenas os
+        contextos das sessões são pontuados, de forma exata.
+        """
+        query_vector = self.embedder.embed(query)
+        now = time.time()
+        if scope is None:
+            search = lambda k: self.vector_index.search(query_vector, k)  # noqa: E731
+        else:
+            members = self._scope_members(scope)
+            search = lambda k: self.vector_index.search_ids(query_vector, members, k)  # noqa: E731
+        k = max_results
+        while True:
+            top = search(k)
+            scored_contexts = []
+            for score, context_id in top:
+                context = self.contexts[context_id]
+                if score > 0 and not context.is_expired(now):
+                    scored_contexts.append((score, self._sequence[context_id], context))
+            # Repete com k maior se contextos expirados ocuparam vagas
+            if len(scored_contexts) >= max_results or len(top) < k or top[-1][0] <= 0:
+                return scored_contexts
+            k *= 2
+
+    def _index_content(self, context: MCPContext):
+        """Atualiza os índices que dependem do conteúdo do contexto"""
+        self._untrack_text(context.id)
+        terms = context.term_counts(self._escaped_text)
+        self.term_index.add(context.id, terms)
+        for session_id in self._context_sessions.get(context.id, ()):
+            self._session_term_index[session_id].add(context.id, terms)
+        if self.vector_index is not None:
+            self.vector_index.add(context.id, self.embedder.embed(context.searchable_text(escaped=False)))
+        self._track_text(context)
+
+    def _keyword_matches(self, word: str, index: Optional[InvertedIndex] = None) -> List[Tuple[str, int]]:
+        """Retorna (context_id, ocorrências de word no texto normalizado)"""
+        if index is None:
+            index = self.term_index
+        if _TOKEN_RE.fullmatch(word):
+            # Uma palavra só com caracteres de palavra não cruza fronteiras de token
+            matches = []
+            for term, occurrences in index.expand(word):
+                for context_id, tf in index.postings[term].items():
+                    matches.append((context_id, tf * occurrences))
+            return matches
+
+        # Palavras com pontuação: filtra pelo maior trecho alfanumérico e confere no texto
+        pieces = _TOKEN_RE.findall(word)
+        if pieces:
+            candidates = set()
+            for term, _ in index.expand(max(pieces, key=len)):
+                candidates.update(index.postings[term])
+        else:
+            candidates = index.doc_terms.keys()
+        matches = []
+        for context_id in candidates:
+            context = self.contexts[context_id]
+            count = context.searchable_text().count(word)
+            with self._side_lock:
+                self._track_text(context)
+            if count:
+                matches.append((context_id, count))
+        return matches
     
+    @_writes
+    def set_context_expiry(self, context_id: str, expires_at: Optional[Timestamp],
+                           cascade: bool = False) -> bool:
+        """Altera a expiração de um contexto e reagenda sua limpeza
+
+        Com ``cascade`` a mesma expiração vale para toda a subárvore.
+        """
+        if context_id not in self.contexts:
+            return False
+        targets = self._subtree_ids(context_id) if cascade else [context_id]
+        for target_id in targets:
+            context = self.contexts[target_id]
+            context.expires_at = expires_at
+            self._schedule_expiry(context)
+            if self._listeners:
+                self._notify("update", context)
+        self.generation += 1
+        return True
+
+    def _schedule_expiry(self, context: MCPContext):
+        """Agenda a expiração de um contexto no heap"""
+        if context.expires_ts is None:
+            return
+        heapq.heappush(self._expiry_heap, (context.expires_ts, self._sequence[context.id], context.id))
+        # Reconstrói o heap quando as entradas obsoletas predominam
+        if len(self._expiry_heap) > 64 and len(self._expiry_heap) > 2 * len(self.contexts):
+            self._expiry_heap = [
+                entry for entry in self._expiry_heap
+                if entry[2] in self.contexts and self.contexts[entry[2]].expires_ts == entry[0]
+            ]
+            heapq.heapify(self._expiry_heap)
+
     def _cleanup_expired_contexts(self):
-        """Remove contextos expirados"""
-        expired_ids = [cid for cid, ctx in self.contexts.items() if ctx.is_expired()]
-        for cid in expired_ids:
-            self.remove_context(cid)
-    
-    def _remove_oldest_contexts(self, count: int = 100):
-        """Remove os contextos mais antigos"""
-        # Ordena por data de criação e remove os mais antigos
-        sorted_contexts = sorted(self.contexts.items(), key=lambda x: x[1].created_at)
-        for i in range(min(count, len(sorted_contexts))):
-            context_id = sorted_contexts[i][0]
-            self.remove_context(context_id)
+        """Remove contextos expirados
+
+        Só examina as entradas vencidas no topo do heap, então o custo não
+        depende do tamanho do acervo.
+        """
+        now = time.time()
+        while self._expiry_heap and self._expiry_heap[0][0] < now:
+            deadline, _, context_id = heapq.heappop(self._expiry_heap)
+            context = self.contexts.get(context_id)
+            if context is None:
+                continue
+            if context.expires_ts != deadline:
+                # Expiração alterada diretamente no objeto: reagenda
+                self._schedule_expiry(context)
+            else:
+                self.remove_context(context_id)
     
+    def _evict_contexts(self, count: int):
+        """Despeja contextos escolhidos pela política de despejo"""
+        for _ in range(count):
+            victim = self.eviction.victim()
+            if victim is None:
+                break
+            self.remove_context(victim)
+            self.eviction.record_eviction()
+
+    def _intern_payloads(self, context: MCPContext):
+        """Troca as strings grandes do conteúdo pelas cópias únicas do armazém"""
+        self.payloads.release(self._payload_refs.pop(context.id, ()))
+        if context.content_loaded:
+            digests = self.payloads.intern(context.content)
+            if digests:
+                self._payload_refs[context.id] = digests
+
+    def _adopt_content(self, context: MCPContext, lazy: _LazyContent, content: Dict[str, Any]) -> Dict[str, Any]:
+        """Guarda o conteúdo lido sob demanda de uma gravação, internando suas strings grandes"""
+        with self._side_lock:
+            if context._content is not lazy:
+                # Outra thread leu o conteúdo primeiro
+                return context._content
+            if self.contexts.get(context.id) is context and context.id not in self._payload_refs:
+                digests = self.payloads.intern(content)
+                if digests:
+                    self._payload_refs[context.id] = digests
+            context._content = content
+            return content
+
+    def _track_text(self, context: MCPContext):
+        """Contabiliza o texto em cache do contexto e aplica o limite de memória"""
+        previous = self._text_cache.pop(context.id, 0)
+        size = context.text_cache_size()
+        self._text_cache_bytes += size - previous
+        if size:
+            self._text_cache[context.id] = size
+        while self._text_cache_bytes > self.text_cache_limit and self._text_cache:
+            context_id, evicted = self._text_cache.popitem(last=False)
+            self._text_cache_bytes -= evicted
+            self.contexts[context_id].release_text()
+
+    def _untrack_text(self, context_id: str):
+        """Deixa de contabilizar o texto em cache de um contexto"""
+        self._text_cache_bytes -= self._text_cache.pop(context_id, 0)
+
+    @_reads
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas dos caches mantidos pelo protocolo"""
+        return {
+            "text_cache_contexts": len(self._text_cache),
+            "text_cache_bytes": self._text_cache_bytes,
+            "text_cache_limit": self.text_cache_limit,
+            "query_cache_entries": len(self._query_cache),
+            "query_cache_hits": self.query_cache_hits,
+            "query_cache_misses": self.query_cache_misses,
+            "generation": self.generation,
+            **{f"eviction_{key}": value for key, value in self.eviction.get_stats().items()},
+            **{f"dedup_{key}": value for key, value in self.payloads.get_stats().items()},
+        }
+
+    @_reads
     def get_context_summary(self) -> Dict[str, Any]:
         """Retorna resumo do estado atual dos contextos"""
         type_counts = {}
         priority_counts = {}
-        
+        live_contexts = 0
+        now = time.time()
+
         for context in self.contexts.values():
-            if not context.is_expired():
+            if not context.is_expired(now):
+                live_contexts += 1
                 type_counts[context.context_type.value] = type_counts.get(context.context_type.value, 0) + 1
                 priority_counts[context.priority.value] = priority_counts.get(context.priority.value, 0) + 1
-        
+
         return {
-            "total_contexts": len([ctx for ctx in self.contexts.values() if not ctx.is_expired()]),
+            "total_contexts": live_contexts,
             "total_sessions": len(self.sessions),
             "contexts_by_type": type_counts,
             "contexts_by_priority": priority_counts,
             "total_tags": len(self.context_index)
-        }
\ No newline at end of file
+        }
+    @_reads
+    def save(self, path: str):
+        """Grava o acervo, com índices, em arquivo binário (ver ``mcp_store``)"""
+        from .mcp_store import save_protocol
+        save_protocol(self, path)
+
+    @classmethod
+    def load(cls, path: str, thread_safe: bool = False) -> 'MCPProtocol':
+        """Abre um acervo gravado com ``save``; conteúdos são lidos sob demanda"""
+        from .mcp_store import load_protocol
+        return load_protocol(path, cls, thread_safe)
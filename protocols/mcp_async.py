@@ -0,0 +1,118 @@
+"""
+API assíncrona do protocolo MCP
+
+``AsyncMCPProtocol`` envolve um protocolo síncrono (``MCPProtocol``,
+``SQLiteMCPProtocol`` ou ``ShardedMCPProtocol``) e expõe os mesmos métodos
+como corrotinas. Cada chamada roda em um executor de threads, de modo que a
+pontuação das buscas e o I/O do banco não bloqueiam o event loop:
+
+- protocolos thread-safe (``MCPProtocol(thread_safe=True)``,
+  ``ShardedMCPProtocol``) usam um pool com várias threads;
+- os demais usam uma única thread, que serializa as chamadas (o SQLite é
+  aberto com ``check_same_thread=False`` para ser usado por ela).
+
+O loop só espera o resultado; o atraso que as threads impõem a ele fica
+limitado pelo intervalo de troca do GIL (``sys.getswitchinterval()``).
+``max_concurrency`` limita quantas chamadas disputam o GIL ao mesmo tempo.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from .mcp import MCPContext, MCPProtocol
+from .mcp_sqlite import SQLiteMCPProtocol
+
+
+class AsyncMCPProtocol:
+    """Protocolo MCP com métodos aguardáveis, executados fora do event loop"""
+
+    def __init__(self, protocol: Optional[Any] = None, max_workers: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, **options):
+        """Envolve ``protocol`` ou cria um ``MCPProtocol(thread_safe=True, **options)``"""
+        if protocol is None:
+            protocol = MCPProtocol(thread_safe=True, **options)
+        elif options:
+            raise ValueError("Opções do protocolo só são aceitas quando ele é criado aqui")
+        self.protocol = protocol
+        concurrent = getattr(protocol, "thread_safe", False)
+        workers = (max_workers or 4) if concurrent else 1
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mcp-async")
+        self.max_concurrency = max_concurrency or workers
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def sqlite(cls, path: str = ":memory:", **options) -> 'AsyncMCPProtocol':
+        """Cria o protocolo sobre um ``SQLiteMCPProtocol`` usado pela thread do executor"""
+        return cls(SQLiteMCPProtocol(path, check_same_thread=False, **options))
+
+    @property
+    def sessions(self) -> Dict[str, Any]:
+        return self.protocol.sessions
+
+    async def __aenter__(self) -> 'AsyncMCPProtocol':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Encerra o executor e fecha o protocolo envolvido, se ele tiver ``close``"""
+        close = getattr(self.protocol, "close", None)
+        if close is not None:
+            await self._run(close)
+        self._executor.shutdown(wait=True)
+
+    async def add_context(self, context: MCPContext, session_id: Optional[str] = None) -> str:
+        """Adiciona um contexto ao protocolo MCP"""
+        return await self._run(self.protocol.add_context, context, session_id)
+
+    async def add_contexts(self, contexts: Iterable[MCPContext], session_id: Optional[str] = None) -> List[str]:
+        """Adiciona vários contextos em uma chamada"""
+        return await self._run(self.protocol.add_contexts, list(contexts), session_id)
+
+    async def get_context(self, context_id: str) -> Optional[MCPContext]:
+        """Recupera um contexto pelo ID"""
+        return await self._run(self.protocol.get_context, context_id)
+
+    async def update_context(self, context_id: str, new_content: Dict[str, Any]) -> bool:
+        """Atualiza o conteúdo de um contexto"""
+        return await self._run(self.protocol.update_context, context_id, new_content)
+
+    async def remove_context(self, context_id: str) -> bool:
+        """Remove um contexto"""
+        return await self._run(self.protocol.remove_context, context_id)
+
+    async def create_session(self, name: str) -> str:
+        """Cria uma nova sessão MCP"""
+        return await self._run(self.protocol.create_session, name)
+
+    async def get_session_contexts(self, session_id: str) -> List[MCPContext]:
+        """Recupera todos os contextos de uma sessão"""
+        return await self._run(self.protocol.get_session_contexts, session_id)
+
+    async def get_relevant_contexts(self, query: str, max_results: int = 10,
+                                    session_id: Optional[str] = None,
+                                    shared_session_ids: Optional[List[str]] = None,
+                                    parent_depth: int = 0) -> List[MCPContext]:
+        """Busca contextos relevantes para a query
+
+        ``parent_depth`` só é repassado quando diferente de zero, pois apenas
+        o ``MCPProtocol`` inclui ancestrais nos resultados.
+        """
+        options = {"parent_depth": parent_depth} if parent_depth else {}
+        return await self._run(self.protocol.get_relevant_contexts, query, max_results,
+                               session_id, shared_session_ids, **options)
+
+    async def get_context_summary(self) -> Dict[str, Any]:
+        """Retorna resumo dos contextos"""
+        return await self._run(self.protocol.get_context_summary)
+
+    async def _run(self, function, *args, **kwargs) -> Any:
+        # O semáforo é criado no primeiro uso, dentro do loop em execução
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
@@ -0,0 +1,113 @@
+"""
+Montagem de contexto com orçamento de tokens
+
+Escolhe, entre os contextos candidatos de uma busca, os que entram no
+prompt sem ultrapassar um orçamento de tokens. Contextos CRITICAL sempre
+entram; os demais são escolhidos como em uma mochila (knapsack): pela
+densidade pontuação/tokens, comparando o resultado guloso com o melhor
+contexto isolado que cabe no que sobrou (garantia de metade do ótimo).
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .mcp import ContextPriority, MCPContext
+from utils.token_estimator import TokenEstimator, context_text, default_estimator
+
+# Tokens do marcador e da quebra de linha de cada contexto no prompt
+LINE_OVERHEAD_TOKENS = 2
+
+
+def render_context(context: MCPContext) -> str:
+    """Linha do prompt que representa o contexto"""
+    return f"- {context_text(context)}"
+
+
+@dataclass
+class ContextAssembly:
+    """Contextos escolhidos e o consumo do orçamento"""
+    contexts: List[MCPContext] = field(default_factory=list)
+    tokens_used: int = 0
+    token_budget: int = 0
+    candidates: int = 0
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def dropped(self) -> int:
+        """Candidatos que ficaram de fora"""
+        return self.candidates - len(self.contexts)
+
+    @property
+    def over_budget(self) -> bool:
+        """Indica se os contextos CRITICAL sozinhos já excederam o orçamento"""
+        return self.tokens_used > self.token_budget
+
+    def render(self) -> str:
+        """Texto dos contextos escolhidos, um por linha"""
+        return "\n".join(self.lines)
+
+
+def assemble_contexts(candidates: Iterable[Tuple[float, MCPContext]], token_budget: int,
+                      required: Iterable[MCPContext] = (),
+                      estimator: Optional[TokenEstimator] = None,
+                      estimate: Optional[Callable[[str], int]] = None,
+                      render: Callable[[MCPContext], str] = render_context) -> ContextAssembly:
+    """Preenche ``token_budget`` com os candidatos (pontuação, contexto)
+
+    Contextos CRITICAL, entre os candidatos ou em ``required``, entram
+    primeiro mesmo que excedam o orçamento. O resultado mantém os CRITICAL
+    à frente e os demais na ordem dos candidatos.
+
+    O custo de cada contexto é estimado sobre a linha renderizada. Com o
+    ``render`` padrão ele vem do ``estimator`` (contagem do texto em cache
+    no contexto, estimada em lote, mais o marcador da linha); com
+    ``estimate`` ou outro ``render`` cada linha é estimada diretamente.
+    """
+    ranked: Dict[str, Tuple[float, MCPContext]] = {}
+    for score, context in candidates:
+        ranked.setdefault(context.id, (score, context))
+    critical: Dict[str, MCPContext] = {}
+    for context in list(required) + [context for _, context in ranked.values()]:
+        if context.priority == ContextPriority.CRITICAL:
+            critical.setdefault(context.id, context)
+
+    everything = list(critical.values()) + [context for _, context in ranked.values()
+                                            if context.id not in critical]
+    estimator = estimator or default_estimator
+    if estimate is not None:
+        costs = {context.id: max(1, estimate(render(context))) for context in everything}
+    elif render is not render_context:
+        counts = estimator.estimate_many(render(context) for context in everything)
+        costs = {context.id: max(1, count) for context, count in zip(everything, counts)}
+    else:
+        counts = estimator.context_tokens_many(everything)
+        costs = {context.id: count + LINE_OVERHEAD_TOKENS for context, count in zip(everything, counts)}
+
+    used = sum(costs[context.id] for context in critical.values())
+    remaining = token_budget - used
+
+    # (densidade, posição, contexto) dos opcionais que cabem sozinhos
+    options = []
+    for position, (score, context) in enumerate(ranked.values()):
+        if context.id not in critical and costs[context.id] <= remaining:
+            options.append((max(score, 0.0) / costs[context.id], position, max(score, 0.0), context))
+    options.sort(key=lambda option: (-option[0], option[1]))
+
+    chosen, value, space = [], 0.0, remaining
+    for _, position, score, context in options:
+        if costs[context.id] <= space:
+            chosen.append((position, context))
+            value += score
+            space -= costs[context.id]
+    best_single = max(options, key=lambda option: (option[2], -option[1]), default=None)
+    if best_single is not None and best_single[2] > value:
+        chosen = [(best_single[1], best_single[3])]
+
+    selected = list(critical.values()) + [context for _, context in sorted(chosen, key=lambda item: item[0])]
+    return ContextAssembly(
+        contexts=selected,
+        tokens_used=sum(costs[context.id] for context in selected),
+        token_budget=token_budget,
+        candidates=len(ranked.keys() | critical.keys()),
+        lines=[render(context) for context in selected],
+    )
@@ -0,0 +1,100 @@
+"""
+Deduplicação de conteúdo do protocolo MCP
+
+Strings grandes dos conteúdos (mensagens, textos originais, respostas) são
+endereçadas pelo blake2b e guardadas uma única vez: cada contexto passa a
+referenciar o mesmo objeto ``str``, e o armazém mantém a contagem de
+referências para liberá-lo quando o último contexto que o usa sai do acervo.
+"""
+
+import hashlib
+import sys
+from typing import Any, Dict, List
+
+DIGEST_SIZE = 16
+
+
+def content_digest(data: bytes) -> bytes:
+    """Endereço (blake2b de 128 bits) de um conteúdo"""
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+class PayloadStore:
+    """Armazém de strings grandes com contagem de referências"""
+
+    def __init__(self, min_length: int = 256):
+        self.min_length = min_length
+        self._payloads: Dict[bytes, List[Any]] = {}  # digest -> [string, referências]
+        # id da string armazenada -> digest, para não recalcular o hash de
+        # valores que já apontam para a cópia única
+        self._digests: Dict[int, bytes] = {}
+        self.references = 0
+        self.unique_bytes = 0
+        self.referenced_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    def intern(self, content: Any) -> List[bytes]:
+        """Substitui, no lugar, as strings grandes pela cópia única
+
+        Percorre dicionários e listas aninhados e retorna os digests
+        referenciados, a serem devolvidos com ``release``.
+        """
+        digests: List[bytes] = []
+        if isinstance(content, dict):
+            for key, value in content.items():
+                shared = self._intern_value(value, digests)
+                if shared is not value:
+                    content[key] = shared
+        elif isinstance(content, list):
+            for index, value in enumerate(content):
+                shared = self._intern_value(value, digests)
+                if shared is not value:
+                    content[index] = shared
+        return digests
+
+    def release(self, digests: List[bytes]):
+        """Devolve referências obtidas com ``intern``"""
+        for digest in digests:
+            entry = self._payloads[digest]
+            size = sys.getsizeof(entry[0])
+            entry[1] -= 1
+            self.references -= 1
+            self.referenced_bytes -= size
+            if entry[1] == 0:
+                del self._payloads[digest]
+                del self._digests[id(entry[0])]
+                self.unique_bytes -= size
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Quantidade de strings, referências e economia de memória"""
+        return {
+            "payloads": len(self._payloads),
+            "references": self.references,
+            "unique_bytes": self.unique_bytes,
+            "bytes_saved": self.referenced_bytes - self.unique_bytes,
+            "ratio": self.referenced_bytes / self.unique_bytes if self.unique_bytes else 1.0,
+        }
+
+    def _intern_value(self, value: Any, digests: List[bytes]) -> Any:
+        if isinstance(value, str):
+            if len(value) < self.min_length:
+                return value
+            digest = self._digests.get(id(value))
+            if digest is None or self._payloads[digest][0] is not value:
+                digest = content_digest(value.encode("utf-8", "surrogatepass"))
+            entry = self._payloads.get(digest)
+            size = sys.getsizeof(value)
+            if entry is None:
+                entry = self._payloads[digest] = [value, 0]
+                self._digests[id(value)] = digest
+                self.unique_bytes += size
+            entry[1] += 1
+            self.references += 1
+            self.referenced_bytes += size
+            digests.append(digest)
+            return entry[0]
+        if isinstance(value, (dict, list)):
+            digests.extend(self.intern(value))
+        return value
@@ -0,0 +1,208 @@
+"""
+Políticas de despejo do protocolo MCP
+
+Cada política é mantida incrementalmente a cada inserção, acesso e remoção,
+de modo que escolher a próxima vítima custa O(1) e o protocolo pode despejar
+um contexto por vez quando atinge ``max_contexts``.
+"""
+
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Dict, Optional, Union
+
+
+class EvictionMethod(Enum):
+    """Políticas de despejo disponíveis"""
+    LRU = "lru"
+    LFU = "lfu"
+    PRIORITY = "priority"
+
+
+class EvictionPolicy:
+    """Interface comum das políticas de despejo"""
+
+    method: EvictionMethod
+
+    def __init__(self):
+        self.evictions = 0
+        self.touches = 0
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, context_id: str) -> bool:
+        raise NotImplementedError
+
+    def add(self, context_id: str, priority: int):
+        """Registra um contexto inserido"""
+        raise NotImplementedError
+
+    def touch(self, context_id: str):
+        """Registra um acesso ao contexto"""
+        raise NotImplementedError
+
+    def remove(self, context_id: str):
+        """Esquece um contexto removido"""
+        raise NotImplementedError
+
+    def victim(self) -> Optional[str]:
+        """Retorna o próximo contexto a ser despejado"""
+        raise NotImplementedError
+
+    def record_eviction(self):
+        """Contabiliza um despejo realizado"""
+        self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores da política"""
+        return {
+            "policy": self.method.value,
+            "tracked": len(self),
+            "evictions": self.evictions,
+            "touches": self.touches,
+        }
+
+
+class LRUPolicy(EvictionPolicy):
+    """Despeja o contexto acessado há mais tempo"""
+
+    method = EvictionMethod.LRU
+
+    def __init__(self):
+        super().__init__()
+        self._order: "OrderedDict[str, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __contains__(self, context_id: str) -> bool:
+        return context_id in self._order
+
+    def add(self, context_id: str, priority: int):
+        self._order[context_id] = None
+        self._order.move_to_end(context_id)
+
+    def touch(self, context_id: str):
+        if context_id in self._order:
+            self.touches += 1
+            self._order.move_to_end(context_id)
+
+    def remove(self, context_id: str):
+        self._order.pop(context_id, None)
+
+    def victim(self) -> Optional[str]:
+        return next(iter(self._order), None)
+
+
+class LFUPolicy(EvictionPolicy):
+    """Despeja o contexto menos acessado; empates vão para o mais antigo
+
+    Usa baldes por frequência, cada um ordenado por último acesso, e
+    acompanha a menor frequência presente.
+    """
+
+    method = EvictionMethod.LFU
+
+    def __init__(self):
+        super().__init__()
+        self._frequency: Dict[str, int] = {}
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = {}
+        self._min_frequency = 0
+
+    def __len__(self) -> int:
+        return len(self._frequency)
+
+    def __contains__(self, context_id: str) -> bool:
+        return context_id in self._frequency
+
+    def add(self, context_id: str, priority: int):
+        self.remove(context_id)
+        self._frequency[context_id] = 1
+        self._buckets.setdefault(1, OrderedDict())[context_id] = None
+        self._min_frequency = 1
+
+    def touch(self, context_id: str):
+        frequency = self._frequency.get(context_id)
+        if frequency is None:
+            return
+        self.touches += 1
+        self._discard(context_id, frequency)
+        if frequency == self._min_frequency and frequency not in self._buckets:
+            self._min_frequency = frequency + 1
+        self._frequency[context_id] = frequency + 1
+        self._buckets.setdefault(frequency + 1, OrderedDict())[context_id] = None
+
+    def remove(self, context_id: str):
+        frequency = self._frequency.pop(context_id, None)
+        if frequency is None:
+            return
+        self._discard(context_id, frequency)
+        if not self._frequency:
+            self._min_frequency = 0
+        elif frequency == self._min_frequency and frequency not in self._buckets:
+            self._min_frequency = min(self._buckets)
+
+    def victim(self) -> Optional[str]:
+        bucket = self._buckets.get(self._min_frequency)
+        return next(iter(bucket), None) if bucket else None
+
+    def _discard(self, context_id: str, frequency: int):
+        bucket = self._buckets[frequency]
+        del bucket[context_id]
+        if not bucket:
+            del self._buckets[frequency]
+
+
+class PriorityPolicy(EvictionPolicy):
+    """Despeja primeiro a menor prioridade e, dentro dela, o mais antigo
+
+    Contextos CRITICAL só são despejados quando não resta outra prioridade.
+    """
+
+    method = EvictionMethod.PRIORITY
+
+    def __init__(self):
+        super().__init__()
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = {}
+        self._priorities: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._priorities)
+
+    def __contains__(self, context_id: str) -> bool:
+        return context_id in self._priorities
+
+    def add(self, context_id: str, priority: int):
+        self.remove(context_id)
+        self._priorities[context_id] = priority
+        self._buckets.setdefault(priority, OrderedDict())[context_id] = None
+
+    def touch(self, context_id: str):
+        if context_id in self._priorities:
+            self.touches += 1
+
+    def remove(self, context_id: str):
+        priority = self._priorities.pop(context_id, None)
+        if priority is not None:
+            del self._buckets[priority][context_id]
+
+    def victim(self) -> Optional[str]:
+        for priority in sorted(self._buckets):
+            bucket = self._buckets[priority]
+            if bucket:
+                return next(iter(bucket))
+        return None
+
+
+_POLICIES = {
+    EvictionMethod.LRU: LRUPolicy,
+    EvictionMethod.LFU: LFUPolicy,
+    EvictionMethod.PRIORITY: PriorityPolicy,
+}
+
+
+def create_eviction_policy(eviction: Union[EvictionMethod, str, EvictionPolicy]) -> EvictionPolicy:
+    """Cria a política a partir do método (ou retorna a instância informada)"""
+    if isinstance(eviction, EvictionPolicy):
+        return eviction
+    return _POLICIES[EvictionMethod(eviction)]()
@@ -0,0 +1,104 @@
+"""
+Trava leitor-escritor do protocolo MCP
+
+Usada pelo ``MCPProtocol`` com ``thread_safe=True``: buscas e consultas
+compartilham a trava de leitura e mutações tomam a de escrita. A trava é
+reentrante (um escritor pode chamar métodos de leitura e de escrita, e
+leituras podem se aninhar) e dá preferência a escritores, para que um fluxo
+contínuo de buscas não impeça inserções.
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """Trava reentrante com leitores compartilhados e escritor exclusivo"""
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None  # ident da thread escritora
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def acquire_read(self):
+        """Toma a trava de leitura (não bloqueia se a thread já a possui)"""
+        local = self._local
+        if self._writer == threading.get_ident():
+            # Leitura dentro de escrita conta como escrita aninhada
+            self._write_depth += 1
+            local.nested_writes = getattr(local, "nested_writes", 0) + 1
+            return
+        depth = getattr(local, "reads", 0)
+        if depth:
+            local.reads = depth + 1
+            return
+        with self._condition:
+            while self._writer is not None or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        local.reads = 1
+
+    def release_read(self):
+        """Libera a trava de leitura"""
+        local = self._local
+        if getattr(local, "nested_writes", 0):
+            local.nested_writes -= 1
+            self.release_write()
+            return
+        local.reads -= 1
+        if local.reads == 0:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    def acquire_write(self):
+        """Toma a trava de escrita"""
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        if getattr(self._local, "reads", 0):
+            raise RuntimeError("Não é possível escrever enquanto a thread mantém a trava de leitura")
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        """Libera a trava de escrita"""
+        self._write_depth -= 1
+        if self._write_depth == 0:
+            with self._condition:
+                self._writer = None
+                self._condition.notify_all()
+
+    def owns_write(self) -> bool:
+        """Indica se a thread atual possui a trava de escrita"""
+        return self._writer == threading.get_ident()
+
+    @contextmanager
+    def read(self):
+        """Contexto com a trava de leitura"""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """Contexto com a trava de escrita"""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,463 @@
+"""
+Log de mutações e snapshots do protocolo MCP
+
+Cada mutação do ``MCPProtocol`` (inserção, atualização, remoção e criação de
+sessão) é anexada a um log binário. De tempos em tempos o log da geração
+atual é congelado em um segmento e um novo log é iniciado; uma thread em
+segundo plano abre o snapshot anterior, reaplica nele os segmentos
+congelados e grava o snapshot seguinte no formato binário do ``mcp_store``,
+com índices, sem tocar no protocolo em uso. Na recuperação o snapshot é
+mapeado com ``load``/``restore_protocol`` e apenas a cauda (segmentos
+pendentes e log atual) é reaplicada. Quando registros mortos (contextos
+sobrescritos ou removidos) passam de uma fração do log, outra thread
+reescreve o log só com o último estado de cada contexto.
+
+Arquivos: ``mcp.<geração>.snapshot`` (estado até a geração, inclusive),
+``mcp.<geração>.log`` (segmentos congelados) e ``mcp.log`` (log atual).
+Logs têm cabeçalho ``<8sQ`` (assinatura, geração) seguido de registros
+``<II`` (tamanho, crc32) + JSON; logs de geração já coberta pelo snapshot
+são descartados.
+"""
+
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .mcp import MCPContext, MCPProtocol, MCPSession
+from .mcp_store import load_protocol, restore_protocol, save_protocol
+
+LOG_MAGIC = b"MCPLOG01"
+
+_HEADER = struct.Struct("<8sQ")  # assinatura, geração
+_FRAME = struct.Struct("<II")  # tamanho do registro, crc32
+# Todo registro começa com "op" e "id", o que permite à compactação
+# identificá-lo sem decodificar o conteúdo
+_RECORD_KEY = re.compile(rb'\{"op": ?"(\w+)", ?"id": ?"([^"\\]*)"')
+
+
+def _frame(payload: bytes) -> bytes:
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _iter_frames(buffer, offset: int, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Percorre os registros íntegros a partir de ``offset``
+
+    Retorna pares (fim do registro, payload) e para no primeiro registro
+    truncado ou corrompido, como o deixado por uma queda durante a escrita.
+    """
+    end = len(buffer) if end is None else min(end, len(buffer))
+    while offset + _FRAME.size <= end:
+        length, crc = _FRAME.unpack_from(buffer, offset)
+        start = offset + _FRAME.size
+        stop = start + length
+        if stop > end:
+            return
+        payload = buffer[start:stop]
+        if zlib.crc32(payload) != crc:
+            return
+        yield stop, payload
+        offset = stop
+
+
+def _record_key(payload: bytes) -> Tuple[str, str]:
+    match = _RECORD_KEY.match(payload)
+    if match:
+        return match.group(1).decode(), match.group(2).decode()
+    record = json.loads(payload)
+    return record["op"], record["id"]
+
+
+def _encode_put(context: MCPContext, session_ids: List[str]) -> bytes:
+    # O conteúdo entra já serializado, sem nova passagem pelo json
+    record = '{"op":"put","id":%s,"sessions":%s,"context":%s,"content":%s}' % (
+        json.dumps(context.id), json.dumps(session_ids), json.dumps(context.to_record()),
+        context.serialized_content(cache=False)
+    )
+    return record.encode()
+
+
+def _encode_delete(context_id: str) -> bytes:
+    return json.dumps({"op": "del", "id": context_id}).encode()
+
+
+def _encode_session(session: MCPSession) -> bytes:
+    return json.dumps({"op": "session", "id": session.id, "session": session.to_dict()}).encode()
+
+
+def _decode_put(record: Dict[str, Any]) -> MCPContext:
+    data = record["context"]
+    data["content"] = record["content"]
+    return MCPContext.from_dict(data)
+
+
+def _read_header(buffer, path: str) -> int:
+    found, generation = _HEADER.unpack_from(buffer, 0)
+    if found != LOG_MAGIC:
+        raise ValueError(f"Arquivo inválido para o log MCP: {path}")
+    return generation
+
+
+class MCPLog:
+    """Log de mutações com snapshots e compactação para um ``MCPProtocol``
+
+    Uso típico::
+
+        log = MCPLog("dados/mcp")
+        protocol = MCPProtocol()
+        log.recover(protocol)  # carrega o estado e passa a registrar mutações
+    """
+
+    LOG_FILE = "mcp.log"
+    SEGMENT_FILE = "mcp.{}.log"
+    SNAPSHOT_FILE = "mcp.{}.snapshot"
+    _FILE_PATTERN = re.compile(r"mcp\.(\d+)\.(log|snapshot)$")
+
+    def __init__(self, directory: str, snapshot_every: Optional[int] = 100000,
+                 compact_ratio: float = 0.5, compact_min_records: int = 1000,
+                 fsync: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.log_path = os.path.join(directory, self.LOG_FILE)
+        self.snapshot_every = snapshot_every
+        self.compact_ratio = compact_ratio
+        self.compact_min_records = compact_min_records
+        self.fsync = fsync
+
+        self.protocol: Optional[MCPProtocol] = None
+        self.generation = 0
+        self.records = 0
+        self.dead_records = 0
+        self.snapshots = 0
+        self.compactions = 0
+        self._live: Dict[str, None] = {}  # contextos com registro "put" vivo no log
+        self._file = None
+        self._lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+        self._snapshotter: Optional[threading.Thread] = None
+        self._snapshot_requested = False
+
+    def recover(self, protocol: MCPProtocol) -> int:
+        """Carrega snapshot e cauda do log no protocolo e passa a registrar suas mutações
+
+        O estado do snapshot, inclusive a configuração gravada, substitui o
+        do protocolo (ver ``restore_protocol``). Retorna o número de
+        registros reaplicados.
+        """
+        if self.protocol is not None:
+            raise RuntimeError("Log MCP já associado a um protocolo")
+
+        snapshot_generation, segments = self._files()
+        if snapshot_generation is not None:
+            restore_protocol(protocol, self._snapshot_path(snapshot_generation))
+        covered = -1 if snapshot_generation is None else snapshot_generation
+
+        applied = 0
+        generation = max(covered, 0)
+        pending = [segment for segment in segments if segment > covered]
+        for segment_generation in pending:
+            applied += self._replay_file(protocol, self._segment_path(segment_generation))
+            generation = segment_generation
+
+        log_generation = None
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= _HEADER.size:
+            with open(self.log_path, "rb") as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                log_generation = _read_header(buffer, self.log_path)
+                if log_generation > covered:
+                    valid_end, replayed = self._replay(protocol, buffer, account=True)
+                    applied += replayed
+                    size = len(buffer)
+            if log_generation > covered and valid_end < size:
+                # Descarta o registro incompleto deixado por uma queda
+                with open(self.log_path, "r+b") as file:
+                    file.truncate(valid_end)
+
+        if log_generation is not None and log_generation > covered:
+            self.generation = log_generation
+            self._file = open(self.log_path, "ab")
+        else:
+            self._start_log(generation + 1)
+
+        if snapshot_generation is None:
+            # Primeiro uso do diretório: o snapshot inicial é a base dos próximos
+            covered = self.generation
+            save_protocol(protocol, self._snapshot_path(covered))
+            self._start_log(covered + 1)
+        self._remove_covered(covered)
+
+        self.protocol = protocol
+        protocol.add_listener(self._on_event)
+        if snapshot_generation is not None and pending:
+            # Segmentos deixados por uma queda antes do snapshot
+            self._request_snapshot()
+        return applied
+
+    def snapshot(self, wait: bool = True):
+        """Congela o log atual e grava, em segundo plano, o snapshot que o inclui"""
+        if self.protocol is None:
+            raise RuntimeError("Log MCP não associado a um protocolo")
+        with self._lock:
+            self._file.close()
+            self._file = None
+            os.replace(self.log_path, self._segment_path(self.generation))
+            self._start_log(self.generation + 1)
+            self.snapshots += 1
+        self._request_snapshot()
+        if wait:
+            self._wait_snapshot()
+
+    def compact(self, wait: bool = True):
+        """Reescreve o log mantendo só o último registro de cada contexto e sessão"""
+        with self._lock:
+            running = self._compactor is not None and self._compactor.is_alive()
+            if not running:
+                self._compactor = threading.Thread(target=self._compact, name="mcp-log-compaction",
+                                                   daemon=True)
+                self._compactor.start()
+        if wait:
+            self._wait_compaction()
+
+    def close(self):
+        """Deixa de registrar mutações e fecha o log"""
+        if self.protocol is not None:
+            self.protocol.remove_listener(self._on_event)
+            self.protocol = None
+        self._wait_compaction()
+        self._wait_snapshot()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas do log"""
+        with self._lock:
+            log_bytes = self._file.tell() if self._file is not None else 0
+            return {
+                "generation": self.generation,
+                "records": self.records,
+                "dead_records": self.dead_records,
+                "log_bytes": log_bytes,
+                "snapshots": self.snapshots,
+                "compactions": self.compactions,
+            }
+
+    def _on_event(self, event: str, subject: Any, session_id: Optional[str] = None):
+        if event in ("add", "update"):
+            payload = _encode_put(subject, self.protocol.get_context_session_ids(subject.id))
+            self._append("put", subject.id, payload)
+        elif event == "remove":
+            self._append("del", subject, _encode_delete(subject))
+        elif event == "session":
+            self._append("session", subject.id, _encode_session(subject))
+
+        if self.snapshot_every and self.records >= self.snapshot_every:
+            self.snapshot(wait=False)
+        elif (self.records >= self.compact_min_records
+              and self.dead_records >= self.records * self.compact_ratio):
+            self.compact(wait=False)
+
+    def _append(self, op: str, record_id: str, payload: bytes):
+        with self._lock:
+            self._file.write(_frame(payload))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._account(op, record_id)
+
+    def _account(self, op: str, record_id: str):
+        self.records += 1
+        if op == "put":
+            if record_id in self._live:
+                self.dead_records += 1
+            self._live[record_id] = None
+        elif op == "del" and record_id in self._live:
+            del self._live[record_id]
+            self.dead_records += 1
+
+    def _start_log(self, generation: int):
+        if self._file is not None:
+            self._file.close()
+        temporary = self.log_path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(_HEADER.pack(LOG_MAGIC, generation))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.log_path)
+        self._file = open(self.log_path, "ab")
+        self.generation = generation
+        self.records = 0
+        self.dead_records = 0
+        self._live = {}
+
+    def _snapshot_path(self, generation: int) -> str:
+        return os.path.join(self.directory, self.SNAPSHOT_FILE.format(generation))
+
+    def _segment_path(self, generation: int) -> str:
+        return os.path.join(self.directory, self.SEGMENT_FILE.format(generation))
+
+    def _files(self) -> Tuple[Optional[int], List[int]]:
+        """Geração do snapshot mais recente e gerações dos segmentos, em ordem"""
+        snapshots, segments = [], []
+        for name in os.listdir(self.directory):
+            match = self._FILE_PATTERN.match(name)
+            if match:
+                kind = snapshots if match.group(2) == "snapshot" else segments
+                kind.append(int(match.group(1)))
+        return max(snapshots, default=None), sorted(segments)
+
+    def _write_snapshots(self):
+        """Thread de snapshot: aplica os segmentos pendentes sobre o último snapshot"""
+        try:
+            while True:
+                with self._lock:
+                    if not self._snapshot_requested:
+                        self._snapshotter = None
+                        return
+                    self._snapshot_requested = False
+                snapshot_generation, segments = self._files()
+                pending = [generation for generation in segments if generation > snapshot_generation]
+                if not pending:
+                    continue
+                # Cópia independente do protocolo em uso, lida do snapshot anterior
+                base = load_protocol(self._snapshot_path(snapshot_generation))
+                for generation in pending:
+                    self._replay_file(base, self._segment_path(generation))
+                save_protocol(base, self._snapshot_path(pending[-1]))
+                del base
+                self._remove_covered(pending[-1])
+        except BaseException:
+            with self._lock:
+                self._snapshotter = None
+            raise
+
+    def _remove_covered(self, generation: int):
+        """Remove snapshots anteriores e segmentos já incluídos no snapshot ``generation``"""
+        for name in os.listdir(self.directory):
+            match = self._FILE_PATTERN.match(name)
+            if match:
+                found = int(match.group(1))
+                if match.group(2) == "snapshot" and found < generation:
+                    os.remove(os.path.join(self.directory, name))
+                elif match.group(2) == "log" and found <= generation:
+                    os.remove(os.path.join(self.directory, name))
+
+    def _request_snapshot(self):
+        with self._lock:
+            self._snapshot_requested = True
+            if self._snapshotter is None:
+                self._snapshotter = threading.Thread(target=self._write_snapshots,
+                                                     name="mcp-log-snapshot", daemon=True)
+                self._snapshotter.start()
+
+    def _wait_snapshot(self):
+        snapshotter = self._snapshotter
+        if snapshotter is not None and snapshotter is not threading.current_thread():
+            snapshotter.join()
+
+    def _replay_file(self, protocol: MCPProtocol, path: str) -> int:
+        """Reaplica um segmento congelado"""
+        with open(path, "rb") as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            _read_header(buffer, path)
+            return self._replay(protocol, buffer, account=False)[1]
+
+    def _replay(self, protocol: MCPProtocol, buffer, account: bool) -> Tuple[int, int]:
+        """Reaplica um log; retorna (fim do último registro íntegro, registros)
+
+        Com ``account`` os registros contam para a compactação do log atual.
+        """
+        valid_end = _HEADER.size
+        replayed = 0
+        for valid_end, payload in _iter_frames(buffer, _HEADER.size):
+            record = json.loads(payload)
+            op = record["op"]
+            if op == "session":
+                self._restore_session(protocol, record)
+            elif op == "put":
+                # Registros "put" trazem o estado completo e substituem a
+                # versão anterior, preservando sua posição e sessões
+                context = _decode_put(record)
+                protocol.add_context(context)
+                for session_id in record["sessions"]:
+                    protocol.add_context_to_session(context.id, session_id)
+            elif op == "del":
+                protocol.remove_context(record["id"])
+            if account:
+                self._account(op, record["id"])
+            replayed += 1
+        return valid_end, replayed
+
+    @staticmethod
+    def _restore_session(protocol: MCPProtocol, record: Dict[str, Any]):
+        if record["id"] not in protocol.sessions:
+            protocol.sessions[record["id"]] = MCPSession.from_dict(record["session"])
+
+    def _wait_compaction(self):
+        compactor = self._compactor
+        if compactor is not None and compactor is not threading.current_thread():
+            compactor.join()
+
+    def _compact(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            end = self._file.tell()
+            generation = self.generation
+            # Aberto sob a trava: uma rotação posterior (snapshot) renomeia o
+            # arquivo, mas este descritor continua lendo a mesma geração
+            source = open(self.log_path, "rb")
+
+        # Mantém o último registro de cada chave na posição do primeiro, o que
+        # preserva a ordem de inserção; remoções ficam, pois podem mascarar
+        # contextos presentes no snapshot
+        sessions: Dict[str, bytes] = {}
+        latest: Dict[str, bytes] = {}
+        with source as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            for _, payload in _iter_frames(buffer, _HEADER.size, end):
+                op, record_id = _record_key(payload)
+                if op == "session":
+                    sessions[record_id] = payload
+                else:
+                    latest[record_id] = payload
+
+        temporary = self.log_path + ".compact"
+        with open(temporary, "wb") as output:
+            output.write(_HEADER.pack(LOG_MAGIC, generation))
+            # Sessões antes dos contextos que as referenciam
+            for payload in sessions.values():
+                output.write(_frame(payload))
+            for payload in latest.values():
+                output.write(_frame(payload))
+
+            with self._lock:
+                if self._file is None or self.generation != generation:
+                    # Um snapshot reiniciou o log durante a compactação
+                    output.close()
+                    os.remove(temporary)
+                    return
+                # Copia os registros anexados durante a compactação
+                self._file.flush()
+                tail_records = 0
+                with open(self.log_path, "rb") as file:
+                    file.seek(end)
+                    tail = file.read()
+                for _ in _iter_frames(tail, 0):
+                    tail_records += 1
+                output.write(tail)
+                output.flush()
+                os.fsync(output.fileno())
+                output.close()
+                self._file.close()
+                os.replace(temporary, self.log_path)
+                self._file = open(self.log_path, "ab")
+                self.records = len(sessions) + len(latest) + tail_records
+                self.dead_records = 0
+                self.compactions += 1
@@ -0,0 +1,213 @@
+"""
+Protocolo MCP particionado entre processos
+
+``ShardedMCPProtocol`` expõe a API do ``MCPProtocol`` e distribui os
+contextos entre N processos (shards) pelo crc32 do ID do contexto, o que
+mantém os shards balanceados sem tabela de roteamento. Sessões existem em
+todos os shards; buscas são enviadas a todos (scatter) e os top-k de cada
+um são combinados pela pontuação (gather), de modo que a pontuação roda em
+paralelo em vários núcleos, fora do GIL do processo principal.
+
+Com BM25 cada shard usa as estatísticas (IDF, tamanho médio) do próprio
+acervo; com a distribuição uniforme por hash a diferença para as
+estatísticas globais é pequena.
+"""
+
+import heapq
+import multiprocessing
+import os
+import threading
+import zlib
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .mcp import MCPContext, MCPProtocol, MCPSession
+
+# Métodos do MCPProtocol executados pelos shards
+_SHARD_METHODS = frozenset({
+    "add_context", "add_contexts", "get_context", "update_context", "remove_context",
+    "remove_contexts", "set_context_expiry", "get_session_contexts", "score_relevant_contexts",
+    "get_context_summary", "get_cache_stats",
+})
+
+
+def _serve(connection, options: Dict[str, Any]):
+    """Laço de um shard: executa as chamadas recebidas pela conexão"""
+    protocol = MCPProtocol(**options)
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        method, args = request
+        try:
+            if method == "add_session":
+                session = args[0]
+                protocol.sessions.setdefault(session.id, session)
+                result = session.id
+            elif method in _SHARD_METHODS:
+                result = getattr(protocol, method)(*args)
+            else:
+                raise AttributeError(f"Método não disponível no shard: {method}")
+            connection.send((True, result))
+        except Exception as error:
+            connection.send((False, error))
+    connection.close()
+
+
+class ShardedMCPProtocol:
+    """Fachada com a API do MCPProtocol sobre contextos distribuídos em processos"""
+
+    # Chamadas de várias threads são serializadas na trava das conexões
+    thread_safe = True
+
+    def __init__(self, shards: Optional[int] = None, max_contexts: int = 1000,
+                 start_method: Optional[str] = None, **options):
+        """Inicia os shards
+
+        ``max_contexts`` é o total, dividido entre os shards; as demais
+        opções (``scoring``, ``eviction`` etc.) são repassadas a cada
+        ``MCPProtocol``.
+        """
+        self.shard_count = shards or os.cpu_count() or 1
+        self.max_contexts = max_contexts
+        options["max_contexts"] = max(1, -(-max_contexts // self.shard_count))
+        self.sessions: Dict[str, MCPSession] = {}
+        self._lock = threading.Lock()
+        self._connections = []
+        self._processes = []
+
+        context = multiprocessing.get_context(start_method)
+        for shard in range(self.shard_count):
+            parent, child = context.Pipe()
+            process = context.Process(target=_serve, args=(child, options),
+                                      name=f"mcp-shard-{shard}", daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def __enter__(self) -> 'ShardedMCPProtocol':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Encerra os processos dos shards"""
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+            for process, connection in zip(self._processes, self._connections):
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+                connection.close()
+            self._connections = []
+            self._processes = []
+
+    def shard_of(self, context_id: str) -> int:
+        """Shard responsável por um contexto"""
+        return zlib.crc32(context_id.encode()) % self.shard_count
+
+    def add_context(self, context: MCPContext, session_id: Optional[str] = None) -> str:
+        """Adiciona um contexto no shard responsável"""
+        return self._call(self.shard_of(context.id), "add_context", context, session_id)
+
+    def add_contexts(self, contexts: Iterable[MCPContext], session_id: Optional[str] = None,
+                     batch_size: int = 1000) -> List[str]:
+        """Adiciona vários contextos, um lote por shard a cada rodada"""
+        iterator = iter(contexts)
+        added: List[str] = []
+        while True:
+            batch = list(islice(iterator, batch_size * self.shard_count))
+            if not batch:
+                break
+            groups: Dict[int, List[MCPContext]] = {}
+            for context in batch:
+                groups.setdefault(self.shard_of(context.id), []).append(context)
+            self._scatter({shard: ("add_contexts", (group, session_id, batch_size))
+                           for shard, group in groups.items()})
+            added.extend(context.id for context in batch)
+        return added
+
+    def get_context(self, context_id: str) -> Optional[MCPContext]:
+        """Recupera um contexto pelo ID"""
+        return self._call(self.shard_of(context_id), "get_context", context_id)
+
+    def update_context(self, context_id: str, new_content: Dict[str, Any]) -> bool:
+        """Atualiza o conteúdo de um contexto"""
+        return self._call(self.shard_of(context_id), "update_context", context_id, new_content)
+
+    def remove_context(self, context_id: str) -> bool:
+        """Remove um contexto"""
+        return self._call(self.shard_of(context_id), "remove_context", context_id)
+
+    def remove_contexts(self, context_ids: Iterable[str]) -> int:
+        """Remove vários contextos e retorna quantos foram removidos"""
+        groups: Dict[int, List[str]] = {}
+        for context_id in context_ids:
+            groups.setdefault(self.shard_of(context_id), []).append(context_id)
+        results = self._scatter({shard: ("remove_contexts", (ids,)) for shard, ids in groups.items()})
+        return sum(results.values())
+
+    def create_session(self, name: str) -> str:
+        """Cria uma sessão, replicada em todos os shards"""
+        session = MCPSession.create(name)
+        self._broadcast("add_session", session)
+        self.sessions[session.id] = session
+        return session.id
+
+    def get_session_contexts(self, session_id: str) -> List[MCPContext]:
+        """Recupera os contextos de uma sessão, em ordem de criação"""
+        results = self._broadcast("get_session_contexts", session_id)
+        contexts = [context for shard in sorted(results) for context in results[shard]]
+        return sorted(contexts, key=lambda context: context.created_ts)
+
+    def get_relevant_contexts(self, query: str, max_results: int = 10,
+                              session_id: Optional[str] = None,
+                              shared_session_ids: Optional[List[str]] = None) -> List[MCPContext]:
+        """Busca em todos os shards e combina os top-k pela pontuação"""
+        if max_results <= 0:
+            return []
+        results = self._broadcast("score_relevant_contexts", query, max_results, session_id,
+                                  shared_session_ids)
+        scored: List[Tuple[float, MCPContext]] = [pair for shard in sorted(results) for pair in results[shard]]
+        best = heapq.nsmallest(max_results, scored, key=lambda pair: (-pair[0], pair[1].created_ts))
+        return [context for _, context in best]
+
+    def get_context_summary(self) -> Dict[str, Any]:
+        """Resumo somado de todos os shards"""
+        summary: Dict[str, Any] = {"total_contexts": 0, "total_sessions": len(self.sessions),
+                                   "contexts_by_type": {}, "contexts_by_priority": {},
+                                   "total_shards": self.shard_count}
+        for shard_summary in self._broadcast("get_context_summary").values():
+            summary["total_contexts"] += shard_summary["total_contexts"]
+            for key in ("contexts_by_type", "contexts_by_priority"):
+                for value, count in shard_summary[key].items():
+                    summary[key][value] = summary[key].get(value, 0) + count
+        return summary
+
+    def _call(self, shard: int, method: str, *args) -> Any:
+        return self._scatter({shard: (method, args)})[shard]
+
+    def _broadcast(self, method: str, *args) -> Dict[int, Any]:
+        return self._scatter({shard: (method, args) for shard in range(self.shard_count)})
+
+    def _scatter(self, requests: Dict[int, Tuple[str, tuple]]) -> Dict[int, Any]:
+        """Envia as chamadas a todos os shards antes de esperar qualquer resposta"""
+        with self._lock:
+            if not self._connections:
+                raise RuntimeError("ShardedMCPProtocol já foi encerrado")
+            for shard, request in requests.items():
+                self._connections[shard].send(request)
+            replies = {shard: self._connections[shard].recv() for shard in requests}
+        for ok, result in replies.values():
+            if not ok:
+                raise result
+        return {shard: result for shard, (_, result) in replies.items()}
@@ -0,0 +1,436 @@
+"""
+Armazenamento persistente do protocolo MCP em SQLite
+
+Contextos e sessões ficam em tabelas com colunas indexadas (tipo,
+prioridade, expiração, pai, tags e sessões) e o texto pesquisável em uma
+tabela virtual FTS5, usada por ``get_relevant_contexts``. O banco opera em
+modo WAL; os contextos acessados recentemente ficam em um cache LRU em
+memória, com escrita direta (write-through) no banco a cada mutação.
+"""
+
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .mcp import (
+    _TOKEN_RE, ContextPriority, ContextType, MCPContext, MCPSession, Timestamp
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contexts (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    context_type TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    created_ts REAL NOT NULL,
+    updated_ts REAL NOT NULL,
+    expires_ts REAL,
+    parent_id TEXT,
+    content TEXT NOT NULL,
+    metadata TEXT,
+    children_ids TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_contexts_type ON contexts(context_type, seq);
+CREATE INDEX IF NOT EXISTS idx_contexts_priority ON contexts(priority, seq);
+CREATE INDEX IF NOT EXISTS idx_contexts_expires ON contexts(expires_ts) WHERE expires_ts IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_contexts_parent ON contexts(parent_id) WHERE parent_id IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS context_tags (
+    tag TEXT NOT NULL,
+    context_seq INTEGER NOT NULL REFERENCES contexts(seq) ON DELETE CASCADE,
+    PRIMARY KEY (tag, context_seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_context_tags_seq ON context_tags(context_seq);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    created_ts REAL NOT NULL,
+    updated_ts REAL NOT NULL,
+    metadata TEXT
+);
+
+CREATE TABLE IF NOT EXISTS session_contexts (
+    session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    context_seq INTEGER NOT NULL REFERENCES contexts(seq) ON DELETE CASCADE,
+    PRIMARY KEY (session_id, context_seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_session_contexts_seq ON session_contexts(context_seq);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS contexts_fts USING fts5(body, tags);
+"""
+
+_COLUMNS = ("id, context_type, priority, created_ts, updated_ts, expires_ts, "
+            "parent_id, content, metadata, children_ids")
+_SELECT = "seq, " + _COLUMNS
+
+
+class _ContextsView(Mapping):
+    """Visão somente leitura ``context_id -> MCPContext`` sobre o banco"""
+
+    def __init__(self, protocol: "SQLiteMCPProtocol"):
+        self._protocol = protocol
+
+    def __getitem__(self, context_id: str) -> MCPContext:
+        context = self._protocol._load_context(context_id)
+        if context is None:
+            raise KeyError(context_id)
+        return context
+
+    def __contains__(self, context_id: object) -> bool:
+        return self._protocol._seq_of(context_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for (context_id,) in self._protocol.connection.execute("SELECT id FROM contexts ORDER BY seq"):
+            yield context_id
+
+    def __len__(self) -> int:
+        return self._protocol._count
+
+
+class SQLiteMCPProtocol:
+    """Protocolo MCP com contextos e sessões persistidos em SQLite
+
+    Mantém a API pública do ``MCPProtocol``. ``max_contexts=None`` deixa o
+    acervo limitado apenas pelo disco; com limite, o despejo remove primeiro
+    a menor prioridade e, dentro dela, o contexto mais antigo. A busca usa o
+    ranking BM25 do FTS5 e só retorna contextos com algum termo da query
+    (prefixos de tokens também casam). Alterações feitas diretamente em
+    objetos ``MCPContext`` só são persistidas pelos métodos do protocolo.
+    """
+
+    def __init__(self, path: str = ":memory:", max_contexts: Optional[int] = None,
+                 cache_size: int = 1000, check_same_thread: bool = True):
+        self.path = path
+        self.max_contexts = max_contexts
+        # check_same_thread=False permite usar a conexão a partir de outra
+        # thread, desde que as chamadas não sejam simultâneas
+        self.connection = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+        # Cache LRU de contextos quentes (write-through)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, MCPContext]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.contexts = _ContextsView(self)
+        self._count = self.connection.execute("SELECT COUNT(*) FROM contexts").fetchone()[0]
+        self.sessions: Dict[str, MCPSession] = {}
+        self._load_sessions()
+
+    def close(self):
+        """Fecha a conexão com o banco"""
+        self.connection.close()
+
+    def __enter__(self) -> "SQLiteMCPProtocol":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Contextos
+
+    def add_context(self, context: MCPContext, session_id: Optional[str] = None) -> str:
+        """Adiciona um contexto ao protocolo MCP"""
+        return self.add_contexts([context], session_id)[0]
+
+    def add_contexts(self, contexts: Iterable[MCPContext], session_id: Optional[str] = None) -> List[str]:
+        """Adiciona vários contextos em uma única transação"""
+        self._cleanup_expired_contexts()
+        session = self.sessions.get(session_id) if session_id else None
+        added = []
+        with self.connection:
+            for context in contexts:
+                seq = self._write_context(context)
+                if session is not None:
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO session_contexts (session_id, context_seq) VALUES (?, ?)",
+                        (session.id, seq))
+                    session.add_context_id(context.id)
+                self._cache_put(context)
+                added.append(context.id)
+            if session is not None:
+                self._touch_session(session)
+        if self.max_contexts is not None:
+            self._evict_contexts(len(self.contexts) - self.max_contexts)
+        return added
+
+    def get_context(self, context_id: str) -> Optional[MCPContext]:
+        """Recupera um contexto pelo ID"""
+        context = self._load_context(context_id)
+        if context is not None and context.is_expired():
+            self.remove_context(context_id)
+            return None
+        return context
+
+    def update_context(self, context_id: str, new_content: Dict[str, Any]) -> bool:
+        """Atualiza o conteúdo de um contexto"""
+        context = self.get_context(context_id)
+        if context is None:
+            return False
+        context.update_content(new_content)
+        with self.connection:
+            self._write_context(context)
+        return True
+
+    def set_context_expiry(self, context_id: str, expires_at: Optional[Timestamp]) -> bool:
+        """Altera a expiração de um contexto"""
+        context = self._load_context(context_id)
+        if context is None:
+            return False
+        context.expires_at = expires_at
+        with self.connection:
+            self.connection.execute("UPDATE contexts SET expires_ts = ? WHERE id = ?",
+                                    (context.expires_ts, context_id))
+        return True
+
+    def remove_context(self, context_id: str) -> bool:
+        """Remove um contexto"""
+        return self.remove_contexts([context_id]) == 1
+
+    def remove_contexts(self, context_ids: Iterable[str]) -> int:
+        """Remove vários contextos em uma única transação"""
+        removed = 0
+        with self.connection:
+            for context_id in context_ids:
+                seq = self._seq_of(context_id)
+                if seq is None:
+                    continue
+                for (session_id,) in self.connection.execute(
+                        "SELECT session_id FROM session_contexts WHERE context_seq = ?", (seq,)).fetchall():
+                    session = self.sessions.get(session_id)
+                    if session is not None:
+                        session.remove_context_id(context_id)
+                        self._touch_session(session)
+                self.connection.execute("DELETE FROM contexts_fts WHERE rowid = ?", (seq,))
+                self.connection.execute("DELETE FROM contexts WHERE seq = ?", (seq,))
+                self._cache.pop(context_id, None)
+                self._count -= 1
+                removed += 1
+        return removed
+
+    # Consultas por índice
+
+    def find_contexts_by_tag(self, tag: str) -> List[MCPContext]:
+        """Encontra contextos por tag"""
+        return self.query_contexts(tags=[tag])
+
+    def find_contexts_by_type(self, context_type: ContextType) -> List[MCPContext]:
+        """Encontra contextos por tipo"""
+        return self.query_contexts(context_type=context_type)
+
+    def find_contexts_by_priority(self, min_priority: ContextPriority) -> List[MCPContext]:
+        """Encontra contextos por prioridade mínima"""
+        return self.query_contexts(min_priority=min_priority)
+
+    def query_contexts(self, context_type: Optional[ContextType] = None,
+                       min_priority: Optional[ContextPriority] = None,
+                       tags: Optional[List[str]] = None,
+                       session_id: Optional[str] = None,
+                       parent_id: Optional[str] = None) -> List[MCPContext]:
+        """Encontra contextos que atendem a todos os filtros informados"""
+        self._cleanup_expired_contexts()
+        clauses, params = [], []
+        if context_type is not None:
+            clauses.append("context_type = ?")
+            params.append(context_type.value)
+        if min_priority is not None:
+            clauses.append("priority >= ?")
+            params.append(min_priority.value)
+        for tag in tags or []:
+            clauses.append("seq IN (SELECT context_seq FROM context_tags WHERE tag = ?)")
+            params.append(tag)
+        if session_id is not None:
+            clauses.append("seq IN (SELECT context_seq FROM session_contexts WHERE session_id = ?)")
+            params.append(session_id)
+        if parent_id is not None:
+            clauses.append("parent_id = ?")
+            params.append(parent_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.connection.execute(
+            f"SELECT {_SELECT} FROM contexts {where} ORDER BY seq", params).fetchall()
+        return [self._context_from_row(row) for row in rows]
+
+    def get_relevant_contexts(self, query: str, max_results: int = 10,
+                              session_id: Optional[str] = None,
+                              shared_session_ids: Optional[List[str]] = None) -> List[MCPContext]:
+        """Encontra contextos relevantes para uma query usando FTS5 (BM25)"""
+        terms = list(dict.fromkeys(_TOKEN_RE.findall(query.lower())))
+        if max_results <= 0 or not terms:
+            return []
+        match = " OR ".join(f'"{term}"*' for term in terms)
+        sql = (f"SELECT {', '.join('c.' + column for column in _SELECT.split(', '))} "
+               "FROM contexts_fts JOIN contexts c ON c.seq = contexts_fts.rowid "
+               "WHERE contexts_fts MATCH ? AND (c.expires_ts IS NULL OR c.expires_ts > ?)")
+        params: List[Any] = [match, time.time()]
+        scope = list(dict.fromkeys(([session_id] if session_id is not None else [])
+                                   + list(shared_session_ids or [])))
+        if scope:
+            sql += (" AND c.seq IN (SELECT context_seq FROM session_contexts WHERE session_id IN "
+                    f"({', '.join('?' * len(scope))}))")
+            params.extend(scope)
+        sql += " ORDER BY bm25(contexts_fts), c.priority DESC, c.seq LIMIT ?"
+        params.append(max_results)
+        rows = self.connection.execute(sql, params).fetchall()
+        return [self._context_from_row(row) for row in rows]
+
+    # Sessões
+
+    def create_session(self, name: str) -> str:
+        """Cria uma nova sessão"""
+        session = MCPSession.create(name)
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO sessions (id, name, created_ts, updated_ts, metadata) VALUES (?, ?, ?, ?, ?)",
+                (session.id, session.name, session.created_ts, session.updated_ts, json.dumps(session.metadata)))
+        self.sessions[session.id] = session
+        return session.id
+
+    def get_session_contexts(self, session_id: str) -> List[MCPContext]:
+        """Recupera todos os contextos de uma sessão"""
+        if session_id not in self.sessions:
+            return []
+        return self.query_contexts(session_id=session_id)
+
+    # Estatísticas
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas do cache de contextos quentes"""
+        return {
+            "cache_contexts": len(self._cache),
+            "cache_size": self.cache_size,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+    def get_context_summary(self) -> Dict[str, Any]:
+        """Retorna resumo do estado atual dos contextos"""
+        now = time.time()
+        live = "expires_ts IS NULL OR expires_ts > ?"
+        type_counts = dict(self.connection.execute(
+            f"SELECT context_type, COUNT(*) FROM contexts WHERE {live} GROUP BY context_type", (now,)))
+        priority_counts = dict(self.connection.execute(
+            f"SELECT priority, COUNT(*) FROM contexts WHERE {live} GROUP BY priority", (now,)))
+        return {
+            "total_contexts": sum(type_counts.values()),
+            "total_sessions": len(self.sessions),
+            "contexts_by_type": type_counts,
+            "contexts_by_priority": priority_counts,
+            "total_tags": self.connection.execute(
+                "SELECT COUNT(DISTINCT tag) FROM context_tags").fetchone()[0]
+        }
+
+    # Internos
+
+    def _write_context(self, context: MCPContext) -> int:
+        """Insere ou atualiza a linha, as tags e o texto FTS de um contexto"""
+        if self._seq_of(context.id) is None:
+            self._count += 1
+        self.connection.execute(
+            f"INSERT INTO contexts ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET context_type = excluded.context_type, "
+            "priority = excluded.priority, created_ts = excluded.created_ts, "
+            "updated_ts = excluded.updated_ts, expires_ts = excluded.expires_ts, "
+            "parent_id = excluded.parent_id, content = excluded.content, "
+            "metadata = excluded.metadata, children_ids = excluded.children_ids",
+            (context.id, context.context_type.value, context.priority.value, context.created_ts,
+             context.updated_ts, context.expires_ts, context.parent_id, context.serialized_content(),
+             json.dumps(context._metadata) if context._metadata else None,
+             json.dumps(context._children_ids) if context._children_ids else None))
+        seq = self._seq_of(context.id)
+        tags = list(dict.fromkeys(context.iter_tags()))
+        self.connection.execute("DELETE FROM context_tags WHERE context_seq = ?", (seq,))
+        self.connection.executemany("INSERT INTO context_tags (tag, context_seq) VALUES (?, ?)",
+                                    [(tag, seq) for tag in tags])
+        self.connection.execute("DELETE FROM contexts_fts WHERE rowid = ?", (seq,))
+        self.connection.execute("INSERT INTO contexts_fts (rowid, body, tags) VALUES (?, ?, ?)",
+                                (seq, json.dumps(context.content, ensure_ascii=False), " ".join(tags)))
+        return seq
+
+    def _seq_of(self, context_id: object) -> Optional[int]:
+        row = self.connection.execute("SELECT seq FROM contexts WHERE id = ?", (context_id,)).fetchone()
+        return row[0] if row else None
+
+    def _load_context(self, context_id: str) -> Optional[MCPContext]:
+        """Busca no cache quente ou, na falta, no banco"""
+        context = self._cache.get(context_id)
+        if context is not None:
+            self._cache.move_to_end(context_id)
+            self.cache_hits += 1
+            return context
+        self.cache_misses += 1
+        row = self.connection.execute(
+            f"SELECT {_SELECT} FROM contexts WHERE id = ?", (context_id,)).fetchone()
+        if row is None:
+            return None
+        context = self._context_from_row(row)
+        self._cache_put(context)
+        return context
+
+    def _context_from_row(self, row: Tuple) -> MCPContext:
+        """Materializa uma linha, reaproveitando o objeto do cache quente"""
+        cached = self._cache.get(row[1])
+        if cached is not None:
+            return cached
+        (seq, context_id, context_type, priority, created_ts, updated_ts, expires_ts,
+         parent_id, content, metadata, children_ids) = row
+        return MCPContext(
+            id=context_id,
+            context_type=ContextType(context_type),
+            content=json.loads(content),
+            priority=ContextPriority(priority),
+            created_ts=created_ts,
+            updated_ts=updated_ts,
+            expires_ts=expires_ts,
+            tags=[tag for (tag,) in self.connection.execute(
+                "SELECT tag FROM context_tags WHERE context_seq = ?", (seq,))],
+            metadata=json.loads(metadata) if metadata else None,
+            parent_id=parent_id,
+            children_ids=json.loads(children_ids) if children_ids else None
+        )
+
+    def _cache_put(self, context: MCPContext):
+        self._cache[context.id] = context
+        self._cache.move_to_end(context.id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _touch_session(self, session: MCPSession):
+        self.connection.execute("UPDATE sessions SET updated_ts = ? WHERE id = ?",
+                                (session.updated_ts, session.id))
+
+    def _load_sessions(self):
+        """Carrega as sessões e seus membros do banco"""
+        for session_id, name, created_ts, updated_ts, metadata in self.connection.execute(
+                "SELECT id, name, created_ts, updated_ts, metadata FROM sessions"):
+            self.sessions[session_id] = MCPSession(
+                id=session_id, name=name, created_ts=created_ts, updated_ts=updated_ts,
+                metadata=json.loads(metadata) if metadata else None)
+        for session_id, context_id in self.connection.execute(
+                "SELECT sc.session_id, c.id FROM session_contexts sc "
+                "JOIN contexts c ON c.seq = sc.context_seq ORDER BY c.seq"):
+            self.sessions[session_id].members[context_id] = None
+
+    def _cleanup_expired_contexts(self):
+        """Remove contextos expirados usando o índice de expiração"""
+        expired = self.connection.execute(
+            "SELECT id FROM contexts WHERE expires_ts IS NOT NULL AND expires_ts < ?",
+            (time.time(),)).fetchall()
+        if expired:
+            self.remove_contexts(context_id for (context_id,) in expired)
+
+    def _evict_contexts(self, count: int):
+        """Despeja a menor prioridade e, dentro dela, os contextos mais antigos"""
+        if count <= 0:
+            return
+        victims = self.connection.execute(
+            "SELECT id FROM contexts ORDER BY priority, seq LIMIT ?", (count,)).fetchall()
+        self.remove_contexts(context_id for (context_id,) in victims)
@@ -0,0 +1,606 @@
+"""
+Formato binário de gravação do protocolo MCP
+
+``MCPProtocol.save`` grava em um único arquivo:
+
+    cabeçalho | conteúdos (JSON canônico de cada contexto) | buffers | metadados
+
+Os metadados são um pickle (protocolo 5) do estado do protocolo, inclusive
+índices, sem os conteúdos: cada contexto guarda apenas a posição do seu JSON
+no arquivo. Strings grandes, as mesmas que o ``PayloadStore`` deduplica em
+memória, são gravadas uma única vez (endereçadas pelo blake2b do literal
+JSON) e recortadas do JSON dos contextos que as usam.
+
+Os índices invertidos são gravados em arrays no formato CSR (postings por
+token e tokens por documento, com deslocamentos), não como dicionários.
+Arrays grandes, inclusive os do índice vetorial, saem do pickle como
+buffers fora de banda, alinhados no arquivo. ``MCPProtocol.load`` mapeia o
+arquivo com ``mmap`` e monta só o que é proporcional ao número de contextos;
+postings de um token, tokens de um documento e o conteúdo de um contexto
+são lidos no primeiro acesso, quando as strings grandes do conteúdo voltam
+a ser internadas no armazém de deduplicação do protocolo.
+"""
+
+import gc
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from itertools import chain
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+from .mcp import InvertedIndex, MCPContext, MCPProtocol, _LazyContent
+from .mcp_dedup import PayloadStore, content_digest
+
+MAGIC = b"MCPBIN01"
+
+# assinatura, início e tamanho dos conteúdos, início e quantidade da tabela
+# de buffers, início e tamanho dos metadados
+_HEADER = struct.Struct("<8s6Q")
+_BUFFER = struct.Struct("<QQ")  # início, tamanho
+_ALIGNMENT = 64
+# Buffers menores ficam dentro do próprio pickle
+_OUT_OF_BAND_MIN_BYTES = 64 * 1024
+
+# Estado de execução que não é gravado (caches, observadores e o armazém de
+# deduplicação, cujas strings já estão nos conteúdos gravados)
+_TRANSIENT = frozenset({"_listeners", "_text_cache", "_text_cache_bytes", "_query_cache",
+                        "query_cache_hits", "query_cache_misses", "payloads", "_payload_refs",
+                        "_lock", "_side_lock"})
+
+
+class _ContentSource:
+    """Arquivo mapeado de onde os conteúdos são lidos; associado após a carga
+
+    ``protocol`` é o protocolo que recebeu os contextos, cujo armazém de
+    deduplicação interna as strings de cada conteúdo lido.
+    """
+
+    __slots__ = ("buffer", "protocol")
+
+    def __init__(self):
+        self.buffer = None
+        self.protocol = None
+
+    def __reduce__(self):
+        return _ContentSource, ()
+
+    def decode(self, context: MCPContext, lazy: _LazyContent) -> Dict[str, Any]:
+        """Lê o conteúdo de ``context`` e o guarda no contexto"""
+        content = json.loads(lazy.raw())
+        if self.protocol is not None:
+            return self.protocol._adopt_content(context, lazy, content)
+        context._content = content
+        return content
+
+
+def _restore_context(id, context_type, priority, created_ts, updated_ts, expires_ts, tags, metadata,
+                     parent_id, children_ids, terms, content_hash, source, offset, length,
+                     shared=()) -> MCPContext:
+    context = MCPContext.__new__(MCPContext)
+    context.id = id
+    context.context_type = context_type
+    context._content = _LazyContent(source, offset, length, shared)
+    context.priority = priority
+    context.created_ts = created_ts
+    context.updated_ts = updated_ts
+    context.expires_ts = expires_ts
+    context._tags = tags
+    context._metadata = metadata
+    context.parent_id = parent_id
+    context._children_ids = children_ids
+    context._serialized = None
+    context._search_text = None
+    # Gravações atuais não guardam os tokens por contexto (ficam no índice)
+    context._terms = terms
+    context._hash = content_hash
+    context._tokens = None
+    return context
+
+
+_MISSING = object()
+
+
+class _FrozenMap(MutableMapping):
+    """Dicionário cujas entradas gravadas são decodificadas no primeiro acesso
+
+    ``pending`` associa cada chave ainda não lida à sua posição nos arrays
+    gravados e ``decode(posição)`` monta o valor. Entradas lidas, incluídas
+    ou alteradas passam a ficar em um dicionário comum. Leituras podem ser
+    concorrentes (trava de leitura do protocolo); alterações, não.
+    """
+
+    __slots__ = ("_items", "_pending", "_decode", "_lock")
+
+    def __init__(self, pending: Dict[Any, int], decode: Callable[[int], Any]):
+        self._items: Dict[Any, Any] = {}
+        self._pending = pending
+        self._decode = decode
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        value = self._items.get(key, _MISSING)
+        if value is _MISSING:
+            with self._lock:
+                value = self._items.get(key, _MISSING)
+                if value is _MISSING:
+                    # A chave fica visível durante toda a mudança de lugar
+                    value = self._items[key] = self._decode(self._pending[key])
+                    del self._pending[key]
+        return value
+
+    def get(self, key, default=None):
+        value = self._items.get(key, _MISSING)
+        if value is _MISSING:
+            return self[key] if key in self._pending else default
+        return value
+
+    def __contains__(self, key) -> bool:
+        return key in self._items or key in self._pending
+
+    def __setitem__(self, key, value):
+        self._pending.pop(key, None)
+        self._items[key] = value
+
+    def __delitem__(self, key):
+        if self._pending.pop(key, _MISSING) is _MISSING:
+            del self._items[key]
+
+    def __iter__(self):
+        # Cópia das chaves: ler valores durante a iteração move entradas de lugar
+        return iter(list(chain(self._items, self._pending)))
+
+    def __len__(self) -> int:
+        return len(self._items) + len(self._pending)
+
+    def iter_items(self):
+        """Pares (chave, valor) sem guardar os valores decodificados"""
+        yield from self._items.items()
+        for key, position in self._pending.items():
+            yield key, self._decode(position)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({dict(self.iter_items())!r})"
+
+    def __reduce__(self):
+        return dict, (dict(self.iter_items()),)
+
+
+def _ints(buffer, typecode: str = "i"):
+    """Array gravado (memória mapeada ou bytes do pickle) como sequência de inteiros"""
+    return memoryview(buffer).cast("B").cast(typecode)
+
+
+def _pack_index(index: InvertedIndex) -> tuple:
+    """Converte postings e tokens por documento em arrays CSR"""
+    def items(mapping):
+        return mapping.iter_items() if isinstance(mapping, _FrozenMap) else mapping.items()
+
+    ids = list(index.doc_terms)
+    doc_numbers = dict(zip(ids, range(len(ids))))
+    vocabulary = []
+    posting_offsets = array("q", [0])
+    posting_docs = array("i")
+    posting_tfs = array("i")
+    for term, postings in items(index.postings):
+        vocabulary.append(term)
+        posting_docs.extend(map(doc_numbers.__getitem__, postings))
+        posting_tfs.extend(postings.values())
+        posting_offsets.append(len(posting_docs))
+
+    term_numbers = dict(zip(vocabulary, range(len(vocabulary))))
+    doc_offsets = array("q", [0])
+    doc_tokens = array("i")
+    doc_tfs = array("i")
+    # Mesma ordem de ``ids``
+    for _, terms in items(index.doc_terms):
+        doc_tokens.extend(map(term_numbers.__getitem__, terms))
+        doc_tfs.extend(terms.values())
+        doc_offsets.append(len(doc_tokens))
+    lengths = array("i", map(index.doc_lengths.__getitem__, ids))
+    max_tf = array("i", map(index.max_tf.__getitem__, vocabulary))
+
+    arrays = (lengths, max_tf, posting_offsets, posting_docs, posting_tfs, doc_offsets, doc_tokens, doc_tfs)
+    return (ids, vocabulary, index.total_length, index.min_length,
+            *(pickle.PickleBuffer(values) for values in arrays))
+
+
+def _plain_index(postings, doc_terms, doc_lengths, total_length, max_tf, min_length) -> InvertedIndex:
+    index = InvertedIndex()
+    index.postings = postings
+    index.doc_terms = doc_terms
+    index.doc_lengths = doc_lengths
+    index.total_length = total_length
+    index.max_tf = max_tf
+    index.min_length = min_length
+    index._trigrams = None
+    return index
+
+
+class _StoredIndex(InvertedIndex):
+    """Índice invertido carregado de uma gravação
+
+    Os postings gravados de um token só viram dicionário quando lidos. Até
+    lá, documentos incluídos nesse token ficam em ``_added`` e documentos
+    gravados que saíram do índice, em ``_dead``; assim mutações (como a
+    reaplicação da cauda do log) não decodificam postings grandes.
+    """
+
+    def __init__(self, ids, vocabulary, total_length, min_length, lengths, max_tf,
+                 posting_offsets, posting_docs, posting_tfs, doc_offsets, doc_tokens, doc_tfs):
+        self._ids = ids
+        self._vocabulary = vocabulary
+        self._posting_offsets = _ints(posting_offsets, "q")
+        self._posting_docs = _ints(posting_docs)
+        self._posting_tfs = _ints(posting_tfs)
+        self._doc_offsets = _ints(doc_offsets, "q")
+        self._doc_tokens = _ints(doc_tokens)
+        self._doc_tfs = _ints(doc_tfs)
+        self._doc_numbers = dict(zip(ids, range(len(ids))))  # documentos gravados ainda presentes
+        self._dead = set()  # números dos documentos gravados que saíram
+        self._added: Dict[str, Dict[str, int]] = {}  # token não lido -> {documento novo: tf}
+        self._df: Dict[str, int] = {}  # token não lido e alterado -> frequência de documento
+
+        self.postings = _FrozenMap(dict(zip(vocabulary, range(len(vocabulary)))), self._decode_postings)
+        self.doc_terms = _FrozenMap(self._doc_numbers.copy(), self._decode_terms)
+        self.doc_lengths = dict(zip(ids, _ints(lengths)))
+        self.total_length = total_length
+        self.max_tf = dict(zip(vocabulary, _ints(max_tf)))
+        self.min_length = min_length
+        self._trigrams = None
+
+    def __reduce__(self):
+        # Fora do mcp_store (cópias, pickle comum) vira um índice comum
+        return _plain_index, (dict(self.postings.iter_items()), dict(self.doc_terms.iter_items()),
+                              self.doc_lengths, self.total_length, self.max_tf, self.min_length)
+
+    def _decode_postings(self, term_number: int) -> Dict[str, int]:
+        start, end = self._posting_offsets[term_number], self._posting_offsets[term_number + 1]
+        docs, tfs, ids = self._posting_docs[start:end], self._posting_tfs[start:end], self._ids
+        if self._dead:
+            dead = self._dead
+            postings = {ids[doc]: tf for doc, tf in zip(docs, tfs) if doc not in dead}
+        else:
+            postings = dict(zip(map(ids.__getitem__, docs), tfs))
+        added = self._added.get(self._vocabulary[term_number])
+        if added:
+            postings.update(added)
+        return postings
+
+    def _decode_terms(self, doc_number: int) -> Dict[str, int]:
+        start, end = self._doc_offsets[doc_number], self._doc_offsets[doc_number + 1]
+        return dict(zip(map(self._vocabulary.__getitem__, self._doc_tokens[start:end]), self._doc_tfs[start:end]))
+
+    def document_frequency(self, term: str) -> int:
+        postings = self.postings._items.get(term)
+        if postings is not None:
+            return len(postings)
+        df = self._df.get(term)
+        if df is not None:
+            return df
+        number = self.postings._pending.get(term)
+        if number is None:
+            return 0
+        return self._posting_offsets[number + 1] - self._posting_offsets[number]
+
+    def add(self, doc_id: str, terms: Dict[str, int]):
+        stored = self.postings._pending
+        if not any(term in stored for term in terms):
+            super().add(doc_id, terms)
+            return
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        self.doc_terms[doc_id] = terms
+        length = sum(terms.values())
+        self.min_length = length if len(self.doc_terms) == 1 else min(self.min_length, length)
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+        offsets, frequencies, items = self._posting_offsets, self._df, self.postings._items
+        for term, tf in terms.items():
+            number = stored.get(term)
+            if number is not None:
+                df = frequencies.get(term)
+                if df is None:
+                    df = offsets[number + 1] - offsets[number]
+                frequencies[term] = df + 1
+                self._added.setdefault(term, {})[doc_id] = tf
+            else:
+                postings = items.get(term)
+                if postings is None:
+                    postings = self.postings[term] = {}
+                    self.max_tf[term] = tf
+                    if self._trigrams is not None:
+                        for gram in self._grams(term):
+                            self._trigrams.setdefault(gram, set()).add(term)
+                postings[doc_id] = tf
+            if tf > self.max_tf[term]:
+                self.max_tf[term] = tf
+
+    def remove(self, doc_id: str) -> bool:
+        terms = self.doc_terms.get(doc_id)
+        if terms is None:
+            return False
+        stored = self.postings._pending
+        if not any(term in stored for term in terms):
+            self._doc_numbers.pop(doc_id, None)
+            return super().remove(doc_id)
+        del self.doc_terms[doc_id]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        doc_number = self._doc_numbers.pop(doc_id, None)
+        if doc_number is not None:
+            self._dead.add(doc_number)
+        offsets, frequencies = self._posting_offsets, self._df
+        for term in terms:
+            number = stored.get(term)
+            if number is not None:
+                df = frequencies.get(term)
+                if df is None:
+                    df = offsets[number + 1] - offsets[number]
+                df -= 1
+                if doc_number is None:
+                    del self._added[term][doc_id]
+                frequencies[term] = df
+                if df:
+                    continue
+                del self.postings[term]
+                self._added.pop(term, None)
+                del self._df[term]
+            else:
+                postings = self.postings[term]
+                del postings[doc_id]
+                if postings:
+                    continue
+                del self.postings[term]
+            del self.max_tf[term]
+            if self._trigrams is not None:
+                for gram in self._grams(term):
+                    vocab = self._trigrams[gram]
+                    vocab.discard(term)
+                    if not vocab:
+                        del self._trigrams[gram]
+        return True
+
+
+class _StorePickler(pickle.Pickler):
+    """Pickler que grava contextos com referência ao conteúdo e índices invertidos como arrays"""
+
+    def __init__(self, file, source: _ContentSource, offsets: Dict[str, Tuple[int, int, tuple]], **kwargs):
+        super().__init__(file, protocol=5, **kwargs)
+        self._source = source
+        self._offsets = offsets
+
+    def reducer_override(self, obj):
+        if isinstance(obj, InvertedIndex):
+            return _StoredIndex, _pack_index(obj)
+        if obj.__class__ is not MCPContext:
+            return NotImplemented
+        offset, length, shared = self._offsets[obj.id]
+        return _restore_context, (
+            obj.id, obj.context_type, obj.priority, obj.created_ts, obj.updated_ts, obj.expires_ts,
+            obj._tags, obj._metadata, obj.parent_id, obj._children_ids, None, obj._hash,
+            self._source, offset, length, shared
+        )
+
+
+def _has_shared(value: Any, min_length: int) -> bool:
+    """Indica se há strings grandes em ``value`` ou em dicionários e listas aninhados"""
+    for item in value.values() if isinstance(value, dict) else value:
+        if isinstance(item, str):
+            if len(item) >= min_length:
+                return True
+        elif isinstance(item, (dict, list)) and _has_shared(item, min_length):
+            return True
+    return False
+
+
+def _json_parts(value: Any, min_length: int, parts: List[Any]):
+    """Acrescenta a ``parts`` o JSON canônico de ``value``, idêntico ao de ``json.dumps``
+
+    As strings grandes de dicionários e listas, como no ``PayloadStore``,
+    entram em ``parts`` como tuplas ``(string,)``.
+    """
+    if isinstance(value, dict) and all(key.__class__ is str for key in value):
+        parts.append("{")
+        for i, key in enumerate(sorted(value)):
+            parts.append(f"{', ' if i else ''}{json.dumps(key)}: ")
+            _json_item_parts(value[key], min_length, parts)
+        parts.append("}")
+    elif isinstance(value, list):
+        parts.append("[")
+        for i, item in enumerate(value):
+            if i:
+                parts.append(", ")
+            _json_item_parts(item, min_length, parts)
+        parts.append("]")
+    else:
+        parts.append(json.dumps(value, sort_keys=True))
+
+
+def _json_item_parts(value: Any, min_length: int, parts: List[Any]):
+    if isinstance(value, str) and len(value) >= min_length:
+        parts.append((value,))
+    elif isinstance(value, (dict, list)) and _has_shared(value, min_length):
+        _json_parts(value, min_length, parts)
+    else:
+        parts.append(json.dumps(value, sort_keys=True))
+
+
+class _ContentWriter:
+    """Grava os conteúdos dos contextos, cada string grande uma única vez"""
+
+    def __init__(self, file, min_length: int):
+        self.file = file
+        self.min_length = min_length
+        self._located: Dict[bytes, Tuple[int, int]] = {}  # digest do literal -> (início, tamanho)
+        # id da string, ou (id da origem, início) para strings de um arquivo
+        # ainda não lidas, -> (início, tamanho), para não recalcular o digest
+        self._known: Dict[Any, Tuple[int, int]] = {}
+
+    def write(self, context: MCPContext) -> Tuple[int, int, Tuple[int, ...]]:
+        """Grava o conteúdo e retorna (início, tamanho, cortes) para ``_LazyContent``"""
+        content = context._content
+        shared: List[int] = []
+        if content.__class__ is _LazyContent:
+            # Conteúdo ainda não lido de uma gravação anterior: copia os bytes
+            buffer = content.source.buffer
+            own = buffer[content.offset:content.offset + content.length]
+            for i in range(0, len(content.shared), 3):
+                cut, start, length = content.shared[i:i + 3]
+                key = (id(content.source), start)
+                location = self._known.get(key)
+                if location is None:
+                    location = self._locate(key, buffer[start:start + length])
+                shared.extend((cut, *location))
+        elif _has_shared(content, self.min_length):
+            parts: List[Any] = []
+            _json_parts(content, self.min_length, parts)
+            chunks = []
+            size = 0
+            for part in parts:
+                if part.__class__ is tuple:
+                    value = part[0]
+                    location = self._known.get(id(value))
+                    if location is None:
+                        location = self._locate(id(value), json.dumps(value).encode())
+                    shared.extend((size, *location))
+                else:
+                    chunk = part.encode()
+                    chunks.append(chunk)
+                    size += len(chunk)
+            own = b"".join(chunks)
+        else:
+            own = context.serialized_content(cache=False).encode()
+        offset = self.file.tell()
+        self.file.write(own)
+        return offset, len(own), tuple(shared)
+
+    def _locate(self, key: Any, literal: bytes) -> Tuple[int, int]:
+        digest = content_digest(literal)
+        location = self._located.get(digest)
+        if location is None:
+            location = self._located[digest] = (self.file.tell(), len(literal))
+            self.file.write(literal)
+        self._known[key] = location
+        return location
+
+
+def _pad(file) -> int:
+    position = file.tell()
+    padding = -position % _ALIGNMENT
+    file.write(b"\0" * padding)
+    return position + padding
+
+
+def save_protocol(protocol: MCPProtocol, path: str):
+    """Grava o protocolo em ``path`` (substituição atômica do arquivo)"""
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(b"\0" * _HEADER.size)
+
+        content_offset = file.tell()
+        writer = _ContentWriter(file, protocol.payloads.min_length)
+        offsets = {context_id: writer.write(context) for context_id, context in protocol.contexts.items()}
+        content_length = file.tell() - content_offset
+
+        source = _ContentSource()
+        state = {name: value for name, value in vars(protocol).items() if name not in _TRANSIENT}
+        buffers: List[pickle.PickleBuffer] = []
+
+        def keep_large_buffers(buffer: pickle.PickleBuffer) -> bool:
+            if buffer.raw().nbytes < _OUT_OF_BAND_MIN_BYTES:
+                return True
+            buffers.append(buffer)
+            return False
+
+        metadata = io.BytesIO()
+        _StorePickler(metadata, source, offsets, buffer_callback=keep_large_buffers).dump(
+            {"protocol": state, "source": source, "dedup_min_length": protocol.payloads.min_length})
+
+        table = []
+        for buffer in buffers:
+            raw = buffer.raw()
+            start = _pad(file)
+            file.write(raw)
+            table.append((start, raw.nbytes))
+        buffers_offset = file.tell()
+        for entry in table:
+            file.write(_BUFFER.pack(*entry))
+
+        metadata_offset = file.tell()
+        file.write(metadata.getbuffer())
+        metadata_length = file.tell() - metadata_offset
+
+        file.seek(0)
+        file.write(_HEADER.pack(MAGIC, content_offset, content_length, buffers_offset, len(table),
+                                metadata_offset, metadata_length))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def _read_saved(path: str) -> Dict[str, Any]:
+    """Mapeia o arquivo e carrega os metadados gravados por ``save_protocol``"""
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    if len(buffer) < _HEADER.size:
+        raise ValueError(f"Arquivo inválido para o protocolo MCP: {path}")
+    magic, _, _, buffers_offset, buffer_count, metadata_offset, metadata_length = \
+        _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"Arquivo inválido para o protocolo MCP: {path}")
+
+    view = memoryview(buffer)
+    buffers = []
+    for i in range(buffer_count):
+        start, length = _BUFFER.unpack_from(buffer, buffers_offset + i * _BUFFER.size)
+        buffers.append(view[start:start + length])
+    # Milhões de objetos novos disparariam coletas completas repetidas do gc
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        saved: Dict[str, Any] = pickle.loads(view[metadata_offset:metadata_offset + metadata_length],
+                                             buffers=buffers)
+    finally:
+        if enabled:
+            gc.enable()
+    saved["source"].buffer = buffer
+    return saved
+
+
+def load_protocol(path: str, cls: Type[MCPProtocol] = MCPProtocol,
+                  thread_safe: bool = False) -> MCPProtocol:
+    """Abre um protocolo gravado com ``save_protocol``
+
+    O arquivo fica mapeado (cópia na escrita, para que arrays NumPy possam
+    ser alterados) enquanto houver contextos com conteúdo não lido.
+    """
+    saved = _read_saved(path)
+    protocol = cls(dedup_min_length=saved["dedup_min_length"], thread_safe=thread_safe)
+    vars(protocol).update(saved["protocol"])
+    saved["source"].protocol = protocol
+    return protocol
+
+
+def restore_protocol(protocol: MCPProtocol, path: str) -> MCPProtocol:
+    """Substitui o estado de um protocolo existente pelo gravado em ``path``
+
+    Como em ``load_protocol``, a configuração gravada (pontuação, limites)
+    também é adotada. Travas e observadores do protocolo são mantidos;
+    caches recomeçam vazios e o armazém de deduplicação é preenchido à
+    medida que os conteúdos são lidos.
+    """
+    saved = _read_saved(path)
+    vars(protocol).update(saved["protocol"])
+    saved["source"].protocol = protocol
+    protocol.payloads = PayloadStore(saved["dedup_min_length"])
+    protocol._payload_refs = {}
+    protocol._text_cache = OrderedDict()
+    protocol._text_cache_bytes = 0
+    protocol._query_cache = OrderedDict()
+    return protocol
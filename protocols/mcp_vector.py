@@ -0,0 +1,347 @@
+"""Busca vetorial local para o protocolo MCP
+
+Embeddings por feature hashing (tokens e n-gramas de caracteres), sem
+download de modelos nem chamadas de rede, armazenados em uma matriz NumPy
+contígua que cresce sob demanda.
+"""
+
+import math
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende do ambiente
+    np = None
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("A busca vetorial do MCP requer NumPy: pip install numpy")
+
+
+def _search_ids(index, query: "np.ndarray", item_ids, k: int) -> List[Tuple[float, str]]:
+    """Busca exata restrita a um subconjunto de itens de um índice"""
+    ids = [item_id for item_id in item_ids if item_id in index.rows]
+    if k <= 0 or not ids:
+        return []
+    scores = index.matrix[[index.rows[item_id] for item_id in ids]] @ query
+    if k < scores.size:
+        top = np.argpartition(scores, -k)[-k:]
+    else:
+        top = np.arange(scores.size)
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(float(scores[i]), ids[i]) for i in top]
+
+
+class HashedEmbedder:
+    """Gera embeddings por feature hashing de tokens e n-gramas de caracteres.
+
+    Cada feature é mapeada para uma dimensão (crc32 módulo ``dim``) com sinal
+    derivado do mesmo hash, o que reduz o viés de colisões. As contagens de
+    cada token são amortecidas com 1 + log(tf) e o vetor final é normalizado
+    (norma L2), de modo que o produto interno equivale à similaridade de
+    cosseno. As features já calculadas de cada token ficam em cache.
+    """
+
+    def __init__(self, dim: int = 128, ngram_range: Tuple[int, int] = (3, 4),
+                 token_weight: float = 2.0, cache_size: int = 100000):
+        _require_numpy()
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.token_weight = token_weight
+        self.cache_size = cache_size
+        self._token_cache: Dict[str, Tuple["np.ndarray", "np.ndarray"]] = {}
+
+    def features(self, token: str) -> List[Tuple[str, float]]:
+        """Extrai as features (o próprio token e seus n-gramas) de um token"""
+        features = [("#" + token, self.token_weight)]
+        min_n, max_n = self.ngram_range
+        padded = f"<{token}>"
+        for n in range(min_n, max_n + 1):
+            for i in range(len(padded) - n + 1):
+                features.append((padded[i:i + n], 1.0))
+        return features
+
+    def embed(self, text: str) -> "np.ndarray":
+        """Gera o embedding normalizado de um texto"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        counts = Counter(_TOKEN_RE.findall(text.lower()))
+        if not counts:
+            return vector
+        for token, count in counts.items():
+            indices, values = self._hashed_token(token)
+            np.add.at(vector, indices, values * (1.0 + math.log(count)))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def _hashed_token(self, token: str) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Dimensões e pesos com sinal das features de um token (com cache)"""
+        cached = self._token_cache.get(token)
+        if cached is not None:
+            return cached
+        features = self.features(token)
+        indices = np.empty(len(features), dtype=np.int64)
+        values = np.empty(len(features), dtype=np.float32)
+        for i, (feature, weight) in enumerate(features):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            indices[i] = digest % self.dim
+            values[i] = weight if digest & 0x80000000 else -weight
+        if len(self._token_cache) >= self.cache_size:
+            self._token_cache.clear()
+        self._token_cache[token] = (indices, values)
+        return indices, values
+
+
+class VectorIndex:
+    """Matriz contígua de embeddings com busca exata por produto interno.
+
+    As linhas ocupadas ficam sempre no início da matriz: uma remoção move a
+    última linha para a posição liberada, então a busca é um único produto
+    matriz-vetor seguido de ``argpartition``.
+    """
+
+    def __init__(self, dim: int, initial_capacity: int = 1024):
+        _require_numpy()
+        self.dim = dim
+        self.matrix = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self.ids: List[str] = []  # linha -> id
+        self.rows: Dict[str, int] = {}  # id -> linha
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.rows
+
+    def add(self, item_id: str, vector: "np.ndarray"):
+        """Insere ou substitui o vetor de um item"""
+        row = self.rows.get(item_id)
+        if row is None:
+            row = len(self.ids)
+            if row == self.matrix.shape[0]:
+                self._grow()
+            self.ids.append(item_id)
+            self.rows[item_id] = row
+        self.matrix[row] = vector
+
+    def remove(self, item_id: str) -> bool:
+        """Remove um item movendo a última linha para o espaço liberado"""
+        row = self.rows.pop(item_id, None)
+        if row is None:
+            return False
+        last = len(self.ids) - 1
+        if row != last:
+            moved = self.ids[last]
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+        self.ids.pop()
+        return True
+
+    def vector(self, item_id: str) -> Optional["np.ndarray"]:
+        """Retorna o vetor armazenado de um item"""
+        row = self.rows.get(item_id)
+        return None if row is None else self.matrix[row]
+
+    def search(self, query: "np.ndarray", k: int) -> List[Tuple[float, str]]:
+        """Retorna os k itens de maior produto interno com a query"""
+        count = len(self.ids)
+        if k <= 0 or count == 0:
+            return []
+        scores = self.matrix[:count] @ query
+        if k < count:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(float(scores[row]), self.ids[row]) for row in top]
+
+    def search_ids(self, query: "np.ndarray", item_ids, k: int) -> List[Tuple[float, str]]:
+        """Busca exata apenas entre os itens informados"""
+        return _search_ids(self, query, item_ids, k)
+
+    def _grow(self):
+        capacity = max(1, self.matrix.shape[0]) * 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:len(self.ids)] = self.matrix[:len(self.ids)]
+        self.matrix = matrix
+
+
+class IVFIndex:
+    """Índice aproximado IVF (inverted file) sobre embeddings normalizados.
+
+    Os vetores são agrupados por k-means esférico em ``n_lists`` centróides;
+    uma busca pontua apenas as listas dos ``n_probe`` centróides mais
+    próximos da query, trocando recall por latência. Inserções são
+    atribuídas ao centróide mais próximo e remoções viram tombstones, que
+    são compactados quando passam de ``compact_ratio`` das linhas. Abaixo de
+    ``train_size`` vetores, ou antes do primeiro treino, a busca é exata; o
+    agrupamento é refeito quando o índice cresce ``retrain_growth`` vezes.
+    """
+
+    def __init__(self, dim: int, n_probe: int = 32, n_lists: Optional[int] = None,
+                 train_size: int = 10000, retrain_growth: float = 4.0,
+                 compact_ratio: float = 0.25, kmeans_iterations: int = 10, seed: int = 0):
+        _require_numpy()
+        self.dim = dim
+        self.n_probe = n_probe
+        self.n_lists = n_lists
+        self.train_size = train_size
+        self.retrain_growth = retrain_growth
+        self.compact_ratio = compact_ratio
+        self.kmeans_iterations = kmeans_iterations
+        self._rng = np.random.default_rng(seed)
+        self.matrix = np.zeros((1024, dim), dtype=np.float32)
+        self.alive = np.zeros(1024, dtype=bool)
+        self.ids: List[Optional[str]] = []  # linha -> id (None para tombstones)
+        self.rows: Dict[str, int] = {}  # id -> linha
+        self.tombstones = 0
+        self.centroids: Optional["np.ndarray"] = None
+        self._lists: List["np.ndarray"] = []
+        self._list_sizes: List[int] = []
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.rows
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def add(self, item_id: str, vector: "np.ndarray"):
+        """Insere ou substitui o vetor de um item"""
+        if item_id in self.rows:
+            self.remove(item_id)
+        row = len(self.ids)
+        if row == self.matrix.shape[0]:
+            self._grow()
+        self.matrix[row] = vector
+        self.alive[row] = True
+        self.ids.append(item_id)
+        self.rows[item_id] = row
+
+        if self.is_trained:
+            self._append_to_list(int(np.argmax(self.centroids @ vector)), row)
+            if len(self.rows) >= self._trained_size * self.retrain_growth:
+                self.train()
+        elif len(self.rows) >= self.train_size:
+            self.train()
+
+    def remove(self, item_id: str) -> bool:
+        """Marca o item como removido (tombstone)"""
+        row = self.rows.pop(item_id, None)
+        if row is None:
+            return False
+        self.alive[row] = False
+        self.ids[row] = None
+        self.tombstones += 1
+        if self.tombstones > self.compact_ratio * len(self.ids):
+            self.compact()
+        return True
+
+    def vector(self, item_id: str) -> Optional["np.ndarray"]:
+        """Retorna o vetor armazenado de um item"""
+        row = self.rows.get(item_id)
+        return None if row is None else self.matrix[row]
+
+    def search(self, query: "np.ndarray", k: int, n_probe: Optional[int] = None) -> List[Tuple[float, str]]:
+        """Retorna aproximadamente os k itens de maior produto interno com a query"""
+        if k <= 0 or not self.rows:
+            return []
+        if self.is_trained:
+            probes = min(n_probe or self.n_probe, len(self._lists))
+            centroid_scores = self.centroids @ query
+            nearest = np.argpartition(centroid_scores, -probes)[-probes:]
+            candidates = np.concatenate([self._lists[c][:self._list_sizes[c]] for c in nearest])
+            candidates = candidates[self.alive[candidates]]
+        else:
+            candidates = np.flatnonzero(self.alive[:len(self.ids)])
+        if candidates.size == 0:
+            return []
+        scores = self.matrix[candidates] @ query
+        if k < scores.size:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(scores.size)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(float(scores[i]), self.ids[candidates[i]]) for i in top]
+
+    def search_ids(self, query: "np.ndarray", item_ids, k: int) -> List[Tuple[float, str]]:
+        """Busca exata apenas entre os itens informados"""
+        return _search_ids(self, query, item_ids, k)
+
+    def train(self):
+        """Agrupa os vetores atuais por k-means esférico e refaz as listas"""
+        self.compact()
+        count = len(self.ids)
+        if count == 0:
+            return
+        n_lists = self.n_lists or max(1, int(2 * math.sqrt(count)))
+        n_lists = min(n_lists, count)
+        data = self.matrix[:count]
+        sample = data[self._rng.choice(count, size=min(count, n_lists * 32), replace=False)]
+        centroids = sample[self._rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+
+        self.centroids = centroids
+        self._lists = [np.empty(16, dtype=np.int64) for _ in range(n_lists)]
+        self._list_sizes = [0] * n_lists
+        for start in range(0, count, 8192):
+            block = np.argmax(data[start:start + 8192] @ centroids.T, axis=1)
+            for offset, centroid in enumerate(block):
+                self._append_to_list(int(centroid), start + offset)
+        self._trained_size = count
+
+    def compact(self):
+        """Remove os tombstones reescrevendo a matriz e as listas"""
+        if not self.tombstones:
+            return
+        count = len(self.ids)
+        keep = np.flatnonzero(self.alive[:count])
+        self.matrix[:keep.size] = self.matrix[keep]
+        self.alive[:count] = False
+        self.alive[:keep.size] = True
+        self.ids = [self.ids[row] for row in keep]
+        self.rows = {item_id: row for row, item_id in enumerate(self.ids)}
+        self.tombstones = 0
+        if self.is_trained:
+            remap = np.full(count, -1, dtype=np.int64)
+            remap[keep] = np.arange(keep.size)
+            for c, size in enumerate(self._list_sizes):
+                members = remap[self._lists[c][:size]]
+                members = members[members >= 0]
+                self._lists[c][:members.size] = members
+                self._list_sizes[c] = members.size
+
+    def _append_to_list(self, centroid: int, row: int):
+        members = self._lists[centroid]
+        size = self._list_sizes[centroid]
+        if size == members.size:
+            members = self._lists[centroid] = np.resize(members, size * 2)
+        members[size] = row
+        self._list_sizes[centroid] = size + 1
+
+    def _grow(self):
+        capacity = self.matrix.shape[0] * 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:len(self.ids)] = self.matrix[:len(self.ids)]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self.ids)] = self.alive[:len(self.ids)]
+        self.matrix = matrix
+        self.alive = alive
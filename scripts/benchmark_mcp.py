@@ -0,0 +1,864 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks do protocolo MCP
+
+Gera um acervo sintético de contextos e mede latência e qualidade das
+buscas do MCPProtocol. Cada subcomando cobre um aspecto:
+
+    python scripts/benchmark_mcp.py bm25 --contexts 20000 --queries 200
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from protocols.mcp import (  # noqa: E402
+    MCPProtocol, MCPContext, ContextType, ContextPriority, ScoringMethod
+)
+
+
+def make_vocabulary(size: int, rng: random.Random) -> List[str]:
+    """Cria um vocabulário de pseudo-palavras"""
+    syllables = ["ma", "ga", "ba", "ta", "ri", "lo", "ne", "su", "pe", "do", "ca", "vi"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_contexts(count: int, vocabulary: List[str], seed: int = 7) -> List[MCPContext]:
+    """Gera contextos com distribuição de palavras aproximadamente Zipf"""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    contexts = []
+    for _ in range(count):
+        length = rng.randint(5, 80)
+        text = " ".join(rng.choices(vocabulary, weights=weights, k=length))
+        contexts.append(MCPContext.create(
+            context_type=rng.choice(list(ContextType)),
+            content={"message": text},
+            priority=rng.choice(list(ContextPriority)),
+            tags=rng.sample(vocabulary[:50], 2)
+        ))
+    return contexts
+
+
+def make_queries(count: int, vocabulary: List[str], seed: int = 11) -> List[str]:
+    """Gera queries curtas com palavras de frequência média"""
+    rng = random.Random(seed)
+    pool = vocabulary[20:500]
+    return [" ".join(rng.sample(pool, rng.randint(1, 4))) for _ in range(count)]
+
+
+def build_protocol(contexts: List[MCPContext], **kwargs) -> MCPProtocol:
+    """Carrega os contextos em um novo protocolo"""
+    protocol = MCPProtocol(max_contexts=len(contexts) + 1, **kwargs)
+    for context in contexts:
+        protocol.add_context(context)
+    return protocol
+
+
+def time_queries(search: Callable[[str], List[MCPContext]], queries: List[str]) -> Dict[str, float]:
+    """Mede latência por query em milissegundos"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "mean": statistics.mean(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+
+def print_latency(label: str, stats: Dict[str, float]):
+    """Imprime estatísticas de latência"""
+    print(f"  {label:<24} média {stats['mean']:8.3f} ms | p50 {stats['p50']:8.3f} ms | p99 {stats['p99']:8.3f} ms")
+
+
+def overlap_at_k(first: List[MCPContext], second: List[MCPContext]) -> float:
+    """Fração de contextos em comum entre dois top-k"""
+    if not first and not second:
+        return 1.0
+    ids = {ctx.id for ctx in first}
+    return len(ids & {ctx.id for ctx in second}) / max(len(first), len(second))
+
+
+def bench_bm25(args):
+    """Compara a pontuação por palavras-chave com BM25"""
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+    queries = make_queries(args.queries, vocabulary)
+
+    print(f"📊 BM25 vs palavras-chave: {args.contexts} contextos, {args.queries} queries, k={args.k}")
+    keyword = build_protocol(contexts)
+    bm25 = build_protocol(contexts, scoring=ScoringMethod.BM25)
+
+    print_latency("palavras-chave", time_queries(lambda q: keyword.get_relevant_contexts(q, args.k), queries))
+    print_latency("bm25", time_queries(lambda q: bm25.get_relevant_contexts(q, args.k), queries))
+
+    agreement = [
+        overlap_at_k(keyword.get_relevant_contexts(q, args.k), bm25.get_relevant_contexts(q, args.k))
+        for q in queries
+    ]
+    print(f"  concordância top-{args.k}: {statistics.mean(agreement):.1%}")
+
+
+def bench_topk(args):
+    """Mede a seleção top-k com MaxScore contra a ordenação completa"""
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+    # Queries reais misturam palavras comuns (listas longas) com termos raros
+    rng = random.Random(5)
+    queries = [f"{rng.choice(vocabulary[:10])} {q}" for q in make_queries(args.queries, vocabulary)]
+    protocol = MCPProtocol(max_contexts=len(contexts) + 1, scoring=ScoringMethod.BM25)
+    index = protocol.term_index
+
+    def exhaustive(query: str, k: int):
+        scores = index.bm25_scores(query.split())
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+    print(f"📊 Top-k BM25 (MaxScore) vs ordenação completa, {args.queries} queries")
+    loaded = 0
+    for size in sorted({args.contexts // 4, args.contexts // 2, args.contexts}):
+        for context in contexts[loaded:size]:
+            protocol.add_context(context)
+        loaded = size
+        print(f" {size} contextos")
+        for k in (args.k, args.k * 10):
+            print_latency(f"ordenação k={k}", time_queries(lambda q: exhaustive(q, k), queries))
+            print_latency(f"maxscore k={k}", time_queries(lambda q: index.bm25_top_k(q.split(), k), queries))
+
+
+def bench_vector(args):
+    """Mede a busca vetorial exata em uma matriz NumPy"""
+    from protocols.mcp_vector import HashedEmbedder, VectorIndex
+
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    queries = make_queries(args.queries, vocabulary)
+    embedder = HashedEmbedder(dim=args.dim)
+    index = VectorIndex(embedder.dim)
+
+    print(f"📊 Busca vetorial: {args.contexts} contextos, dim={args.dim}, k={args.k}")
+    start = time.perf_counter()
+    batch = 10000
+    for offset in range(0, args.contexts, batch):
+        for context in make_contexts(min(batch, args.contexts - offset), vocabulary, seed=offset):
+            index.add(context.id, embedder.embed(context.content["message"]))
+    print(f"  indexação: {time.perf_counter() - start:.1f} s")
+
+    vectors = [embedder.embed(q) for q in queries]
+    print_latency("embedding da query", time_queries(embedder.embed, queries))
+    print_latency("produto + argpartition", time_queries(lambda v: index.search(v, args.k), vectors))
+
+
+def make_embeddings(count: int, vocabulary: List[str], dim: int):
+    """Gera embeddings de textos sintéticos com distribuição Zipf"""
+    from protocols.mcp_vector import HashedEmbedder
+
+    embedder = HashedEmbedder(dim=dim)
+    rng = random.Random(13)
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    for _ in range(count):
+        yield embedder.embed(" ".join(rng.choices(vocabulary, weights=weights, k=rng.randint(5, 40))))
+
+
+def bench_ann(args):
+    """Compara o índice IVF com a busca exata em recall@k e latência"""
+    from protocols.mcp_vector import HashedEmbedder, IVFIndex, VectorIndex
+
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    embedder = HashedEmbedder(dim=args.dim)
+    queries = [embedder.embed(q) for q in make_queries(args.queries, vocabulary)]
+    exact = VectorIndex(args.dim)
+    ivf = IVFIndex(args.dim, n_lists=args.lists)
+
+    print(f"📊 IVF vs busca exata: {args.contexts} contextos, dim={args.dim}, k={args.k}")
+    start = time.perf_counter()
+    for i, vector in enumerate(make_embeddings(args.contexts, vocabulary, args.dim)):
+        exact.add(str(i), vector)
+        ivf.add(str(i), vector)
+    print(f"  indexação (ambos, com treino do IVF): {time.perf_counter() - start:.1f} s, "
+          f"{len(ivf._lists)} listas")
+
+    print_latency("exata", time_queries(lambda q: exact.search(q, args.k), queries))
+    expected = [{item_id for _, item_id in exact.search(q, args.k)} for q in queries]
+    for n_probe in (1, 4, 8, 16, 32, 64):
+        stats = time_queries(lambda q: ivf.search(q, args.k, n_probe=n_probe), queries)
+        recall = statistics.mean(
+            len(wanted & {item_id for _, item_id in ivf.search(q, args.k, n_probe=n_probe)}) / args.k
+            for q, wanted in zip(queries, expected)
+        )
+        print_latency(f"ivf n_probe={n_probe} r={recall:.2f}", stats)
+
+
+def bench_insert(args):
+    """Mede a latência de inserção conforme o acervo cresce"""
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+    rng = random.Random(17)
+    for context in contexts:
+        if rng.random() < args.expiring:
+            context.expires_at = (datetime.now() + timedelta(hours=rng.randint(1, 48))).isoformat()
+
+    print(f"📊 Inserção: {args.contexts} contextos, {args.expiring:.0%} com expiração")
+    protocol = MCPProtocol(max_contexts=len(contexts) + 1)
+    checkpoints = {len(contexts) // 4, len(contexts) // 2, len(contexts)}
+    latencies = []
+    for count, context in enumerate(contexts, start=1):
+        start = time.perf_counter()
+        protocol.add_context(context)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if count in checkpoints:
+            window = sorted(latencies[-1000:])
+            print(f"  {count:>8} contextos: média {statistics.mean(window):.4f} ms | "
+                  f"p99 {window[int(len(window) * 0.99) - 1]:.4f} ms")
+
+
+def bench_eviction(args):
+    """Mede a latência de inserção com o acervo cheio para cada política"""
+    from protocols.mcp_eviction import EvictionMethod
+
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.capacity + args.inserts, vocabulary)
+    rng = random.Random(19)
+
+    print(f"📊 Despejo: capacidade {args.capacity}, {args.inserts} inserções com o acervo cheio")
+    for method in EvictionMethod:
+        protocol = MCPProtocol(max_contexts=args.capacity, eviction=method)
+        for context in contexts[:args.capacity]:
+            protocol.add_context(context)
+        loaded = contexts[:args.capacity]
+
+        latencies = []
+        for context in contexts[args.capacity:]:
+            for _ in range(3):
+                protocol.get_context(rng.choice(loaded).id)
+            start = time.perf_counter()
+            protocol.add_context(context)
+            latencies.append((time.perf_counter() - start) * 1000)
+            loaded.append(context)
+        latencies.sort()
+        stats = protocol.eviction.get_stats()
+        print(f"  {method.value:<9} média {statistics.mean(latencies):.4f} ms | "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.4f} ms | "
+              f"máx {latencies[-1]:.4f} ms | despejos {stats['evictions']}")
+
+
+def bench_bulk(args):
+    """Compara a carga item a item com add_contexts"""
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+
+    print(f"📊 Carga em lote: {args.contexts} contextos, capacidade {args.capacity}")
+    protocol = MCPProtocol(max_contexts=args.capacity)
+    start = time.perf_counter()
+    for context in contexts:
+        protocol.add_context(context)
+    print(f"  add_context em laço      {time.perf_counter() - start:8.2f} s")
+
+    protocol = MCPProtocol(max_contexts=args.capacity)
+    start = time.perf_counter()
+    protocol.add_contexts(iter(contexts))
+    print(f"  add_contexts             {time.perf_counter() - start:8.2f} s")
+
+    start = time.perf_counter()
+    protocol.remove_contexts(list(protocol.contexts))
+    print(f"  remove_contexts          {time.perf_counter() - start:8.2f} s")
+
+
+def bench_sessions(args):
+    """Compara a busca global com a busca restrita à sessão"""
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+    queries = make_queries(args.queries, vocabulary)
+
+    print(f"📊 Busca por sessão: {args.contexts} contextos em {args.sessions} sessões")
+    for scoring in (ScoringMethod.KEYWORD, ScoringMethod.BM25):
+        protocol = MCPProtocol(max_contexts=len(contexts) + 1, scoring=scoring, query_cache_size=0)
+        sessions = [protocol.create_session(f"s{i}") for i in range(args.sessions)]
+        for i, context in enumerate(contexts):
+            protocol.add_context(context, session_id=sessions[i % len(sessions)])
+        session_id = sessions[0]
+        print_latency(f"{scoring.value} global", time_queries(
+            lambda q: protocol.get_relevant_contexts(q, 5), queries))
+        print_latency(f"{scoring.value} sessão", time_queries(
+            lambda q: protocol.get_relevant_contexts(q, 5, session_id=session_id), queries))
+
+
+def bench_recovery(args):
+    """Mede gravação do snapshot, recuperação e a alternativa de reaplicar o log inteiro
+
+    Com ``--batch`` menor que ``--contexts`` o acervo é montado em rodadas
+    (recupera, insere um lote, grava snapshot e fecha), o que mantém na
+    memória só o que a recuperação carrega; nesse modo não há log completo
+    para reaplicar. Com ``--directory`` o log fica no diretório indicado e um
+    acervo já montado lá é reaproveitado.
+    """
+    import contextlib
+    import tempfile
+
+    from protocols.mcp_log import MCPLog
+
+    if args.recover_only and not args.directory:
+        raise SystemExit("--recover-only exige --directory")
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    batch = min(args.batch or args.contexts, args.contexts)
+    capacity = args.contexts + args.tail + 1
+
+    print(f"📊 Recuperação: {args.contexts} contextos, cauda de {args.tail} mutações")
+    with contextlib.ExitStack() as stack:
+        directory = args.directory or stack.enter_context(tempfile.TemporaryDirectory())
+        if args.recover_only:
+            bench_recover(directory, capacity, vocabulary)
+            return
+        protocol = MCPProtocol(max_contexts=capacity)
+        log = MCPLog(directory, snapshot_every=None)
+        log.recover(protocol)
+        loaded = initial = len(protocol.contexts)
+        session_id = None if loaded else protocol.create_session("bench")
+        while loaded < args.contexts:
+            contexts = make_contexts(min(batch, args.contexts - loaded), vocabulary, seed=7 + loaded)
+            start = time.perf_counter()
+            protocol.add_contexts(contexts, session_id=session_id if not loaded else None)
+            loaded += len(contexts)
+            del contexts
+            print(f"  carga com log            {time.perf_counter() - start:8.2f} s "
+                  f"({loaded} contextos, {log.get_stats()['log_bytes'] / 2**20:.0f} MiB de log)")
+            if loaded >= args.contexts:
+                break
+            # Rodada intermediária: grava snapshot e recomeça de um protocolo recuperado
+            log.snapshot(wait=True)
+            log.close()
+            del protocol, log
+            protocol = MCPProtocol(max_contexts=capacity)
+            log = MCPLog(directory, snapshot_every=None)
+            start = time.perf_counter()
+            log.recover(protocol)
+            print(f"  recuperação da rodada    {time.perf_counter() - start:8.2f} s")
+
+        if batch >= args.contexts and not initial and not args.skip_replay:
+            # Recuperação reaplicando todo o log, sem snapshot
+            start = time.perf_counter()
+            MCPLog(directory).recover(MCPProtocol(max_contexts=capacity))
+            print(f"  reaplicar log completo   {time.perf_counter() - start:8.2f} s")
+
+        start = time.perf_counter()
+        log.snapshot(wait=False)
+        print(f"  rotação do log           {time.perf_counter() - start:8.2f} s")
+        log._wait_snapshot()
+        print(f"  snapshot em 2º plano     {time.perf_counter() - start:8.2f} s")
+        ids = list(protocol.contexts)
+        for i in range(args.tail):
+            protocol.update_context(ids[i % len(ids)], {"tail": i})
+        log.close()
+        del protocol, log, ids
+        bench_recover(directory, capacity, vocabulary)
+
+
+def bench_recover(directory: str, capacity: int, vocabulary: List[str]):
+    """Recupera o protocolo do diretório do log (snapshot + cauda) e faz algumas buscas"""
+    from protocols.mcp_log import MCPLog
+
+    start = time.perf_counter()
+    recovered = MCPProtocol(max_contexts=capacity)
+    MCPLog(directory).recover(recovered)
+    print(f"  snapshot + cauda         {time.perf_counter() - start:8.2f} s "
+          f"({len(recovered.contexts)} contextos)")
+    start = time.perf_counter()
+    for query in make_queries(20, vocabulary):
+        recovered.get_relevant_contexts(query, 5)
+    print(f"  20 buscas após recuperar {time.perf_counter() - start:8.2f} s")
+
+
+def bench_store(args):
+    """Compara save/load binário com a gravação em JSON via to_dict"""
+    import json
+    import os
+    import tempfile
+
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+    # Documentos distintos (janelas deslocadas de um mesmo texto), para que a
+    # deduplicação não encolha o arquivo
+    words_per_document = args.payload // 6
+    words = random.Random(5).choices(vocabulary, k=args.contexts * 7 + words_per_document)
+    for i, context in enumerate(contexts):
+        context.content["document"] = " ".join(words[i * 7:i * 7 + words_per_document])[:args.payload]
+    protocol = MCPProtocol(max_contexts=len(contexts) + 1, scoring=ScoringMethod.BM25)
+    protocol.add_contexts(contexts)
+    del contexts, words
+    queries = make_queries(20, vocabulary)
+
+    print(f"📊 Gravação do acervo: {args.contexts} contextos de ~{args.payload} B")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "mcp.bin")
+        start = time.perf_counter()
+        protocol.save(path)
+        print(f"  save binário             {time.perf_counter() - start:8.2f} s "
+              f"({os.path.getsize(path) / 2**20:.0f} MiB)")
+        start = time.perf_counter()
+        loaded = MCPProtocol.load(path)
+        print(f"  load binário             {time.perf_counter() - start:8.2f} s")
+        start = time.perf_counter()
+        for query in queries:
+            loaded.get_relevant_contexts(query, 5)
+        print(f"  {len(queries)} buscas após load      {time.perf_counter() - start:8.2f} s")
+        del loaded
+        if args.skip_json:
+            return
+
+        path = os.path.join(directory, "mcp.json")
+        start = time.perf_counter()
+        with open(path, "w") as file:
+            json.dump([context.to_dict() for context in protocol.contexts.values()], file)
+        print(f"  save JSON (to_dict)      {time.perf_counter() - start:8.2f} s")
+        start = time.perf_counter()
+        with open(path) as file:
+            restored = MCPProtocol(max_contexts=args.contexts + 1, scoring=ScoringMethod.BM25)
+            restored.add_contexts(MCPContext.from_dict(data) for data in json.load(file))
+        print(f"  load JSON + reindexação  {time.perf_counter() - start:8.2f} s")
+
+
+def bench_dedup(args):
+    """Mede a deduplicação no padrão de gravação do MangabaAgent"""
+    import tracemalloc
+
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    rng = random.Random(9)
+    documents = [" ".join(rng.choices(vocabulary, k=args.words)) for _ in range(args.documents)]
+
+    def agent_contexts():
+        # chat grava a mensagem e a resposta com original_query; analyze_text
+        # grava original_text. Textos são recriados, como ao chegar da rede.
+        for i in range(args.chats):
+            text = "".join(list(documents[i % len(documents)]))
+            yield MCPContext.create(ContextType.CONVERSATION, {"message": text})
+            yield MCPContext.create(ContextType.CONVERSATION,
+                                    {"original_query": "".join(list(text)), "response": f"resposta {i}"})
+            yield MCPContext.create(ContextType.TASK, {"original_text": "".join(list(text)), "analysis": "ok"})
+
+    print(f"📊 Deduplicação: {args.chats} interações sobre {args.documents} documentos")
+    for label, min_length in (("sem deduplicação", 10 ** 9), ("com deduplicação", 256)):
+        start = time.perf_counter()
+        protocol = MCPProtocol(max_contexts=args.chats * 3 + 1, dedup_min_length=min_length)
+        protocol.add_contexts(agent_contexts())
+        elapsed = time.perf_counter() - start
+        stats = protocol.get_cache_stats()
+        del protocol
+
+        # Memória retida pelos conteúdos (sem cache de texto serializado)
+        tracemalloc.start()
+        protocol = MCPProtocol(max_contexts=args.chats * 3 + 1, dedup_min_length=min_length,
+                               text_cache_limit=0)
+        protocol.add_contexts(agent_contexts())
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del protocol
+        print(f"  {label:<18} {elapsed:6.2f} s  {current / 2**20:8.1f} MiB retidos  "
+              f"razão {stats['dedup_ratio']:5.1f}  economia {stats['dedup_bytes_saved'] / 2**20:7.1f} MiB")
+
+
+def bench_threads(args):
+    """Vazão de buscas e inserções concorrentes com thread_safe=True"""
+    import threading
+
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+    extra = make_contexts(args.contexts, vocabulary, seed=13)
+    queries = make_queries(500, vocabulary)
+
+    print(f"📊 Concorrência: {args.contexts} contextos, {args.scoring}, "
+          f"{args.writes:.0%} escritas, {args.seconds:.0f} s por rodada")
+    for threads in args.threads:
+        protocol = MCPProtocol(max_contexts=args.contexts, scoring=args.scoring,
+                               query_cache_size=0, thread_safe=True)
+        protocol.add_contexts(contexts)
+        operations = [0] * threads
+        read_latencies: List[List[float]] = [[] for _ in range(threads)]
+        errors: List[str] = []
+        deadline = time.perf_counter() + args.seconds
+
+        def work(worker: int):
+            rng = random.Random(worker)
+            try:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    if rng.random() < args.writes:
+                        context = rng.choice(extra)
+                        protocol.add_context(MCPContext.create(context.context_type, dict(context.content),
+                                                               context.priority, tags=context.tags))
+                    else:
+                        protocol.get_relevant_contexts(rng.choice(queries), 5)
+                        read_latencies[worker].append((time.perf_counter() - start) * 1000)
+                    operations[worker] += 1
+            except Exception as error:  # noqa: BLE001 - o benchmark reporta qualquer falha
+                errors.append(repr(error))
+
+        workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        latencies = sorted(latency for worker in read_latencies for latency in worker)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+        print(f"  {threads} threads  {sum(operations) / args.seconds:10.0f} ops/s | "
+              f"busca p99 {p99:8.3f} ms | erros {len(errors)}")
+
+
+def bench_shards(args):
+    """Latência de busca com os contextos particionados em processos"""
+    from protocols.mcp_sharded import ShardedMCPProtocol
+
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+    queries = make_queries(args.queries, vocabulary)
+
+    print(f"📊 Shards: {args.contexts} contextos, {args.queries} buscas, {args.scoring}")
+    local = build_protocol(contexts, scoring=args.scoring, query_cache_size=0)
+    print_latency("em processo", time_queries(lambda query: local.get_relevant_contexts(query, 10), queries))
+    for shards in args.shards:
+        with ShardedMCPProtocol(shards=shards, max_contexts=args.contexts, scoring=args.scoring,
+                                query_cache_size=0) as sharded:
+            start = time.perf_counter()
+            sharded.add_contexts(contexts)
+            load = time.perf_counter() - start
+            stats = time_queries(lambda query: sharded.get_relevant_contexts(query, 10), queries)
+            overlap = statistics.mean(overlap_at_k(local.get_relevant_contexts(query, 10),
+                                                   sharded.get_relevant_contexts(query, 10))
+                                      for query in queries[:50])
+        print_latency(f"{shards} shards", stats)
+        print(f"    carga {load:.2f} s | sobreposição@10 com o acervo único {overlap:.2f}")
+
+
+def record_token_counts(args):
+    """Grava em --counts as contagens reais do provedor (requer GOOGLE_API_KEY e rede)"""
+    import json
+    import google.generativeai as genai
+    from config import config
+    from protocols.mcp_budget import render_context
+
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as file:
+            texts = [line.rstrip("\n") for line in file if line.strip()][:args.record]
+    else:
+        vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+        # Linhas como entram no prompt, que é o que o estimador mede
+        texts = [render_context(context) for context in make_contexts(args.record, vocabulary)]
+    genai.configure(api_key=config.api_key)
+    model = genai.GenerativeModel(args.model or config.model)
+    with open(args.counts, "w", encoding="utf-8") as file:
+        for text in texts:
+            tokens = model.count_tokens(text).total_tokens
+            file.write(json.dumps({"text": text, "tokens": tokens}, ensure_ascii=False) + "\n")
+    print(f"💾 {len(texts)} contagens gravadas em {args.counts}")
+
+
+def bench_tokens(args):
+    """Erro do estimador local contra contagens reais gravadas e vazão em lote"""
+    import json
+    from utils.token_estimator import TokenEstimator, context_text
+
+    if args.record:
+        record_token_counts(args)
+
+    estimator = TokenEstimator()
+    if args.counts and Path(args.counts).exists():
+        with open(args.counts, encoding="utf-8") as file:
+            samples = [json.loads(line) for line in file if line.strip()]
+        texts = [sample["text"] for sample in samples]
+        real = [sample["tokens"] for sample in samples]
+
+        def report(label: str, estimates: List[int], subset: Optional[List[int]] = None):
+            indexes = subset if subset is not None else range(len(real))
+            errors = [(estimates[i] - real[i]) / max(real[i], 1) for i in indexes]
+            absolute = sorted(abs(error) for error in errors)
+            print(f"  {label:<24} erro médio {statistics.mean(absolute):6.1%} | "
+                  f"p90 {absolute[int(len(absolute) * 0.9)]:6.1%} | viés {statistics.mean(errors):+6.1%}")
+
+        print(f"📊 Erro da estimativa: {len(samples)} textos com contagem real ({args.counts})")
+        report("4 caracteres/token", [(len(text) + 3) // 4 for text in texts])
+        report("coeficientes padrão", estimator.estimate_many(texts))
+        # Validação cruzada em duas metades: calibra em uma, mede na outra
+        even, odd = list(range(0, len(texts), 2)), list(range(1, len(texts), 2))
+        if len(odd) >= 10:
+            fitted = TokenEstimator.fit([texts[i] for i in even], [real[i] for i in even])
+            report("calibrado (validação)", fitted.estimate_many(texts), odd)
+            print(f"    coeficientes calibrados: {', '.join(f'{c:.3f}' for c in fitted.coefficients)}")
+    else:
+        print("⚠️  Sem --counts: medindo apenas a vazão (grave contagens reais com --record N)")
+
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+    texts = [context_text(context) for context in contexts]
+    print(f"📊 Vazão: {args.contexts} contextos")
+    start = time.perf_counter()
+    single = [estimator.estimate(text) for text in texts]
+    print(f"  {'um a um':<24} {(time.perf_counter() - start) * 1000:8.1f} ms")
+    start = time.perf_counter()
+    batch = estimator.estimate_many(texts)
+    print(f"  {'estimate_many':<24} {(time.perf_counter() - start) * 1000:8.1f} ms")
+    assert batch == single
+    estimator.context_tokens_many(contexts)
+    start = time.perf_counter()
+    estimator.context_tokens_many(contexts)
+    print(f"  {'em cache nos contextos':<24} {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+
+def bench_async(args):
+    """Atraso do event loop com buscas bloqueantes vs AsyncMCPProtocol"""
+    import asyncio
+    from protocols.mcp_async import AsyncMCPProtocol
+
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(3))
+    contexts = make_contexts(args.contexts, vocabulary)
+    queries = make_queries(args.queries, vocabulary)
+
+    async def monitor(stop: asyncio.Event, lags: List[float]):
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+    async def run(label: str, search):
+        lags: List[float] = []
+        stop = asyncio.Event()
+        ticker = asyncio.ensure_future(monitor(stop, lags))
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(query: str):
+            async with semaphore:
+                await search(query)
+
+        await asyncio.gather(*(one(query) for query in queries))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticker
+        lags.sort()
+        print(f"  {label:<24} {len(queries) / elapsed:8.0f} buscas/s | atraso do loop "
+              f"p99 {lags[int(len(lags) * 0.99)]:8.3f} ms | máx {lags[-1]:8.3f} ms")
+
+    async def main():
+        blocking = MCPProtocol(max_contexts=args.contexts, scoring=args.scoring, query_cache_size=0)
+        blocking.add_contexts(contexts)
+
+        async def blocking_search(query: str):
+            blocking.get_relevant_contexts(query, 10)
+
+        await run("síncrono no loop", blocking_search)
+        async with AsyncMCPProtocol(max_contexts=args.contexts, scoring=args.scoring,
+                                    query_cache_size=0) as protocol:
+            await protocol.add_contexts(contexts)
+            await run("AsyncMCPProtocol", lambda query: protocol.get_relevant_contexts(query, 10))
+
+    print(f"📊 Event loop: {args.contexts} contextos, {args.queries} buscas, "
+          f"{args.concurrency} simultâneas, {args.scoring}")
+    asyncio.run(main())
+
+
+@dataclass
+class LegacyContext:
+    """Layout anterior do MCPContext: dataclass com __dict__, datas ISO e contêineres sempre alocados"""
+    id: str
+    context_type: ContextType
+    content: Dict
+    priority: ContextPriority
+    created_at: str
+    updated_at: str
+    expires_at: Optional[str] = None
+    tags: List[str] = None
+    metadata: Dict = None
+    parent_id: Optional[str] = None
+    children_ids: List[str] = None
+
+    def __post_init__(self):
+        if self.tags is None:
+            self.tags = []
+        if self.metadata is None:
+            self.metadata = {}
+        if self.children_ids is None:
+            self.children_ids = []
+
+
+def make_legacy_context(i: int, tags: List[str]) -> LegacyContext:
+    """Cria um contexto no layout anterior"""
+    now = datetime.now()
+    return LegacyContext(
+        id=str(uuid.uuid4()), context_type=ContextType.CONVERSATION, content={"i": i},
+        priority=ContextPriority.MEDIUM, created_at=now.isoformat(), updated_at=now.isoformat(),
+        expires_at=(now + timedelta(hours=1)).isoformat() if i % 2 else None, tags=tags
+    )
+
+
+def make_compact_context(i: int, tags: List[str]) -> MCPContext:
+    """Cria um contexto no layout atual"""
+    return MCPContext.create(ContextType.CONVERSATION, {"i": i}, expires_in_hours=1 if i % 2 else None,
+                             tags=tags)
+
+
+def bench_memory(args):
+    """Mede com tracemalloc a memória dos contextos em cada layout"""
+    import tracemalloc
+
+    print("📊 Memória por contexto (conteúdo mínimo, tags repetidas)")
+    for size in args.sizes:
+        for label, factory in (("layout anterior", make_legacy_context), ("slots", make_compact_context)):
+            tracemalloc.start()
+            # Tags recriadas a cada contexto, como ao desserializar
+            contexts = [factory(i, ["user" + "_input", "conver" + "sation"] if i % 3 else None)
+                        for i in range(size)]
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {size:>8} contextos {label:<16} {current / 2**20:9.1f} MiB "
+                  f"({current / size:6.0f} B/contexto)")
+            del contexts
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Benchmarks do protocolo MCP")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    bm25 = subparsers.add_parser("bm25", help="BM25 vs pontuação por palavras-chave")
+    bm25.add_argument("--contexts", type=int, default=20000)
+    bm25.add_argument("--queries", type=int, default=200)
+    bm25.add_argument("--vocabulary", type=int, default=5000)
+    bm25.add_argument("--k", type=int, default=5)
+    bm25.set_defaults(func=bench_bm25)
+
+    topk = subparsers.add_parser("topk", help="Seleção top-k com MaxScore")
+    topk.add_argument("--contexts", type=int, default=20000)
+    topk.add_argument("--queries", type=int, default=200)
+    topk.add_argument("--vocabulary", type=int, default=5000)
+    topk.add_argument("--k", type=int, default=5)
+    topk.set_defaults(func=bench_topk)
+
+    vector = subparsers.add_parser("vector", help="Busca vetorial exata com NumPy")
+    vector.add_argument("--contexts", type=int, default=100000)
+    vector.add_argument("--queries", type=int, default=200)
+    vector.add_argument("--vocabulary", type=int, default=5000)
+    vector.add_argument("--dim", type=int, default=128)
+    vector.add_argument("--k", type=int, default=5)
+    vector.set_defaults(func=bench_vector)
+
+    ann = subparsers.add_parser("ann", help="Índice aproximado IVF vs busca exata")
+    ann.add_argument("--contexts", type=int, default=300000)
+    ann.add_argument("--queries", type=int, default=200)
+    ann.add_argument("--vocabulary", type=int, default=5000)
+    ann.add_argument("--dim", type=int, default=128)
+    ann.add_argument("--lists", type=int, default=None)
+    ann.add_argument("--k", type=int, default=10)
+    ann.set_defaults(func=bench_ann)
+
+    insert = subparsers.add_parser("insert", help="Latência de inserção por tamanho do acervo")
+    insert.add_argument("--contexts", type=int, default=50000)
+    insert.add_argument("--vocabulary", type=int, default=5000)
+    insert.add_argument("--expiring", type=float, default=0.5)
+    insert.set_defaults(func=bench_insert)
+
+    eviction = subparsers.add_parser("eviction", help="Latência de inserção com despejo por política")
+    eviction.add_argument("--capacity", type=int, default=20000)
+    eviction.add_argument("--inserts", type=int, default=20000)
+    eviction.add_argument("--vocabulary", type=int, default=5000)
+    eviction.set_defaults(func=bench_eviction)
+
+    bulk = subparsers.add_parser("bulk", help="Carga item a item vs add_contexts")
+    bulk.add_argument("--contexts", type=int, default=100000)
+    bulk.add_argument("--capacity", type=int, default=50000)
+    bulk.add_argument("--vocabulary", type=int, default=5000)
+    bulk.set_defaults(func=bench_bulk)
+
+    sessions = subparsers.add_parser("sessions", help="Busca global vs restrita à sessão")
+    sessions.add_argument("--contexts", type=int, default=50000)
+    sessions.add_argument("--sessions", type=int, default=500)
+    sessions.add_argument("--queries", type=int, default=200)
+    sessions.add_argument("--vocabulary", type=int, default=5000)
+    sessions.set_defaults(func=bench_sessions)
+
+    recovery = subparsers.add_parser("recovery", help="Snapshot e recuperação pelo log de mutações")
+    recovery.add_argument("--contexts", type=int, default=100000)
+    recovery.add_argument("--tail", type=int, default=10000)
+    recovery.add_argument("--vocabulary", type=int, default=5000)
+    recovery.add_argument("--batch", type=int, default=None,
+                          help="Monta o acervo em rodadas deste tamanho (recupera, insere, grava snapshot)")
+    recovery.add_argument("--skip-replay", action="store_true", help="Não mede a reaplicação do log completo")
+    recovery.add_argument("--directory", default=None,
+                          help="Diretório do log, mantido ao final (um acervo já montado é reaproveitado)")
+    recovery.add_argument("--recover-only", action="store_true",
+                          help="Só recupera o acervo já gravado em --directory")
+    recovery.set_defaults(func=bench_recovery)
+
+    store = subparsers.add_parser("store", help="save/load binário vs JSON")
+    store.add_argument("--contexts", type=int, default=100000)
+    store.add_argument("--payload", type=int, default=4096)
+    store.add_argument("--vocabulary", type=int, default=5000)
+    store.add_argument("--skip-json", action="store_true", help="Não mede a gravação em JSON")
+    store.set_defaults(func=bench_store)
+
+    dedup = subparsers.add_parser("dedup", help="Deduplicação de conteúdo no padrão do agente")
+    dedup.add_argument("--chats", type=int, default=20000)
+    dedup.add_argument("--documents", type=int, default=2000)
+    dedup.add_argument("--words", type=int, default=400)
+    dedup.add_argument("--vocabulary", type=int, default=5000)
+    dedup.set_defaults(func=bench_dedup)
+
+    threads = subparsers.add_parser("threads", help="Vazão com várias threads (thread_safe=True)")
+    threads.add_argument("--contexts", type=int, default=20000)
+    threads.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    threads.add_argument("--writes", type=float, default=0.1)
+    threads.add_argument("--seconds", type=float, default=3.0)
+    threads.add_argument("--scoring", choices=[method.value for method in ScoringMethod], default="bm25")
+    threads.add_argument("--vocabulary", type=int, default=5000)
+    threads.set_defaults(func=bench_threads)
+
+    shards = subparsers.add_parser("shards", help="Busca com contextos particionados em processos")
+    shards.add_argument("--contexts", type=int, default=100000)
+    shards.add_argument("--queries", type=int, default=200)
+    shards.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    shards.add_argument("--scoring", choices=[method.value for method in ScoringMethod], default="bm25")
+    shards.add_argument("--vocabulary", type=int, default=5000)
+    shards.set_defaults(func=bench_shards)
+
+    asynchronous = subparsers.add_parser("async", help="Atraso do event loop com AsyncMCPProtocol")
+    asynchronous.add_argument("--contexts", type=int, default=20000)
+    asynchronous.add_argument("--queries", type=int, default=500)
+    asynchronous.add_argument("--concurrency", type=int, default=8)
+    asynchronous.add_argument("--scoring", choices=[method.value for method in ScoringMethod], default="bm25")
+    asynchronous.add_argument("--vocabulary", type=int, default=5000)
+    asynchronous.set_defaults(func=bench_async)
+
+    tokens = subparsers.add_parser("tokens", help="Erro e vazão do estimador local de tokens")
+    tokens.add_argument("--counts", help="JSONL com {\"text\", \"tokens\"} de contagens reais")
+    tokens.add_argument("--record", type=int, default=0,
+                        help="Grava N contagens reais do provedor em --counts antes de medir")
+    tokens.add_argument("--texts", help="Arquivo com um texto por linha para --record")
+    tokens.add_argument("--model", help="Modelo usado na contagem real (padrão: config)")
+    tokens.add_argument("--contexts", type=int, default=20000)
+    tokens.add_argument("--vocabulary", type=int, default=5000)
+    tokens.set_defaults(func=bench_tokens)
+
+    memory = subparsers.add_parser("memory", help="Memória dos contextos por layout (tracemalloc)")
+    memory.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    memory.set_defaults(func=bench_memory)
+
+    args = parser.parse_args()
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
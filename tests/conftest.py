@@ -297,6 +297,8 @@ def pytest_configure(config):
     # Adiciona timeout padrão se não especificado
     if not config.getoption("--timeout"):
         config.option.timeout = 30
+    # Registra os marcadores de pytest.ini (a seção [tool:pytest] não é lida ali)
+    config.addinivalue_line("markers", "performance: marca testes de performance")
 
 
 # Hook para capturar falhas e gerar relatórios detalhados
@@ -86,6 +86,61 @@ class TestMangabaAgent:
         # Verifica se o contexto foi adicionado ao MCP
         assert len(agent.mcp.contexts) > 0
     
+    def test_chat_respects_context_budget(self, mock_genai, mock_config):
+        """Contextos do prompt ficam dentro do orçamento e CRITICAL sempre entra"""
+        _, _, mock_instance = mock_genai
+        agent = MangabaAgent(api_key="test_key", model="test-model", context_token_budget=60)
+        for i in range(10):
+            agent.mcp.add_context(MCPContext.create(ContextType.MEMORY, {"text": f"relatório {i} " + "dados " * 30}),
+                                  agent.current_session_id)
+        rule = MCPContext.create(ContextType.SYSTEM, {"rule": "responder em português"},
+                                 priority=ContextPriority.CRITICAL)
+        agent.mcp.add_context(rule, agent.current_session_id)
+
+        agent.chat("dados do relatório")
+
+        assembly = agent.last_context_assembly
+        assert assembly.token_budget == 60
+        assert assembly.contexts[0] is rule
+        assert assembly.tokens_used <= 60
+        assert assembly.dropped > 0
+        prompt = mock_instance.generate_content.call_args[0][0]
+        assert assembly.render() in prompt
+
+    def test_chat_resumes_session_from_sqlite(self, mock_genai, mock_config, tmp_path):
+        """Após reiniciar com mcp_db_path o agente retoma a sessão e o contexto anterior"""
+        _, _, mock_instance = mock_genai
+        path = str(tmp_path / "mcp.db")
+        agent = MangabaAgent(api_key="test_key", agent_id="fixed", mcp_db_path=path)
+        agent.chat("meu projeto se chama girassol")
+        session_id = agent.current_session_id
+        agent.mcp.close()
+
+        restarted = MangabaAgent(api_key="test_key", agent_id="fixed", mcp_db_path=path)
+        restarted.chat("como se chama o projeto girassol")
+
+        assert restarted.current_session_id == session_id
+        prompt = mock_instance.generate_content.call_args[0][0]
+        assert "meu projeto se chama girassol" in prompt
+        restarted.mcp.close()
+
+    def test_chat_resumes_session_from_log(self, mock_genai, mock_config, tmp_path):
+        """Após reiniciar com mcp_log_dir o agente retoma a sessão e o contexto anterior"""
+        _, _, mock_instance = mock_genai
+        agent = MangabaAgent(api_key="test_key", agent_id="fixed", mcp_log_dir=str(tmp_path))
+        agent.chat("meu projeto se chama girassol")
+        session_id = agent.current_session_id
+        agent.mcp_log.close()
+
+        restarted = MangabaAgent(api_key="test_key", agent_id="fixed", mcp_log_dir=str(tmp_path))
+        restarted.chat("como se chama o projeto girassol")
+
+        assert restarted.current_session_id == session_id
+        assert len(restarted.mcp.sessions) == 1
+        prompt = mock_instance.generate_content.call_args[0][0]
+        assert "meu projeto se chama girassol" in prompt
+        restarted.mcp_log.close()
+
     def test_chat_without_context(self, agent, mock_genai):
         """Testa chat sem usar contexto MCP"""
         _, _, mock_instance = mock_genai
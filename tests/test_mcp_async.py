@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para a API assíncrona do protocolo MCP
+"""
+
+import asyncio
+import pytest
+import random
+import sys
+import os
+import time
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPProtocol, MCPContext, ContextType, ScoringMethod
+from protocols.mcp_async import AsyncMCPProtocol
+
+
+async def measure_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Maior atraso do event loop em relação ao intervalo pedido"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+class TestAsyncMCPProtocol:
+    """Testes do protocolo assíncrono"""
+
+    def test_awaitable_api(self):
+        """Métodos principais são corrotinas com o mesmo resultado do protocolo"""
+        async def scenario():
+            async with AsyncMCPProtocol(scoring=ScoringMethod.BM25) as protocol:
+                assert protocol.protocol.thread_safe
+                session_id = await protocol.create_session("assíncrona")
+                context = MCPContext.create(ContextType.CONVERSATION, {"text": "mensagem pendente"})
+                await protocol.add_context(context, session_id)
+
+                found = await protocol.get_relevant_contexts("pendente", 5, session_id=session_id)
+                assert [c.id for c in found] == [context.id]
+                assert [c.id for c in await protocol.get_session_contexts(session_id)] == [context.id]
+                assert await protocol.remove_context(context.id)
+                assert await protocol.get_context(context.id) is None
+
+        asyncio.run(scenario())
+
+    def test_parent_depth(self):
+        """Busca assíncrona repassa parent_depth e inclui os ancestrais"""
+        async def scenario():
+            async with AsyncMCPProtocol() as protocol:
+                parent = MCPContext.create(ContextType.TASK, {"text": "projeto"})
+                child = MCPContext.create(ContextType.TASK, {"text": "etapa final"}, parent_id=parent.id)
+                await protocol.add_contexts([parent, child])
+
+                assert await protocol.get_relevant_contexts("final", 1) == [child]
+                assert await protocol.get_relevant_contexts("final", 1, parent_depth=1) == [parent, child]
+
+        asyncio.run(scenario())
+
+    def test_rejects_options_with_protocol(self):
+        """Opções de construção só valem quando o protocolo é criado pela fachada"""
+        with pytest.raises(ValueError):
+            AsyncMCPProtocol(MCPProtocol(), scoring=ScoringMethod.BM25)
+
+    def test_sqlite_backend_runs_off_loop(self, tmp_path):
+        """Backend SQLite é usado pela thread do executor, sem bloquear o loop"""
+        async def scenario():
+            protocol = AsyncMCPProtocol.sqlite(str(tmp_path / "mcp.db"))
+            assert protocol._executor._max_workers == 1
+            session_id = await protocol.create_session("persistente")
+            contexts = [MCPContext.create(ContextType.MEMORY, {"text": f"nota {i} sobre cafeteria"})
+                        for i in range(20)]
+            await protocol.add_contexts(contexts, session_id)
+            results = await asyncio.gather(*(protocol.get_relevant_contexts("cafeteria", 3) for _ in range(10)))
+            assert all(len(result) == 3 for result in results)
+            assert len(await protocol.get_session_contexts(session_id)) == 20
+            await protocol.close()
+
+        asyncio.run(scenario())
+
+    @pytest.mark.performance
+    def test_event_loop_lag_is_bounded(self):
+        """Buscas concorrentes atrasam o event loop bem menos que as mesmas buscas bloqueantes"""
+        rng = random.Random(5)
+        words = [f"termo{i}" for i in range(300)]
+        contexts = [MCPContext.create(ContextType.MEMORY, {"text": " ".join(rng.choices(words, k=30))})
+                    for _ in range(3000)]
+        queries = [" ".join(rng.sample(words, 3)) for _ in range(200)]
+
+        async def scenario():
+            protocol = AsyncMCPProtocol(max_contexts=5000, scoring=ScoringMethod.BM25, query_cache_size=0)
+            await protocol.add_contexts(contexts)
+
+            # Referência: as mesmas buscas executadas no próprio loop
+            stop = asyncio.Event()
+            monitor = asyncio.ensure_future(measure_lag(stop))
+            await asyncio.sleep(0)
+            for query in queries:
+                protocol.protocol.get_relevant_contexts(query, 10)
+            await asyncio.sleep(0)
+            stop.set()
+            blocking = await monitor
+
+            stop = asyncio.Event()
+            monitor = asyncio.ensure_future(measure_lag(stop))
+            await asyncio.gather(*(protocol.get_relevant_contexts(query, 10) for query in queries))
+            stop.set()
+            worst = await monitor
+            await protocol.close()
+            return worst, blocking
+
+        worst, blocking = asyncio.run(scenario())
+        assert worst < blocking / 4
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para a montagem de contexto com orçamento de tokens
+"""
+
+import sys
+import os
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPContext, ContextType, ContextPriority
+from protocols.mcp_budget import LINE_OVERHEAD_TOKENS, assemble_contexts, render_context
+from utils.token_estimator import TokenEstimator
+
+
+def quarter(text: str) -> int:
+    """Estimativa fixa de 4 caracteres por token, para custos exatos nos testes"""
+    return (len(text) + 3) // 4
+
+
+def sized(tokens: int, priority: ContextPriority = ContextPriority.MEDIUM) -> MCPContext:
+    """Contexto cuja linha renderizada custa exatamente ``tokens`` tokens"""
+    context = MCPContext.create(ContextType.MEMORY, {"t": ""}, priority)
+    overhead = len(render_context(context))
+    context.content = {"t": "x" * (tokens * 4 - overhead)}
+    assert quarter(render_context(context)) == tokens
+    return context
+
+
+class TestAssembleContexts:
+    """Testes da seleção por densidade"""
+
+    def test_fills_budget_by_density(self):
+        """Escolhe pela razão pontuação/tokens e mantém a ordem da busca"""
+        large, small, medium = sized(80), sized(20), sized(40)
+        assembly = assemble_contexts([(10.0, large), (4.0, small), (6.0, medium)], token_budget=100,
+                                     estimate=quarter)
+
+        assert assembly.contexts == [small, medium]
+        assert assembly.tokens_used == 60
+        assert assembly.token_budget == 100
+        assert assembly.dropped == 1
+        assert assembly.render() == "\n".join([render_context(small), render_context(medium)])
+
+    def test_prefers_best_single_item(self):
+        """Um contexto valioso que ocupa o orçamento vence vários pequenos de pouco valor"""
+        cheap, valuable = sized(10), sized(95)
+        assembly = assemble_contexts([(1.0, cheap), (50.0, valuable)], token_budget=100, estimate=quarter)
+        assert assembly.contexts == [valuable]
+
+    def test_critical_always_included(self):
+        """CRITICAL entra primeiro, mesmo fora dos candidatos ou acima do orçamento"""
+        critical = sized(150, ContextPriority.CRITICAL)
+        other = sized(10)
+        assembly = assemble_contexts([(5.0, other)], token_budget=100, required=[critical, critical],
+                                     estimate=quarter)
+
+        assert assembly.contexts == [critical]
+        assert assembly.over_budget
+        assert assembly.tokens_used == 150
+
+    def test_empty_and_custom_estimator(self):
+        """Sem candidatos nada é usado; o estimador pode ser trocado"""
+        assert assemble_contexts([], token_budget=50).tokens_used == 0
+        contexts = [sized(10), sized(10)]
+        assembly = assemble_contexts([(1.0, c) for c in contexts], token_budget=3, estimate=lambda text: 1)
+        assert assembly.contexts == contexts
+        assert assembly.tokens_used == 2
+
+    def test_uses_cached_context_counts(self):
+        """Sem ``estimate`` o custo é a contagem em cache do estimador mais a linha"""
+        estimator = TokenEstimator()
+        contexts = [MCPContext.create(ContextType.MEMORY, {"text": f"nota número {i}"}) for i in range(3)]
+        assembly = assemble_contexts([(1.0, c) for c in contexts], token_budget=1000, estimator=estimator)
+
+        expected = sum(estimator.context_tokens(c) + LINE_OVERHEAD_TOKENS for c in contexts)
+        assert assembly.tokens_used == expected
+        assert all(c._tokens is not None for c in contexts)
+
+    def test_cost_matches_rendered_line(self):
+        """Custo padrão acompanha a linha do prompt, não o JSON escapado"""
+        estimator = TokenEstimator()
+        context = MCPContext.create(ContextType.MEMORY, {"text": "relatório de produção anual"})
+        assembly = assemble_contexts([(1.0, context)], token_budget=1000, estimator=estimator)
+
+        rendered = estimator.estimate(render_context(context))
+        assert rendered <= assembly.tokens_used <= rendered + LINE_OVERHEAD_TOKENS
+        assert assembly.tokens_used < estimator.estimate(context.serialized_content())
+
+    def test_custom_render_is_estimated(self):
+        """Com outro ``render`` o estimador mede a linha produzida por ele"""
+        estimator = TokenEstimator()
+        context = MCPContext.create(ContextType.MEMORY, {"text": "nota"})
+        render = lambda c: "* " + c.content["text"] * 50  # noqa: E731
+        assembly = assemble_contexts([(1.0, context)], token_budget=1000, estimator=estimator, render=render)
+
+        assert assembly.tokens_used == estimator.estimate(render(context))
+        assert assembly.lines == [render(context)]
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para a deduplicação de conteúdo do protocolo MCP
+"""
+
+import json
+import sys
+import os
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPProtocol, MCPContext, ContextType
+from protocols.mcp_dedup import PayloadStore
+from protocols.mcp_log import MCPLog
+
+
+def long_text(seed: str) -> str:
+    """Texto acima do limite de deduplicação, recriado a cada chamada"""
+    return "".join([seed, " "] * 100)
+
+
+class TestPayloadStore:
+    """Testes do armazém de strings"""
+
+    def test_intern_shares_equal_strings(self):
+        """Strings iguais passam a ser o mesmo objeto, contadas por referência"""
+        store = PayloadStore(min_length=16)
+        first = {"message": long_text("igual"), "short": "curta"}
+        second = {"nested": {"items": [long_text("igual")]}}
+
+        first_refs = store.intern(first)
+        second_refs = store.intern(second)
+
+        assert first_refs == second_refs
+        assert second["nested"]["items"][0] is first["message"]
+        assert len(store) == 1
+        stats = store.get_stats()
+        assert stats["references"] == 2
+        assert stats["ratio"] == 2.0
+        assert stats["bytes_saved"] == stats["unique_bytes"]
+
+    def test_release_drops_unreferenced(self):
+        """String é liberada quando a última referência é devolvida"""
+        store = PayloadStore(min_length=16)
+        refs = [store.intern({"text": long_text("a")}) for _ in range(3)]
+        for digests in refs[:2]:
+            store.release(digests)
+        assert len(store) == 1
+        store.release(refs[2])
+        assert len(store) == 0
+        assert store.get_stats()["unique_bytes"] == 0
+
+
+class TestMCPDeduplication:
+    """Testes da deduplicação no protocolo"""
+
+    def test_contexts_share_payloads(self):
+        """Pergunta repetida na resposta é guardada uma vez"""
+        protocol = MCPProtocol()
+        question = MCPContext.create(ContextType.CONVERSATION, {"message": long_text("pergunta")})
+        answer = MCPContext.create(ContextType.CONVERSATION, {"original_query": long_text("pergunta"),
+                                                              "response": "ok"})
+        protocol.add_context(question)
+        protocol.add_context(answer)
+
+        assert answer.content["original_query"] is question.content["message"]
+        stats = protocol.get_cache_stats()
+        assert stats["dedup_payloads"] == 1
+        assert stats["dedup_references"] == 2
+        assert stats["dedup_bytes_saved"] > 0
+
+        protocol.remove_context(question.id)
+        assert protocol.get_cache_stats()["dedup_references"] == 1
+        protocol.remove_context(answer.id)
+        assert protocol.get_cache_stats()["dedup_payloads"] == 0
+
+    def test_update_rebinds_payloads(self):
+        """Atualização troca as referências do contexto"""
+        protocol = MCPProtocol()
+        context = MCPContext.create(ContextType.TASK, {"text": long_text("antigo")})
+        protocol.add_context(context)
+        protocol.update_context(context.id, {"text": long_text("novo")})
+
+        stats = protocol.get_cache_stats()
+        assert stats["dedup_payloads"] == 1
+        assert stats["dedup_references"] == 1
+
+    def test_hash_uses_blake2b(self):
+        """Hash do conteúdo é o blake2b de 128 bits, calculado uma vez"""
+        context = MCPContext.create(ContextType.MEMORY, {"data": "x"})
+        digest = context.get_hash()
+        assert len(digest) == 32
+        assert context.get_hash() is digest
+
+
+def shared_protocol(copies: int = 100) -> MCPProtocol:
+    """Protocolo com ``copies`` contextos que repetem o mesmo texto de ~2 KB"""
+    protocol = MCPProtocol(max_contexts=copies + 10)
+    for i in range(copies):
+        protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {
+            "document": long_text("compartilhado" * 2), "n": i,
+            "nested": {"items": [long_text("aninhado"), "curto"]},
+        }))
+    return protocol
+
+
+def assert_shared(protocol: MCPProtocol, expected_ratio: float):
+    """Conteúdos lidos voltam a compartilhar as strings grandes"""
+    contexts = list(protocol.contexts.values())
+    first = contexts[0].content
+    for context in contexts[1:]:
+        assert context.content["document"] is first["document"]
+        assert context.content["nested"]["items"][0] is first["nested"]["items"][0]
+    assert protocol.get_cache_stats()["dedup_ratio"] == expected_ratio
+
+
+class TestMCPDeduplicationPersistence:
+    """Deduplicação em save/load e na recuperação pelo log"""
+
+    def test_save_writes_payload_once(self, tmp_path):
+        """Arquivo guarda uma cópia de cada string grande"""
+        path = str(tmp_path / "mcp.bin")
+        shared_protocol(1).save(path)
+        single = os.path.getsize(path)
+        shared_protocol(100).save(path)
+        # Cada contexto extra acrescenta só o que não é compartilhado
+        assert os.path.getsize(path) - single < 99 * 1024
+
+    def test_load_restores_sharing(self, tmp_path):
+        """Após load, conteúdos lidos são internados no armazém"""
+        path = str(tmp_path / "mcp.bin")
+        protocol = shared_protocol()
+        ratio = protocol.get_cache_stats()["dedup_ratio"]
+        protocol.save(path)
+
+        loaded = MCPProtocol.load(path)
+        assert_shared(loaded, ratio)
+        for context_id, context in protocol.contexts.items():
+            assert loaded.contexts[context_id] == context
+
+        # Gravar de novo, com conteúdos lidos ou não, mantém uma cópia por string
+        loaded.save(str(tmp_path / "copia.bin"))
+        MCPProtocol.load(path).save(str(tmp_path / "lazy.bin"))
+        for name in ("copia.bin", "lazy.bin"):
+            assert os.path.getsize(tmp_path / name) < os.path.getsize(path) * 1.1
+
+    def test_release_after_load(self, tmp_path):
+        """Remoção de contextos lidos de um arquivo devolve as referências"""
+        path = str(tmp_path / "mcp.bin")
+        shared_protocol(3).save(path)
+        loaded = MCPProtocol.load(path)
+        ids = list(loaded.contexts)
+        loaded.contexts[ids[0]].content
+        loaded.remove_context(ids[1])  # conteúdo nunca lido
+        assert loaded.get_cache_stats()["dedup_references"] == 2
+        loaded.remove_context(ids[0])
+        assert loaded.get_cache_stats()["dedup_payloads"] == 0
+
+    def test_recover_restores_sharing(self, tmp_path):
+        """Após recuperar do snapshot, conteúdos lidos são internados no armazém"""
+        protocol = MCPProtocol(max_contexts=200)
+        log = MCPLog(str(tmp_path), snapshot_every=None)
+        log.recover(protocol)
+        for context in shared_protocol().contexts.values():
+            protocol.add_context(context)
+        ratio = protocol.get_cache_stats()["dedup_ratio"]
+        log.snapshot(wait=True)
+        log.close()
+
+        recovered = MCPProtocol(max_contexts=200)
+        log = MCPLog(str(tmp_path))
+        log.recover(recovered)
+        log.close()
+        assert not any(context.content_loaded for context in recovered.contexts.values())
+        assert_shared(recovered, ratio)
+
+    def test_split_json_matches_canonical(self, tmp_path):
+        """Conteúdo remontado a partir das strings gravadas é o JSON canônico"""
+        path = str(tmp_path / "mcp.bin")
+        protocol = MCPProtocol(dedup_min_length=8)
+        contents = [
+            {"b": "ação" * 10, "a": [1.5, None, True, {"z": "x" * 9, "y": []}], "c": {}},
+            {"texto": "ação" * 10, "numerado": {1: "chave não textual" * 2, 2: 3}, "lista": ["ação" * 10, "x" * 9]},
+            {"aspas": '"quoted" \\ ' * 4, "vazio": "", "numeros": [1, 2.25, -3]},
+        ]
+        for content in contents:
+            protocol.add_context(MCPContext.create(ContextType.MEMORY, content))
+        protocol.save(path)
+
+        loaded = MCPProtocol.load(path)
+        for context_id, context in protocol.contexts.items():
+            copy = loaded.contexts[context_id]
+            assert copy.serialized_content() == context.serialized_content()
+            assert copy.get_hash() == context.get_hash()
+            assert copy.content == json.loads(context.serialized_content())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para as políticas de despejo do protocolo MCP
+"""
+
+import pytest
+import sys
+import os
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPProtocol, MCPContext, ContextType, ContextPriority
+from protocols.mcp_eviction import (
+    EvictionMethod, LFUPolicy, LRUPolicy, PriorityPolicy, create_eviction_policy
+)
+
+
+class TestEvictionPolicies:
+    """Testes das políticas isoladas"""
+
+    def test_lru_order(self):
+        """LRU despeja o acessado há mais tempo"""
+        policy = LRUPolicy()
+        for context_id in "abc":
+            policy.add(context_id, 2)
+        policy.touch("a")
+
+        assert policy.victim() == "b"
+        policy.remove("b")
+        assert policy.victim() == "c"
+        assert policy.touches == 1
+
+    def test_lfu_order(self):
+        """LFU despeja o menos acessado e, no empate, o mais antigo"""
+        policy = LFUPolicy()
+        for context_id in "abc":
+            policy.add(context_id, 2)
+        policy.touch("a")
+        policy.touch("b")
+        policy.touch("b")
+
+        assert policy.victim() == "c"
+        policy.remove("c")
+        assert policy.victim() == "a"
+        policy.remove("a")
+        assert policy.victim() == "b"
+        policy.remove("b")
+        assert policy.victim() is None
+        assert len(policy) == 0
+
+    def test_lfu_min_frequency_after_touch(self):
+        """Menor frequência avança quando seu balde esvazia"""
+        policy = LFUPolicy()
+        policy.add("a", 2)
+        policy.touch("a")
+        policy.add("b", 2)
+        policy.touch("b")
+        policy.touch("b")
+
+        assert policy.victim() == "a"
+
+    def test_priority_then_age(self):
+        """Menor prioridade primeiro; dentro dela, o mais antigo"""
+        policy = PriorityPolicy()
+        policy.add("critical", ContextPriority.CRITICAL.value)
+        policy.add("low-old", ContextPriority.LOW.value)
+        policy.add("low-new", ContextPriority.LOW.value)
+        policy.add("high", ContextPriority.HIGH.value)
+
+        assert policy.victim() == "low-old"
+        policy.remove("low-old")
+        policy.remove("low-new")
+        assert policy.victim() == "high"
+        policy.remove("high")
+        assert policy.victim() == "critical"
+
+    def test_factory(self):
+        """Política criada a partir do nome, do enum ou da instância"""
+        assert isinstance(create_eviction_policy("lru"), LRUPolicy)
+        assert isinstance(create_eviction_policy(EvictionMethod.LFU), LFUPolicy)
+        policy = PriorityPolicy()
+        assert create_eviction_policy(policy) is policy
+        with pytest.raises(ValueError):
+            create_eviction_policy("random")
+
+
+class TestMCPEviction:
+    """Testes do despejo integrado ao MCPProtocol"""
+
+    def _context(self, priority=ContextPriority.MEDIUM):
+        return MCPContext.create(ContextType.MEMORY, {"text": "x"}, priority=priority)
+
+    def test_evicts_one_at_a_time(self):
+        """Ao atingir o limite apenas um contexto é despejado"""
+        protocol = MCPProtocol(max_contexts=5)
+        for _ in range(8):
+            protocol.add_context(self._context())
+
+        assert len(protocol.contexts) == 5
+        stats = protocol.get_cache_stats()
+        assert stats["eviction_policy"] == "priority"
+        assert stats["eviction_evictions"] == 3
+
+    def test_critical_contexts_survive(self):
+        """Política padrão preserva contextos críticos"""
+        protocol = MCPProtocol(max_contexts=3)
+        critical = self._context(ContextPriority.CRITICAL)
+        protocol.add_context(critical)
+        for _ in range(10):
+            protocol.add_context(self._context(ContextPriority.LOW))
+
+        assert critical.id in protocol.contexts
+
+    def test_lru_touched_by_get_context(self):
+        """get_context protege o contexto no LRU"""
+        protocol = MCPProtocol(max_contexts=2, eviction="lru")
+        first, second, third = self._context(), self._context(), self._context()
+        protocol.add_context(first)
+        protocol.add_context(second)
+        protocol.get_context(first.id)
+        protocol.add_context(third)
+
+        assert set(protocol.contexts) == {first.id, third.id}
+        assert protocol.get_cache_stats()["eviction_touches"] == 1
+
+    def test_removal_forgets_context(self):
+        """Contextos removidos deixam de ser candidatos"""
+        protocol = MCPProtocol(max_contexts=10, eviction=EvictionMethod.LFU)
+        context = self._context()
+        protocol.add_context(context)
+        protocol.remove_context(context.id)
+
+        assert context.id not in protocol.eviction
+        assert protocol.eviction.victim() is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para o modo thread-safe do protocolo MCP
+"""
+
+import pytest
+import random
+import sys
+import os
+import threading
+import time
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPProtocol, MCPContext, ContextType, ContextPriority, ScoringMethod
+from protocols.mcp_lock import ReadWriteLock
+
+
+class TestReadWriteLock:
+    """Testes da trava leitor-escritor"""
+
+    def test_readers_share(self):
+        """Vários leitores seguram a trava ao mesmo tempo"""
+        lock = ReadWriteLock()
+        inside = threading.Barrier(3, timeout=2)
+
+        def reader():
+            with lock.read():
+                inside.wait()
+
+        threads = [threading.Thread(target=reader) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not inside.broken
+
+    def test_writer_excludes_readers(self):
+        """Leitor espera o escritor terminar"""
+        lock = ReadWriteLock()
+        events = []
+        lock.acquire_write()
+
+        def reader():
+            with lock.read():
+                events.append("leitura")
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        time.sleep(0.05)
+        events.append("escrita")
+        lock.release_write()
+        thread.join()
+        assert events == ["escrita", "leitura"]
+
+    def test_reentrancy(self):
+        """Escritor pode ler e escrever de novo; leituras se aninham"""
+        lock = ReadWriteLock()
+        with lock.write():
+            with lock.read():
+                with lock.write():
+                    assert lock.owns_write()
+        assert not lock.owns_write()
+        with lock.read():
+            with lock.read():
+                pass
+        with lock.write():
+            pass
+
+    def test_upgrade_is_rejected(self):
+        """Pedir escrita segurando leitura levanta erro em vez de travar"""
+        lock = ReadWriteLock()
+        with lock.read():
+            with pytest.raises(RuntimeError):
+                lock.acquire_write()
+
+
+class TestThreadSafeMCPProtocol:
+    """Testes de concorrência do protocolo"""
+
+    def test_concurrent_reads_and_writes(self):
+        """Inserções, remoções e buscas simultâneas não corrompem os índices"""
+        protocol = MCPProtocol(max_contexts=300, scoring=ScoringMethod.BM25, thread_safe=True)
+        session_id = protocol.create_session("concorrente")
+        words = ["alfa", "beta", "gama", "delta", "épsilon"]
+        errors = []
+        deadline = time.monotonic() + 1.0
+
+        def writer(seed):
+            rng = random.Random(seed)
+            try:
+                while time.monotonic() < deadline:
+                    context = MCPContext.create(ContextType.CONVERSATION,
+                                                {"text": " ".join(rng.choices(words, k=4))},
+                                                tags=[rng.choice(words)])
+                    protocol.add_context(context, session_id if rng.random() < 0.5 else None)
+                    if rng.random() < 0.3:
+                        protocol.remove_context(context.id)
+            except Exception as error:
+                errors.append(error)
+
+        def reader(seed):
+            rng = random.Random(seed)
+            try:
+                while time.monotonic() < deadline:
+                    protocol.get_relevant_contexts(rng.choice(words), 5)
+                    protocol.get_relevant_contexts(rng.choice(words), 5, session_id=session_id)
+                    protocol.find_contexts_by_tag(rng.choice(words))
+                    protocol.query_contexts(min_priority=ContextPriority.LOW)
+                    protocol.get_session_contexts(session_id)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(3)]
+        threads += [threading.Thread(target=reader, args=(10 + i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(protocol.contexts) <= 300
+        tagged = sum(len(ids) for ids in protocol.context_index.values())
+        assert tagged == len(protocol.contexts)
+        assert set(protocol.sessions[session_id].context_ids) <= set(protocol.contexts)
+
+    def test_reads_leave_expired_to_writers(self):
+        """No modo thread-safe leituras ignoram expirados e a próxima escrita os remove"""
+        protocol = MCPProtocol(thread_safe=True)
+        context = MCPContext.create(ContextType.TASK, {"text": "vencido"})
+        protocol.add_context(context)
+        protocol.set_context_expiry(context.id, time.time() - 1)
+
+        assert protocol.get_context(context.id) is None
+        assert protocol.find_contexts_by_type(ContextType.TASK) == []
+        assert context.id in protocol.contexts
+
+        protocol.add_context(MCPContext.create(ContextType.TASK, {"text": "novo"}))
+        assert context.id not in protocol.contexts
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para o log de mutações e snapshots do protocolo MCP
+"""
+
+import pytest
+import sys
+import os
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPProtocol, MCPContext, ContextType, ContextPriority
+from protocols.mcp_log import MCPLog
+
+
+def make_context(text: str, **kwargs) -> MCPContext:
+    """Cria um contexto de conversa com o texto informado"""
+    return MCPContext.create(ContextType.CONVERSATION, {"text": text}, **kwargs)
+
+
+def recover(directory) -> MCPProtocol:
+    """Recupera um protocolo novo a partir do diretório do log"""
+    protocol = MCPProtocol()
+    log = MCPLog(str(directory))
+    log.recover(protocol)
+    log.close()
+    return protocol
+
+
+@pytest.fixture
+def logged(tmp_path):
+    """Protocolo com log associado"""
+    protocol = MCPProtocol()
+    log = MCPLog(str(tmp_path), snapshot_every=None)
+    log.recover(protocol)
+    yield protocol, log
+    log.close()
+
+
+class TestMCPLogRecovery:
+    """Testes de gravação e recuperação"""
+
+    def test_replays_mutations(self, tmp_path, logged):
+        """Inserções, atualizações, remoções e sessões sobrevivem ao reinício"""
+        protocol, log = logged
+        session_id = protocol.create_session("persistente")
+        kept = make_context("contexto mantido", priority=ContextPriority.HIGH, tags=["kb"])
+        removed = make_context("contexto removido")
+        protocol.add_context(kept, session_id=session_id)
+        protocol.add_context(removed, session_id=session_id)
+        protocol.update_context(kept.id, {"extra": "atualizado"})
+        protocol.remove_context(removed.id)
+        log.close()
+
+        recovered = recover(tmp_path)
+        assert list(recovered.contexts) == [kept.id]
+        assert recovered.contexts[kept.id] == kept
+        assert recovered.sessions[session_id].name == "persistente"
+        assert [c.id for c in recovered.get_session_contexts(session_id)] == [kept.id]
+        assert [c.id for c in recovered.find_contexts_by_tag("kb")] == [kept.id]
+
+    def test_snapshot_plus_tail(self, tmp_path, logged):
+        """Recuperação combina o snapshot com a cauda do log"""
+        protocol, log = logged
+        first = make_context("antes do snapshot")
+        protocol.add_context(first)
+        log.snapshot()
+        assert log.get_stats()["records"] == 0
+
+        second = make_context("depois do snapshot")
+        protocol.add_context(second)
+        protocol.update_context(first.id, {"versao": 2})
+        log.close()
+
+        recovered = recover(tmp_path)
+        assert list(recovered.contexts) == [first.id, second.id]
+        assert recovered.contexts[first.id].content["versao"] == 2
+
+    def test_multiple_sessions(self, tmp_path, logged):
+        """Contextos em mais de uma sessão mantêm todas elas"""
+        protocol, log = logged
+        first = protocol.create_session("a")
+        second = protocol.create_session("b")
+        context = make_context("compartilhado")
+        protocol.add_context(context, session_id=first)
+        assert protocol.add_context_to_session(context.id, second)
+        log.snapshot()
+        log.close()
+
+        recovered = recover(tmp_path)
+        assert recovered.get_context_session_ids(context.id) == [first, second]
+
+    def test_periodic_snapshot(self, tmp_path):
+        """Snapshot é gravado ao atingir snapshot_every registros"""
+        protocol = MCPProtocol()
+        log = MCPLog(str(tmp_path), snapshot_every=5)
+        log.recover(protocol)
+        protocol.add_contexts(make_context(f"texto {i}") for i in range(7))
+        stats = log.get_stats()
+        log.close()
+
+        assert stats["snapshots"] == 1
+        assert stats["records"] == 2
+        assert len(recover(tmp_path).contexts) == 7
+
+    def test_recovery_replays_only_tail(self, tmp_path, logged):
+        """Snapshot binário é mapeado com os índices; só a cauda é reaplicada"""
+        protocol, log = logged
+        session_id = protocol.create_session("kb")
+        protocol.add_contexts([make_context(f"texto {i}", tags=["kb"]) for i in range(20)],
+                              session_id=session_id)
+        log.snapshot(wait=False)
+        tail = make_context("cauda do log")
+        protocol.add_context(tail)
+        log.close()
+
+        names = sorted(os.listdir(str(tmp_path)))
+        assert names == [MCPLog.SNAPSHOT_FILE.format(log.generation - 1), MCPLog.LOG_FILE]
+
+        recovered = MCPProtocol()
+        applied = MCPLog(str(tmp_path)).recover(recovered)
+        assert applied == 1
+        assert list(recovered.contexts) == list(protocol.contexts)
+        assert not recovered.contexts[protocol.query_contexts()[0].id].content_loaded
+        assert len(recovered.get_relevant_contexts("texto", 30, session_id=session_id)) == 20
+        assert len(recovered.find_contexts_by_tag("kb")) == 20
+
+    def test_pending_segment_after_crash(self, tmp_path, logged, monkeypatch):
+        """Segmento congelado sem snapshot (queda) é reaplicado e depois incorporado"""
+        protocol, log = logged
+        monkeypatch.setattr(log, "_request_snapshot", lambda: None)
+        context = make_context("antes da queda")
+        protocol.add_context(context)
+        log.snapshot()
+        log.close()
+        assert MCPLog.SEGMENT_FILE.format(log.generation - 1) in os.listdir(str(tmp_path))
+
+        recovered = recover(tmp_path)
+        assert list(recovered.contexts) == [context.id]
+        assert not any(name.endswith(".log") and name != MCPLog.LOG_FILE
+                       for name in os.listdir(str(tmp_path)))
+        assert list(recover(tmp_path).contexts) == [context.id]
+
+    def test_torn_tail_is_discarded(self, tmp_path, logged):
+        """Registro incompleto no fim do log é descartado na recuperação"""
+        protocol, log = logged
+        context = make_context("íntegro")
+        protocol.add_context(context)
+        log.close()
+        with open(os.path.join(str(tmp_path), MCPLog.LOG_FILE), "ab") as file:
+            file.write(b"\x40\x00\x00\x00\x00\x00\x00\x00{\"op\":")
+
+        recovered = recover(tmp_path)
+        assert list(recovered.contexts) == [context.id]
+        recovered_again = recover(tmp_path)
+        assert list(recovered_again.contexts) == [context.id]
+
+    def test_stale_log_is_ignored(self, tmp_path, logged):
+        """Log de geração anterior ao snapshot não é reaplicado"""
+        protocol, log = logged
+        context = make_context("versão do snapshot")
+        protocol.add_context(context)
+        log_path = os.path.join(str(tmp_path), MCPLog.LOG_FILE)
+        with open(log_path, "rb") as file:
+            stale = file.read()
+        protocol.update_context(context.id, {"text": "versão final"})
+        log.snapshot()
+        log.close()
+        # Simula queda entre a gravação do snapshot e o reinício do log
+        with open(log_path, "wb") as file:
+            file.write(stale)
+
+        recovered = recover(tmp_path)
+        assert recovered.contexts[context.id].content["text"] == "versão final"
+
+
+class TestMCPLogCompaction:
+    """Testes de compactação do log"""
+
+    def test_compaction_keeps_latest_state(self, tmp_path, logged):
+        """Compactação descarta registros mortos sem alterar o estado"""
+        protocol, log = logged
+        contexts = [make_context(f"texto {i}") for i in range(5)]
+        protocol.add_contexts(contexts)
+        for version in range(10):
+            protocol.update_context(contexts[0].id, {"versao": version})
+        protocol.remove_context(contexts[1].id)
+        before = log.get_stats()
+        assert before["dead_records"] == 11
+
+        log.compact()
+        after = log.get_stats()
+        assert after["compactions"] == 1
+        assert after["records"] == 5
+        assert after["log_bytes"] < before["log_bytes"]
+
+        protocol.add_context(make_context("depois da compactação"))
+        log.close()
+        recovered = recover(tmp_path)
+        assert list(recovered.contexts) == list(protocol.contexts)
+        assert recovered.contexts[contexts[0].id].content["versao"] == 9
+
+    def test_rotation_during_compaction(self, tmp_path, logged):
+        """Snapshot que rotaciona o log durante a compactação não derruba a thread"""
+        protocol, log = logged
+        context = make_context("muito atualizado")
+        protocol.add_context(context)
+        for version in range(20):
+            protocol.update_context(context.id, {"versao": version})
+
+        lock = log._lock
+
+        class RotateOnRelease:
+            """Trava que rotaciona o log logo após a primeira liberação"""
+            armed = True
+
+            def __enter__(self):
+                return lock.__enter__()
+
+            def __exit__(self, *exc_info):
+                lock.__exit__(*exc_info)
+                if self.armed:
+                    self.armed = False
+                    log._lock = lock
+                    log.snapshot()
+
+        log._lock = RotateOnRelease()
+        log._compact()
+        assert log._lock is lock
+        assert log.compactions == 0
+
+        protocol.update_context(context.id, {"versao": 20})
+        log.close()
+        assert recover(tmp_path).contexts[context.id].content["versao"] == 20
+
+    def test_compaction_is_triggered(self, tmp_path):
+        """Compactação em segundo plano começa ao passar da fração de registros mortos"""
+        protocol = MCPProtocol()
+        log = MCPLog(str(tmp_path), snapshot_every=None, compact_ratio=0.5, compact_min_records=10)
+        log.recover(protocol)
+        context = make_context("muito atualizado")
+        protocol.add_context(context)
+        for version in range(20):
+            protocol.update_context(context.id, {"versao": version})
+        log.close()
+
+        assert log.compactions >= 1
+        assert recover(tmp_path).contexts[context.id].content["versao"] == 19
+
+
+class TestMCPProtocolReplacement:
+    """Testes de substituição de contexto com o mesmo ID"""
+
+    def test_add_context_replaces_indexes(self):
+        """Readicionar um ID atualiza os índices e mantém a ordem"""
+        protocol = MCPProtocol()
+        first = make_context("primeiro", tags=["antiga"])
+        second = make_context("segundo")
+        protocol.add_context(first)
+        protocol.add_context(second)
+
+        replacement = MCPContext.from_dict(dict(first.to_dict(), tags=["nova"],
+                                                context_type=ContextType.TASK.value))
+        protocol.add_context(replacement)
+        assert protocol.find_contexts_by_tag("antiga") == []
+        assert protocol.find_contexts_by_tag("nova") == [replacement]
+        assert protocol.find_contexts_by_type(ContextType.CONVERSATION) == [second]
+        assert [c.id for c in protocol.query_contexts()] == [first.id, second.id]
@@ -9,6 +9,7 @@ from unittest.mock import Mock, patch
 import sys
 import os
 from datetime import datetime, timedelta
+import copy
 import json
 
 # Adiciona o diretório pai ao path para imports
@@ -176,6 +177,47 @@ class TestMCPContext:
         context2.update_content({"message": "different"})
         assert context1.get_hash() != context2.get_hash()
     
+    def test_cached_text_is_reused_until_update(self):
+        """Texto normalizado, tokens e hash são calculados uma vez por versão"""
+        context = MCPContext.create(
+            context_type=ContextType.CONVERSATION,
+            content={"message": "Olá Mundo", "user": "Ana"}
+        )
+
+        text = context.searchable_text()
+        assert text == json.dumps(context.content, sort_keys=True).lower()
+        assert context.searchable_text() is text
+        assert context.term_counts()["mundo"] == 1
+        original_hash = context.get_hash()
+        assert context.get_hash() is original_hash
+
+        context.update_content({"message": "outro texto"})
+        assert "outro" in context.searchable_text()
+        assert "mundo" not in context.term_counts()
+        assert context.get_hash() != original_hash
+
+    def test_content_assignment_invalidates_cache(self):
+        """Atribuir um novo conteúdo descarta texto, tokens e hash em cache"""
+        context = MCPContext.create(ContextType.MEMORY, {"data": "antigo"})
+        original_hash = context.get_hash()
+        assert "antigo" in context.term_counts()
+        context._tokens = ((1.0,), 99)
+
+        context.content = {"data": "novo"}
+        assert context.get_hash() != original_hash
+        assert "novo" in context.searchable_text()
+        assert "antigo" not in context.term_counts()
+        assert context._tokens is None
+
+    def test_cache_not_part_of_dict_or_equality(self):
+        """Cache não aparece na serialização nem na comparação"""
+        context = MCPContext.create(ContextType.MEMORY, {"data": "x"})
+        twin = MCPContext.from_dict(context.to_dict())
+        context.searchable_text()
+
+        assert "_search_text" not in context.to_dict()
+        assert context == twin
+
     def test_to_dict(self):
         """Testa conversão para dicionário"""
         context = MCPContext.create(
@@ -192,6 +234,82 @@ class TestMCPContext:
         assert context_dict['content'] == {"message": "test"}
         assert context_dict['tags'] == ["test"]
     
+    def test_compact_storage(self):
+        """Sem __dict__ por instância, contêineres sob demanda e tags internadas"""
+        context = MCPContext.create(ContextType.MEMORY, {"x": 1})
+        assert not hasattr(context, "__dict__")
+        assert context._tags is None and context._metadata is None
+        assert context.iter_tags() == ()
+
+        context.add_tag("".join(["ana", "lysis"]))
+        other = MCPContext.create(ContextType.MEMORY, {"x": 2}, tags=["".join(["ana", "lysis"])])
+        assert context.tags[0] is other.tags[0]
+
+        context.metadata["k"] = "v"
+        assert context.to_dict()["metadata"] == {"k": "v"}
+
+    def test_pickle_round_trip(self):
+        """Contextos com slots continuam serializáveis com pickle"""
+        import pickle
+        context = MCPContext.create(ContextType.MEMORY, {"x": 1}, tags=["a"])
+        context.get_hash()
+        copy = pickle.loads(pickle.dumps(context))
+
+        assert copy == context
+        assert copy.get_hash() == context.get_hash()
+
+    def test_timestamps_are_numeric(self):
+        """Datas ficam em epoch; ISO é derivado e aceito nos setters"""
+        context = MCPContext.create(ContextType.MEMORY, {"x": 1}, expires_in_hours=1)
+        assert isinstance(context.created_ts, float)
+        assert context.expires_ts - context.created_ts == pytest.approx(3600)
+
+        moment = datetime(2024, 5, 1, 12, 30, 0, 250)
+        context.expires_at = moment.isoformat()
+        assert context.expires_ts == moment.timestamp()
+        assert context.expires_at == moment.isoformat()
+        context.expires_at = None
+        assert context.expires_ts is None
+
+    def test_is_expired_does_not_parse(self):
+        """Verificação de expiração não converte strings"""
+        context = MCPContext.create(ContextType.MEMORY, {"x": 1}, expires_in_hours=1)
+        with patch("protocols.mcp.datetime") as mocked:
+            assert not context.is_expired()
+            assert context.is_expired(now=context.expires_ts + 1)
+        mocked.fromisoformat.assert_not_called()
+
+    def test_dict_round_trip(self):
+        """to_dict gera ISO e from_dict aceita ISO ou epoch"""
+        context = MCPContext.create(ContextType.MEMORY, {"x": 1}, expires_in_hours=2)
+        data = context.to_dict()
+
+        assert "created_ts" not in data
+        assert datetime.fromisoformat(data["expires_at"]).timestamp() == context.expires_ts
+        assert MCPContext.from_dict(data) == context
+
+        data["created_at"] = context.created_ts
+        assert MCPContext.from_dict(data).created_ts == context.created_ts
+
+    def test_constructor_accepts_iso_dates(self):
+        """Construtor aceita created_at, updated_at e expires_at em ISO"""
+        now = datetime.now()
+        context = MCPContext(
+            id="legacy", context_type=ContextType.MEMORY, content={"data": "x"},
+            priority=ContextPriority.LOW, created_at=now.isoformat(), updated_at=now.isoformat(),
+            expires_at=(now + timedelta(hours=1)).isoformat()
+        )
+        assert context.created_ts == now.timestamp()
+        assert context.created_at == now.isoformat()
+        assert not context.is_expired()
+
+        positional = MCPContext("p", ContextType.MEMORY, {}, ContextPriority.LOW,
+                                now.isoformat(), now.isoformat())
+        assert positional.updated_ts == now.timestamp()
+        with pytest.raises(TypeError):
+            MCPContext("x", ContextType.MEMORY, {}, ContextPriority.LOW, created_ts=1.0,
+                       created_at=now.isoformat(), updated_ts=1.0)
+
     def test_from_dict(self):
         """Testa criação a partir de dicionário"""
         context_data = {
@@ -231,6 +349,50 @@ class TestMCPSession:
         assert len(session.context_ids) == 0
         assert isinstance(session.metadata, dict)
 
+    def test_session_timestamps(self):
+        """Sessões também guardam epoch e expõem ISO"""
+        session = MCPSession.create("test_session")
+        assert isinstance(session.updated_ts, float)
+        assert datetime.fromisoformat(session.created_at).timestamp() == session.created_ts
+
+    def test_legacy_constructor(self):
+        """Construtor aceita datas ISO e a lista de contextos, como antes"""
+        now = datetime.now().isoformat()
+        session = MCPSession("s1", "legacy", now, now, ["a", "b"])
+        assert session.created_at == now
+        assert session.context_ids == ["a", "b"]
+
+        named = MCPSession(id="s2", name="legacy", created_at=now, updated_at=now, context_ids=["c"])
+        assert named.updated_ts == session.updated_ts
+        assert named.members == {"c": None}
+        with pytest.raises(TypeError):
+            MCPSession("s3", "legacy")
+
+    def test_membership_operations(self):
+        """Membros mantêm ordem de inserção e removem em O(1)"""
+        session = MCPSession.create("test_session")
+        for context_id in ("a", "b", "c"):
+            session.add_context_id(context_id)
+
+        assert session.remove_context_id("b")
+        assert not session.remove_context_id("b")
+        assert session.context_ids == ["a", "c"]
+
+        session.context_ids = ["x", "y"]
+        assert session.members == {"x": None, "y": None}
+
+    def test_context_ids_is_read_only(self):
+        """Alterar a lista retornada falha em vez de ser ignorado"""
+        session = MCPSession.create("test_session")
+        session.add_context_id("a")
+
+        with pytest.raises(TypeError):
+            session.context_ids.append("b")
+        with pytest.raises(TypeError):
+            session.context_ids.remove("a")
+        assert session.context_ids == ["a"]
+        assert copy.copy(session.context_ids) + ["b"] == ["a", "b"]
+
 
 class TestMCPProtocol:
     """Testes para a classe MCPProtocol"""
@@ -549,5 +711,633 @@ class TestMCPProtocol:
         assert summary['total_contexts'] == 5
 
 
+def _reference_relevant_contexts(protocol, query, max_results=10):
+    """Implementação original por varredura completa, usada como referência"""
+    query_words = query.lower().split()
+    scored_contexts = []
+    for context in protocol.contexts.values():
+        if context.is_expired():
+            continue
+        score = 0
+        content_str = json.dumps(context.content).lower()
+        for word in query_words:
+            score += content_str.count(word)
+        for tag in context.tags:
+            if any(word in tag.lower() for word in query_words):
+                score += 2
+        score += context.priority.value
+        if score > 0:
+            scored_contexts.append((score, context))
+    scored_contexts.sort(key=lambda x: x[0], reverse=True)
+    return [ctx for _, ctx in scored_contexts[:max_results]]
+
+
+class TestMCPInvertedIndex:
+    """Testes para o índice invertido usado na busca por relevância"""
+
+    @pytest.fixture
+    def populated_protocol(self):
+        """Protocolo com contextos variados"""
+        import random
+        rng = random.Random(42)
+        words = ["python", "programming", "java", "script", "data", "análise",
+                 "tutorial", "web", "cooking", "recipes", "pro", "gram"]
+        protocol = MCPProtocol(max_contexts=1000)
+        for i in range(200):
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+            protocol.add_context(MCPContext.create(
+                context_type=rng.choice(list(ContextType)),
+                content={"message": text, "n": i},
+                priority=rng.choice(list(ContextPriority)),
+                tags=rng.sample(words, rng.randint(0, 2))
+            ))
+        return protocol
+
+    @pytest.mark.parametrize("query", [
+        "python programming", "pro", "gram data", "web-script", "\"message\":",
+        "nothing matches here", "", "a", "análise", "Python PYTHON"
+    ])
+    def test_matches_reference_scoring(self, populated_protocol, query):
+        """Resultados idênticos à varredura completa"""
+        for max_results in (1, 5, 10, 50):
+            expected = _reference_relevant_contexts(populated_protocol, query, max_results)
+            assert populated_protocol.get_relevant_contexts(query, max_results) == expected
+
+    def test_repeated_tags_match_reference(self):
+        """Tags repetidas somam 2 por ocorrência, como na varredura completa"""
+        import random
+        rng = random.Random(7)
+        tags = ["python", "dados", "web"]
+        protocol = MCPProtocol(max_contexts=1000)
+        session_id = protocol.create_session("tags")
+        for i in range(100):
+            protocol.add_context(MCPContext.create(
+                ContextType.KNOWLEDGE, {"message": f"nota {i}"},
+                tags=rng.choices(tags, k=rng.randint(0, 4))
+            ), session_id=session_id)
+
+        for query in ("python", "dados web", "py"):
+            expected = _reference_relevant_contexts(protocol, query, 20)
+            assert protocol.get_relevant_contexts(query, 20) == expected
+            assert protocol.get_relevant_contexts(query, 20, session_id=session_id) == expected
+
+    def test_index_tracks_update_and_remove(self, populated_protocol):
+        """Índice acompanha atualizações e remoções"""
+        context_id = next(iter(populated_protocol.contexts))
+        populated_protocol.update_context(context_id, {"message": "zebra " * 10})
+        assert populated_protocol.get_relevant_contexts("zebra", 1)[0].id == context_id
+        assert "zebra" in populated_protocol.term_index.postings
+
+        populated_protocol.remove_context(context_id)
+        assert context_id not in populated_protocol.term_index
+        assert "zebra" not in populated_protocol.term_index.postings
+        assert populated_protocol.get_relevant_contexts("zebra", 5) == \
+            _reference_relevant_contexts(populated_protocol, "zebra", 5)
+
+    def test_expand_substring_lookup(self):
+        """Expansão encontra tokens que contêm a palavra"""
+        from protocols.mcp import InvertedIndex
+        index = InvertedIndex()
+        index.add("a", {"programming": 2, "python": 1})
+        index.add("b", {"grammar": 1})
+
+        assert sorted(index.expand("gram")) == [("grammar", 1), ("programming", 1)]
+        assert index.expand("zzz") == []
+
+        index.remove("b")
+        assert index.expand("gram") == [("programming", 1)]
+
+
+class TestMCPTextCache:
+    """Testes para o cache de texto normalizado mantido pelo protocolo"""
+
+    def test_cache_is_reported_and_capped(self):
+        """Memória do cache é reportada e respeita o limite"""
+        protocol = MCPProtocol(max_contexts=100, text_cache_limit=2000)
+        contexts = [MCPContext.create(ContextType.KNOWLEDGE, {"text": "palavra " * 20}) for _ in range(20)]
+        for context in contexts:
+            protocol.add_context(context)
+
+        stats = protocol.get_cache_stats()
+        assert 0 < stats["text_cache_bytes"] <= 2000
+        assert stats["text_cache_limit"] == 2000
+        assert stats["text_cache_contexts"] < 20
+        # Os mais antigos liberaram o texto, mas continuam pesquisáveis
+        assert contexts[0]._search_text is None
+        assert contexts[-1]._search_text is not None
+        assert protocol.get_relevant_contexts("palavra", max_results=20)[0] in contexts
+
+    def test_cache_released_on_remove(self):
+        """Remoção deixa de contabilizar o texto em cache"""
+        protocol = MCPProtocol()
+        context = MCPContext.create(ContextType.KNOWLEDGE, {"text": "algum conteúdo"})
+        protocol.add_context(context)
+        assert protocol.get_cache_stats()["text_cache_bytes"] > 0
+
+        protocol.remove_context(context.id)
+        stats = protocol.get_cache_stats()
+        assert stats["text_cache_contexts"] == 0
+        assert stats["text_cache_bytes"] == 0
+
+
+class TestMCPQueryCache:
+    """Testes para o cache de resultados de busca"""
+
+    @pytest.fixture
+    def protocol(self):
+        """Protocolo com alguns contextos"""
+        protocol = MCPProtocol(query_cache_size=2)
+        for text in ("python tutorial", "java tutorial", "cooking"):
+            protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": text}))
+        return protocol
+
+    def test_hits_on_normalized_query(self, protocol):
+        """Queries equivalentes após normalização reutilizam o resultado"""
+        first = protocol.get_relevant_contexts("Python  tutorial", max_results=2)
+        second = protocol.get_relevant_contexts("python tutorial", max_results=2)
+
+        assert first == second
+        assert first is not second
+        stats = protocol.get_cache_stats()
+        assert (stats["query_cache_hits"], stats["query_cache_misses"]) == (1, 1)
+
+        protocol.get_relevant_contexts("python tutorial", max_results=3)
+        assert protocol.get_cache_stats()["query_cache_misses"] == 2
+
+    @pytest.mark.parametrize("mutation", ["add", "update", "remove"])
+    def test_invalidated_by_mutations(self, protocol, mutation):
+        """Qualquer mutação do acervo invalida os resultados em cache"""
+        protocol.get_relevant_contexts("tutorial")
+        generation = protocol.generation
+        target = next(iter(protocol.contexts))
+        if mutation == "add":
+            protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": "tutorial novo"}))
+        elif mutation == "update":
+            protocol.update_context(target, {"text": "tutorial tutorial tutorial"})
+        else:
+            protocol.remove_context(target)
+
+        assert protocol.generation > generation
+        results = protocol.get_relevant_contexts("tutorial")
+        assert protocol.query_cache_hits == 0
+        assert results == _reference_relevant_contexts(protocol, "tutorial")
+
+    def test_expired_results_are_not_served(self, protocol):
+        """Resultado com contexto expirado é recalculado"""
+        results = protocol.get_relevant_contexts("cooking", max_results=1)
+        results[0].expires_at = (datetime.now() - timedelta(hours=1)).isoformat()
+
+        assert protocol.get_relevant_contexts("cooking", max_results=1) != results
+        assert protocol.query_cache_hits == 0
+
+    def test_lru_bounded(self, protocol):
+        """Cache descarta as entradas menos usadas"""
+        for query in ("a", "b", "c"):
+            protocol.get_relevant_contexts(query)
+        assert protocol.get_cache_stats()["query_cache_entries"] == 2
+
+        protocol.get_relevant_contexts("a")
+        assert protocol.query_cache_hits == 0
+
+
+class TestMCPBM25:
+    """Testes para a pontuação BM25"""
+
+    @pytest.fixture
+    def protocol(self):
+        """Protocolo configurado com BM25"""
+        return MCPProtocol(max_contexts=100, scoring="bm25")
+
+    def test_scoring_selection(self, protocol):
+        """Método de pontuação é escolhido por instância"""
+        from protocols.mcp import ScoringMethod
+        assert protocol.scoring == ScoringMethod.BM25
+        assert MCPProtocol().scoring == ScoringMethod.KEYWORD
+        with pytest.raises(ValueError):
+            MCPProtocol(scoring="unknown")
+
+    def test_corpus_statistics_are_incremental(self, protocol):
+        """Tamanhos e frequências acompanham inserção, atualização e remoção"""
+        first = MCPContext.create(ContextType.KNOWLEDGE, {"text": "python python java"})
+        second = MCPContext.create(ContextType.KNOWLEDGE, {"text": "python"})
+        protocol.add_context(first)
+        protocol.add_context(second)
+
+        index = protocol.term_index
+        assert index.document_frequency("python") == 2
+        assert index.doc_lengths[first.id] == 4  # "text" + 3 palavras
+        assert index.average_length == 3.0
+
+        protocol.update_context(second.id, {"text": "java"})
+        assert index.document_frequency("python") == 1
+        assert index.document_frequency("java") == 2
+
+        protocol.remove_context(first.id)
+        assert index.document_frequency("python") == 0
+        assert index.total_length == 2
+
+    def test_ranks_rare_terms_and_short_documents(self, protocol):
+        """Termos raros e documentos curtos são favorecidos"""
+        short = MCPContext.create(ContextType.KNOWLEDGE, {"text": "python tutorial"})
+        long = MCPContext.create(ContextType.KNOWLEDGE, {"text": "python " + "filler " * 50})
+        common = [MCPContext.create(ContextType.KNOWLEDGE, {"text": f"tutorial {i}"}) for i in range(5)]
+        for context in [long, short] + common:
+            protocol.add_context(context)
+
+        results = protocol.get_relevant_contexts("python", max_results=5)
+        assert results == [short, long]
+
+    @pytest.mark.parametrize("k", [1, 3, 10, 500])
+    def test_top_k_matches_exhaustive_scoring(self, protocol, k):
+        """Poda MaxScore retorna os mesmos escores que a pontuação exaustiva"""
+        import random
+        rng = random.Random(k)
+        words = [f"w{i}" for i in range(40)]
+        for _ in range(300):
+            text = " ".join(rng.choices(words, weights=range(40, 0, -1), k=rng.randint(1, 30)))
+            protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": text}))
+
+        index = protocol.term_index
+        for query in (["w0", "w17"], ["w3", "w3", "w25", "w39"], ["w1", "w2", "w5", "missing"]):
+            exhaustive = sorted(index.bm25_scores(query).values(), reverse=True)[:k]
+            top = index.bm25_top_k(query, k)
+            assert [score for score, _ in top] == pytest.approx(exhaustive)
+
+    def test_top_k_breaks_ties_by_insertion_order(self, protocol):
+        """Empates preservam a ordem de inserção"""
+        contexts = [MCPContext.create(ContextType.KNOWLEDGE, {"text": "same words"}) for _ in range(5)]
+        for context in contexts:
+            protocol.add_context(context)
+
+        assert protocol.get_relevant_contexts("same", max_results=3) == contexts[:3]
+
+    def test_excludes_contexts_without_matching_terms(self, protocol):
+        """Contextos sem termos em comum não entram só pela prioridade"""
+        protocol.add_context(MCPContext.create(
+            ContextType.SYSTEM, {"text": "critical config"}, priority=ContextPriority.CRITICAL
+        ))
+        assert protocol.get_relevant_contexts("python") == []
+
+    def test_matches_accented_terms(self, protocol):
+        """Termos acentuados são indexados como escritos, sem escapes JSON"""
+        report = MCPContext.create(ContextType.KNOWLEDGE, {"text": "relatório de produção anual"})
+        protocol.add_context(report)
+        protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": "relatorio sem acento"}))
+
+        scored = protocol.score_relevant_contexts("relatório produção")
+        assert [context for _, context in scored] == [report]
+        assert "u00f3" not in protocol.term_index.postings
+
+
+class TestMCPSecondaryIndexes:
+    """Testes para os índices secundários e consultas compostas"""
+
+    @pytest.fixture
+    def protocol(self):
+        """Protocolo com contextos variados"""
+        protocol = MCPProtocol(max_contexts=100)
+        session_id = protocol.create_session("Sessão")
+        protocol.test_session = session_id
+        specs = [
+            (ContextType.TASK, ContextPriority.HIGH, ["analysis"], session_id, None),
+            (ContextType.TASK, ContextPriority.LOW, ["analysis"], session_id, None),
+            (ContextType.TASK, ContextPriority.CRITICAL, ["analysis", "urgent"], None, "parent-1"),
+            (ContextType.MEMORY, ContextPriority.HIGH, ["analysis"], session_id, "parent-1"),
+            (ContextType.TASK, ContextPriority.MEDIUM, ["report"], None, None),
+        ]
+        protocol.test_contexts = []
+        for context_type, priority, tags, session, parent in specs:
+            context = MCPContext.create(context_type, {"text": "x"}, priority=priority,
+                                        tags=tags, parent_id=parent)
+            protocol.add_context(context, session_id=session)
+            protocol.test_contexts.append(context)
+        return protocol
+
+    def test_composed_query(self, protocol):
+        """Interseção de tipo, tag e prioridade mínima"""
+        first, _, third, _, _ = protocol.test_contexts
+        results = protocol.query_contexts(context_type=ContextType.TASK,
+                                          min_priority=ContextPriority.HIGH,
+                                          tags=["analysis"])
+        assert results == [first, third]
+
+    def test_session_and_parent_filters(self, protocol):
+        """Filtros por sessão e por contexto pai"""
+        contexts = protocol.test_contexts
+        assert protocol.query_contexts(session_id=protocol.test_session) == contexts[:2] + [contexts[3]]
+        assert protocol.query_contexts(parent_id="parent-1", tags=["analysis"]) == contexts[2:4]
+        assert protocol.query_contexts(tags=["analysis", "report"]) == []
+        assert protocol.query_contexts(tags=["missing"]) == []
+        assert protocol.query_contexts() == contexts
+
+    def test_indexes_follow_removal(self, protocol):
+        """Remoção limpa todos os índices secundários"""
+        third = protocol.test_contexts[2]
+        protocol.remove_context(third.id)
+
+        assert "urgent" not in protocol.context_index
+        assert "parent-1" in protocol._parent_index
+        assert protocol.query_contexts(min_priority=ContextPriority.CRITICAL) == []
+        assert third not in protocol.find_contexts_by_type(ContextType.TASK)
+
+    def test_expired_contexts_are_removed(self, protocol):
+        """Contextos expirados não aparecem e são removidos na consulta"""
+        first = protocol.test_contexts[0]
+        first.expires_at = (datetime.now() - timedelta(hours=1)).isoformat()
+
+        assert first not in protocol.find_contexts_by_tag("analysis")
+        assert first.id not in protocol.contexts
+
+
+class TestMCPExpiryScheduler:
+    """Testes para a agenda de expiração"""
+
+    @pytest.fixture
+    def protocol(self):
+        """Protocolo vazio"""
+        return MCPProtocol(max_contexts=1000)
+
+    def _expired(self, hours=1):
+        return (datetime.now() - timedelta(hours=hours)).isoformat()
+
+    def test_only_scheduled_contexts_are_examined(self, protocol):
+        """Contextos sem expiração não entram no heap"""
+        for i in range(10):
+            protocol.add_context(MCPContext.create(ContextType.MEMORY, {"i": i}))
+        protocol.add_context(MCPContext.create(ContextType.MEMORY, {"i": 10}, expires_in_hours=1))
+
+        assert len(protocol._expiry_heap) == 1
+        with patch.object(MCPContext, "is_expired", side_effect=AssertionError):
+            protocol._cleanup_expired_contexts()
+
+    def test_removed_contexts_are_skipped(self, protocol):
+        """Entradas de contextos removidos são descartadas ao vencer"""
+        context = MCPContext.create(ContextType.MEMORY, {"x": 1})
+        context.expires_at = self._expired()
+        protocol.add_context(context)
+        protocol.remove_context(context.id)
+
+        protocol._cleanup_expired_contexts()
+        assert protocol._expiry_heap == []
+
+    def test_changed_expiry_is_rescheduled(self, protocol):
+        """Expiração alterada adia ou antecipa a remoção"""
+        postponed = MCPContext.create(ContextType.MEMORY, {"x": 1})
+        postponed.expires_at = self._expired()
+        protocol.add_context(postponed)
+        postponed.expires_at = (datetime.now() + timedelta(hours=1)).isoformat()
+
+        anticipated = MCPContext.create(ContextType.MEMORY, {"x": 2}, expires_in_hours=5)
+        protocol.add_context(anticipated)
+        assert protocol.set_context_expiry(anticipated.id, self._expired())
+        assert not protocol.set_context_expiry("missing", None)
+
+        protocol._cleanup_expired_contexts()
+        assert postponed.id in protocol.contexts
+        assert anticipated.id not in protocol.contexts
+        assert postponed.expires_ts in {entry[0] for entry in protocol._expiry_heap}
+
+    def test_stale_entries_are_compacted(self, protocol):
+        """Heap é reconstruído quando as entradas obsoletas predominam"""
+        context = MCPContext.create(ContextType.MEMORY, {"x": 1}, expires_in_hours=1)
+        protocol.add_context(context)
+        for hours in range(2, 200):
+            protocol.set_context_expiry(context.id, (datetime.now() + timedelta(hours=hours)).isoformat())
+
+        assert len(protocol._expiry_heap) <= 64
+
+
+class TestMCPSessionMembership:
+    """Testes para o índice reverso contexto -> sessões"""
+
+    def test_remove_only_visits_owning_sessions(self):
+        """Remoção atualiza só as sessões que contêm o contexto"""
+        protocol = MCPProtocol(max_contexts=100)
+        owner = protocol.create_session("dona")
+        others = [protocol.create_session(f"outra {i}") for i in range(50)]
+        context = MCPContext.create(ContextType.MEMORY, {"x": 1})
+        protocol.add_context(context, session_id=owner)
+        untouched = protocol.sessions[others[0]].updated_at
+
+        assert protocol._context_sessions[context.id] == {owner: None}
+        protocol.remove_context(context.id)
+
+        assert protocol.sessions[owner].context_ids == []
+        assert context.id not in protocol._context_sessions
+        assert protocol.sessions[others[0]].updated_at == untouched
+
+    def test_eviction_updates_sessions(self):
+        """Contextos despejados saem das suas sessões"""
+        protocol = MCPProtocol(max_contexts=3)
+        session_id = protocol.create_session("sessão")
+        contexts = [MCPContext.create(ContextType.MEMORY, {"i": i}) for i in range(5)]
+        for context in contexts:
+            protocol.add_context(context, session_id=session_id)
+
+        assert protocol.sessions[session_id].context_ids == [c.id for c in contexts[2:]]
+        assert protocol.get_session_contexts(session_id) == contexts[2:]
+
+
+class TestMCPBulkOperations:
+    """Testes para inserção e remoção em lote"""
+
+    def _contexts(self, count, **kwargs):
+        return (MCPContext.create(ContextType.KNOWLEDGE, {"text": f"item {i}"}, tags=["kb"], **kwargs)
+                for i in range(count))
+
+    def test_add_contexts_from_generator(self):
+        """Gerador é consumido em lotes e indexado como add_context"""
+        protocol = MCPProtocol(max_contexts=100)
+        session_id = protocol.create_session("kb")
+        generation = protocol.generation
+
+        ids = protocol.add_contexts(self._contexts(25), session_id=session_id, batch_size=10)
+
+        assert len(ids) == 25
+        assert protocol.generation == generation + 3
+        assert protocol.sessions[session_id].context_ids == ids
+        assert [ctx.id for ctx in protocol.find_contexts_by_tag("kb")] == ids
+        assert protocol.get_relevant_contexts("item", max_results=1)
+
+    def test_add_contexts_respects_capacity(self):
+        """Despejo por lote mantém o limite de contextos"""
+        protocol = MCPProtocol(max_contexts=10, eviction="lru")
+        ids = protocol.add_contexts(self._contexts(35), batch_size=4)
+
+        assert len(protocol.contexts) == 10
+        assert list(protocol.contexts) == ids[-10:]
+        assert protocol.get_cache_stats()["eviction_evictions"] == 25
+
+    def test_add_contexts_cleans_expired_once(self):
+        """Limpeza de expirados roda uma vez por chamada"""
+        protocol = MCPProtocol(max_contexts=100)
+        with patch.object(protocol, "_cleanup_expired_contexts") as cleanup:
+            protocol.add_contexts(self._contexts(30), batch_size=5)
+        cleanup.assert_called_once()
+
+    def test_remove_contexts(self):
+        """Remoção em lote ignora ids ausentes e incrementa a geração uma vez"""
+        protocol = MCPProtocol(max_contexts=100)
+        ids = protocol.add_contexts(self._contexts(5))
+        generation = protocol.generation
+
+        removed = protocol.remove_contexts(cid for cid in ids[:3] + ["missing"])
+
+        assert removed == 3
+        assert protocol.generation == generation + 1
+        assert list(protocol.contexts) == ids[3:]
+        assert "kb" in protocol.context_index
+        assert protocol.remove_contexts([]) == 0
+
+
+class TestMCPSessionScopedRetrieval:
+    """Testes para a busca restrita a sessões"""
+
+    @pytest.fixture(params=["keyword", "bm25"])
+    def protocol(self, request):
+        """Protocolo com duas sessões de usuário e uma de conhecimento"""
+        protocol = MCPProtocol(max_contexts=100, scoring=request.param)
+        protocol.alice = protocol.create_session("alice")
+        protocol.bob = protocol.create_session("bob")
+        protocol.kb = protocol.create_session("kb")
+        protocol.add_context(MCPContext.create(ContextType.CONVERSATION, {"text": "senha do banco da alice"}),
+                             session_id=protocol.alice)
+        protocol.add_context(MCPContext.create(ContextType.CONVERSATION, {"text": "senha do banco do bob"}),
+                             session_id=protocol.bob)
+        protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": "como trocar a senha"}),
+                             session_id=protocol.kb)
+        protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": "senha global"}))
+        return protocol
+
+    def _texts(self, contexts):
+        return [ctx.content["text"] for ctx in contexts]
+
+    def test_scope_excludes_other_sessions(self, protocol):
+        """Contextos de outras sessões não vazam para a busca"""
+        results = protocol.get_relevant_contexts("senha", session_id=protocol.alice)
+        assert self._texts(results) == ["senha do banco da alice"]
+
+    def test_shared_sessions(self, protocol):
+        """Sessões compartilhadas entram no escopo"""
+        results = protocol.get_relevant_contexts("senha", session_id=protocol.alice,
+                                                 shared_session_ids=[protocol.kb, protocol.alice])
+        assert sorted(self._texts(results)) == ["como trocar a senha", "senha do banco da alice"]
+        assert len(protocol.get_relevant_contexts("senha")) == 4
+
+    def test_scoped_scores_match_global(self, protocol):
+        """Ordem dentro do escopo é a mesma da busca global filtrada"""
+        scope = [protocol.alice, protocol.bob]
+        members = set(protocol.sessions[protocol.alice].members) | set(protocol.sessions[protocol.bob].members)
+        expected = [ctx for ctx in protocol.get_relevant_contexts("senha banco bob") if ctx.id in members]
+        assert protocol.get_relevant_contexts("senha banco bob", shared_session_ids=scope) == expected
+
+    def test_session_postings_follow_mutations(self, protocol):
+        """Postings da sessão acompanham atualização e remoção"""
+        context = protocol.get_session_contexts(protocol.alice)[0]
+        protocol.update_context(context.id, {"text": "receita de bolo"})
+        assert protocol.get_relevant_contexts("bolo", session_id=protocol.alice) == [context]
+        assert context not in protocol.get_relevant_contexts("bolo", session_id=protocol.bob)
+
+        protocol.remove_context(context.id)
+        assert len(protocol._session_term_index[protocol.alice]) == 0
+        assert protocol.get_relevant_contexts("bolo", session_id=protocol.alice) == []
+
+    def test_scope_is_part_of_cache_key(self, protocol):
+        """Cache não mistura resultados de escopos diferentes"""
+        alice = protocol.get_relevant_contexts("senha", session_id=protocol.alice)
+        bob = protocol.get_relevant_contexts("senha", session_id=protocol.bob)
+        assert alice != bob
+        assert protocol.query_cache_hits == 0
+
+
+class TestMCPContextTree:
+    """Testes para a árvore de contextos (parent_id/children_ids)"""
+
+    @pytest.fixture
+    def protocol(self):
+        """Conversa encadeada: raiz -> pergunta -> (resposta -> réplica, comentário)"""
+        protocol = MCPProtocol(max_contexts=100, scoring="bm25")
+        root = MCPContext.create(ContextType.CONVERSATION, {"text": "início da conversa"})
+        question = MCPContext.create(ContextType.CONVERSATION, {"text": "pergunta sobre impostos"},
+                                     parent_id=root.id)
+        answer = MCPContext.create(ContextType.CONVERSATION, {"text": "resposta com tributos"},
+                                   parent_id=question.id)
+        comment = MCPContext.create(ContextType.CONVERSATION, {"text": "comentário lateral"},
+                                    parent_id=question.id)
+        reply = MCPContext.create(ContextType.CONVERSATION, {"text": "réplica final"}, parent_id=answer.id)
+        # Filho chega antes do pai: o vínculo é feito quando o pai é adicionado
+        protocol.add_contexts([root, reply, question, answer, comment])
+        protocol.tree = {"root": root, "question": question, "answer": answer,
+                         "comment": comment, "reply": reply}
+        return protocol
+
+    def test_children_ids_are_maintained(self, protocol):
+        """children_ids acompanha inserções, remoções e troca de pai"""
+        tree = protocol.tree
+        assert tree["root"].children_ids == [tree["question"].id]
+        assert tree["question"].children_ids == [tree["answer"].id, tree["comment"].id]
+        assert tree["answer"].children_ids == [tree["reply"].id]
+
+        protocol.remove_context(tree["comment"].id)
+        assert tree["question"].children_ids == [tree["answer"].id]
+
+        moved = MCPContext.create(ContextType.CONVERSATION, {"text": "réplica final"}, parent_id=tree["root"].id)
+        moved.id = tree["reply"].id
+        protocol.add_context(moved)
+        assert tree["answer"].children_ids == []
+        assert tree["root"].children_ids == [tree["question"].id, moved.id]
+
+    def test_subtree_and_ancestors(self, protocol):
+        """Subárvore em pré-ordem e ancestrais do pai à raiz, com limite de profundidade"""
+        tree = protocol.tree
+        assert protocol.get_subtree(tree["question"].id) == [
+            tree["question"], tree["answer"], tree["reply"], tree["comment"]]
+        assert protocol.get_subtree(tree["root"].id, max_depth=1) == [tree["root"], tree["question"]]
+        assert protocol.get_subtree("inexistente") == []
+        assert protocol.get_ancestors(tree["reply"].id) == [tree["answer"], tree["question"], tree["root"]]
+        assert protocol.get_ancestors(tree["reply"].id, max_depth=1) == [tree["answer"]]
+        assert protocol.get_ancestors(tree["root"].id) == []
+
+    def test_cycles_do_not_loop(self):
+        """Ciclos em parent_id não travam a travessia"""
+        protocol = MCPProtocol()
+        first = MCPContext.create(ContextType.MEMORY, {"text": "a"}, parent_id="b")
+        second = MCPContext.create(ContextType.MEMORY, {"text": "b"}, parent_id=first.id)
+        second.id = "b"
+        protocol.add_contexts([first, second])
+        assert protocol.get_subtree(first.id) == [first, second]
+        assert protocol.get_ancestors(first.id) == [second]
+
+    def test_cascade_remove(self, protocol):
+        """Remoção em cascata leva a subárvore e mantém o resto"""
+        tree = protocol.tree
+        assert protocol.remove_context(tree["question"].id, cascade=True)
+        assert set(protocol.contexts) == {tree["root"].id}
+        assert tree["root"].children_ids == []
+        assert protocol.remove_contexts([tree["root"].id], cascade=True) == 1
+
+    def test_cascade_expire(self, protocol):
+        """Expiração em cascata vale para os descendentes e remove na limpeza"""
+        tree = protocol.tree
+        past = datetime.now() - timedelta(seconds=1)
+        assert protocol.set_context_expiry(tree["answer"].id, past, cascade=True)
+        assert tree["reply"].expires_ts == tree["answer"].expires_ts is not None
+        assert tree["comment"].expires_at is None
+
+        protocol.add_context(MCPContext.create(ContextType.TASK, {"text": "gatilho"}))
+        assert tree["answer"].id not in protocol.contexts
+        assert tree["reply"].id not in protocol.contexts
+        assert protocol.get_subtree(tree["question"].id) == [tree["question"], tree["comment"]]
+
+    def test_relevant_contexts_with_parent_chain(self, protocol):
+        """parent_depth inclui os ancestrais de cada resultado, sem repetir"""
+        tree = protocol.tree
+        assert protocol.get_relevant_contexts("final", 1) == [tree["reply"]]
+        assert protocol.get_relevant_contexts("final", 1, parent_depth=2) == [
+            tree["question"], tree["answer"], tree["reply"]]
+        threaded = protocol.get_relevant_contexts("final tributos", 2, parent_depth=5)
+        assert threaded == [tree["root"], tree["question"], tree["answer"], tree["reply"]]
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
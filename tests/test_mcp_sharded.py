@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para o protocolo MCP particionado entre processos
+"""
+
+import pytest
+import sys
+import os
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPProtocol, MCPContext, ContextType, ScoringMethod
+from protocols.mcp_sharded import ShardedMCPProtocol
+
+
+@pytest.fixture(scope="module")
+def sharded():
+    """Protocolo com três shards, compartilhado pelos testes do módulo"""
+    protocol = ShardedMCPProtocol(shards=3, max_contexts=3000, scoring=ScoringMethod.BM25)
+    yield protocol
+    protocol.close()
+
+
+class TestShardedMCPProtocol:
+    """Testes da fachada particionada"""
+
+    def test_routing_and_crud(self, sharded):
+        """Contexto vai para o shard do seu ID e pode ser lido, atualizado e removido"""
+        context = MCPContext.create(ContextType.TASK, {"text": "roteado"})
+        sharded.add_context(context)
+        assert 0 <= sharded.shard_of(context.id) < 3
+
+        assert sharded.get_context(context.id).content == {"text": "roteado"}
+        assert sharded.update_context(context.id, {"text": "alterado"})
+        assert sharded.get_context(context.id).content == {"text": "alterado"}
+        assert sharded.remove_context(context.id)
+        assert sharded.get_context(context.id) is None
+
+    def test_sessions_span_shards(self, sharded):
+        """Sessão existe em todos os shards e devolve contextos em ordem de criação"""
+        session_id = sharded.create_session("particionada")
+        contexts = [MCPContext.create(ContextType.CONVERSATION, {"text": f"mensagem {i}"})
+                    for i in range(30)]
+        sharded.add_contexts(contexts, session_id=session_id, batch_size=4)
+
+        assert {sharded.shard_of(context.id) for context in contexts} == {0, 1, 2}
+        assert [c.id for c in sharded.get_session_contexts(session_id)] == [c.id for c in contexts]
+        assert sharded.remove_contexts(context.id for context in contexts[:10]) == 10
+        assert len(sharded.get_session_contexts(session_id)) == 20
+
+    def test_scatter_gather_matches_single_protocol(self, sharded):
+        """Busca combinada encontra o mesmo melhor resultado que um protocolo único"""
+        session_id = sharded.create_session("busca")
+        local = MCPProtocol(scoring=ScoringMethod.BM25)
+        contexts = [MCPContext.create(ContextType.MEMORY, {"text": f"assunto geral número {i}"})
+                    for i in range(20)]
+        contexts.append(MCPContext.create(ContextType.MEMORY, {"text": "receita de pão de queijo"}))
+        sharded.add_contexts(contexts, session_id=session_id)
+        local.add_contexts(contexts)
+
+        found = sharded.get_relevant_contexts("queijo", 3, session_id=session_id)
+        assert [c.id for c in found] == [c.id for c in local.get_relevant_contexts("queijo", 3)]
+        assert len(sharded.get_relevant_contexts("assunto", 5, session_id=session_id)) == 5
+        assert sharded.get_relevant_contexts("queijo", 0) == []
+
+    def test_summary_and_errors(self, sharded):
+        """Resumo soma os shards e erros do shard chegam ao chamador"""
+        summary = sharded.get_context_summary()
+        assert summary["total_shards"] == 3
+        assert summary["total_contexts"] == sum(summary["contexts_by_type"].values())
+        with pytest.raises(AttributeError):
+            sharded._call(0, "save", "/tmp/nao_permitido")
+
+    def test_close(self):
+        """Depois de encerrado o protocolo recusa chamadas"""
+        with ShardedMCPProtocol(shards=2) as protocol:
+            protocol.create_session("curta")
+        with pytest.raises(RuntimeError):
+            protocol.get_context("qualquer")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para o armazenamento SQLite do protocolo MCP
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPContext, ContextType, ContextPriority
+from protocols.mcp_sqlite import SQLiteMCPProtocol
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Caminho de um banco temporário"""
+    return str(tmp_path / "mcp.db")
+
+
+@pytest.fixture
+def protocol(db_path):
+    """Protocolo SQLite com cache pequeno"""
+    protocol = SQLiteMCPProtocol(db_path, cache_size=2)
+    yield protocol
+    protocol.close()
+
+
+class TestSQLiteStorage:
+    """Testes de persistência e cache"""
+
+    def test_wal_mode(self, protocol):
+        """Banco em arquivo usa WAL"""
+        assert protocol.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_survives_restart(self, db_path):
+        """Contextos e sessões sobrevivem à reabertura do banco"""
+        with SQLiteMCPProtocol(db_path) as protocol:
+            session_id = protocol.create_session("persistente")
+            context = MCPContext.create(ContextType.KNOWLEDGE, {"text": "dados persistidos"},
+                                        priority=ContextPriority.HIGH, tags=["kb"], expires_in_hours=1)
+            context.metadata["fonte"] = "teste"
+            protocol.add_context(context, session_id=session_id)
+
+        with SQLiteMCPProtocol(db_path) as reopened:
+            assert len(reopened.contexts) == 1
+            assert reopened.get_context(context.id) == context
+            assert reopened.sessions[session_id].context_ids == [context.id]
+            assert reopened.get_session_contexts(session_id) == [context]
+
+    def test_write_through_cache(self, protocol):
+        """Cache quente é limitado e atualizações chegam ao banco"""
+        contexts = [MCPContext.create(ContextType.MEMORY, {"i": i}) for i in range(3)]
+        protocol.add_contexts(iter(contexts))
+        assert len(protocol._cache) == 2
+
+        assert protocol.get_context(contexts[0].id) == contexts[0]
+        assert protocol.get_cache_stats()["cache_misses"] == 1
+        assert protocol.get_context(contexts[0].id) is protocol.get_context(contexts[0].id)
+
+        protocol.update_context(contexts[0].id, {"i": 10})
+        protocol._cache.clear()
+        assert protocol.get_context(contexts[0].id).content == {"i": 10}
+
+    def test_remove_and_expiry(self, protocol):
+        """Remoção limpa tags, sessões e FTS; expirados somem"""
+        session_id = protocol.create_session("s")
+        context = MCPContext.create(ContextType.MEMORY, {"text": "efêmero"}, tags=["tmp"])
+        expired = MCPContext.create(ContextType.MEMORY, {"text": "vencido"})
+        expired.expires_at = (datetime.now() - timedelta(hours=1)).isoformat()
+        protocol.add_contexts([context, expired], session_id=session_id)
+
+        assert protocol.get_context(expired.id) is None
+        assert protocol.remove_context(context.id)
+        assert not protocol.remove_context(context.id)
+        assert protocol.sessions[session_id].context_ids == []
+        assert protocol.find_contexts_by_tag("tmp") == []
+        assert protocol.get_relevant_contexts("efêmero") == []
+        assert len(protocol.contexts) == 0
+
+    def test_capacity_evicts_low_priority_first(self, db_path):
+        """Com limite, despeja a menor prioridade e o mais antigo"""
+        with SQLiteMCPProtocol(db_path, max_contexts=2) as protocol:
+            critical = MCPContext.create(ContextType.SYSTEM, {"x": 1}, priority=ContextPriority.CRITICAL)
+            low = MCPContext.create(ContextType.SYSTEM, {"x": 2}, priority=ContextPriority.LOW)
+            medium = MCPContext.create(ContextType.SYSTEM, {"x": 3})
+            protocol.add_contexts([critical, low, medium])
+
+            assert set(protocol.contexts) == {critical.id, medium.id}
+
+
+class TestSQLiteQueries:
+    """Testes das consultas por índice e da busca FTS5"""
+
+    @pytest.fixture
+    def loaded(self, protocol):
+        """Protocolo com contextos de duas sessões"""
+        protocol.alice = protocol.create_session("alice")
+        protocol.bob = protocol.create_session("bob")
+        protocol.items = [
+            MCPContext.create(ContextType.TASK, {"text": "análise de vendas"},
+                              priority=ContextPriority.HIGH, tags=["analysis"]),
+            MCPContext.create(ContextType.TASK, {"text": "relatório de vendas"}, tags=["report"]),
+            MCPContext.create(ContextType.MEMORY, {"text": "vendas do bob"},
+                              priority=ContextPriority.CRITICAL, tags=["analysis"], parent_id="p"),
+        ]
+        protocol.add_contexts(protocol.items[:2], session_id=protocol.alice)
+        protocol.add_context(protocol.items[2], session_id=protocol.bob)
+        return protocol
+
+    def test_query_contexts(self, loaded):
+        """Filtros compostos usam as colunas indexadas"""
+        first, second, third = loaded.items
+        assert loaded.query_contexts(context_type=ContextType.TASK,
+                                     min_priority=ContextPriority.HIGH, tags=["analysis"]) == [first]
+        assert loaded.find_contexts_by_tag("analysis") == [first, third]
+        assert loaded.find_contexts_by_type(ContextType.TASK) == [first, second]
+        assert loaded.query_contexts(parent_id="p", session_id=loaded.bob) == [third]
+
+    def test_fts_relevance(self, loaded):
+        """Busca FTS5 casa prefixos, tags e respeita o escopo de sessão"""
+        first, second, third = loaded.items
+        assert loaded.get_relevant_contexts("relatório") == [second]
+        assert {ctx.id for ctx in loaded.get_relevant_contexts("vend")} == {ctx.id for ctx in loaded.items}
+        assert {ctx.id for ctx in loaded.get_relevant_contexts("analysis")} == {first.id, third.id}
+        assert third not in loaded.get_relevant_contexts("vendas", session_id=loaded.alice)
+        assert loaded.get_relevant_contexts("vendas", session_id=loaded.alice,
+                                            shared_session_ids=[loaded.bob], max_results=1)
+        assert loaded.get_relevant_contexts("...") == []
+
+    def test_summary(self, loaded):
+        """Resumo agregado por SQL"""
+        summary = loaded.get_context_summary()
+        assert summary["total_contexts"] == 3
+        assert summary["contexts_by_type"] == {"task": 2, "memory": 1}
+        assert summary["total_tags"] == 2
+        assert summary["total_sessions"] == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
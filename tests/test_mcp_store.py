@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para a gravação binária do protocolo MCP
+"""
+
+import pytest
+import gc
+import pickle
+import sys
+import os
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPProtocol, MCPContext, ContextType, ContextPriority, ScoringMethod
+
+
+def index_state(index):
+    """Conteúdo completo de um índice invertido, para comparação"""
+    return ({term: dict(postings) for term, postings in index.postings.items()},
+            {doc_id: dict(terms) for doc_id, terms in index.doc_terms.items()},
+            dict(index.doc_lengths), dict(index.max_tf), index.total_length, index.min_length)
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    """Caminho de um arquivo temporário"""
+    return str(tmp_path / "mcp.bin")
+
+
+@pytest.fixture
+def protocol():
+    """Protocolo BM25 com uma sessão e alguns contextos"""
+    protocol = MCPProtocol(scoring=ScoringMethod.BM25)
+    session_id = protocol.create_session("gravada")
+    for i in range(10):
+        context = MCPContext.create(ContextType.KNOWLEDGE, {"text": f"documento número {i}", "n": i},
+                                    priority=ContextPriority.HIGH if i % 2 else ContextPriority.LOW,
+                                    tags=["par" if i % 2 == 0 else "impar"], expires_in_hours=1)
+        protocol.add_context(context, session_id=session_id)
+    return protocol
+
+
+class TestMCPStore:
+    """Testes de save/load"""
+
+    def test_round_trip(self, protocol, store_path):
+        """Contextos, sessões e índices sobrevivem à gravação"""
+        protocol.save(store_path)
+        loaded = MCPProtocol.load(store_path)
+
+        assert list(loaded.contexts) == list(protocol.contexts)
+        for context_id, context in protocol.contexts.items():
+            assert loaded.contexts[context_id] == context
+        session_id = next(iter(protocol.sessions))
+        assert loaded.sessions[session_id].context_ids == protocol.sessions[session_id].context_ids
+        assert [c.id for c in loaded.find_contexts_by_tag("par")] == \
+            [c.id for c in protocol.find_contexts_by_tag("par")]
+        assert [c.id for c in loaded.query_contexts(min_priority=ContextPriority.HIGH)] == \
+            [c.id for c in protocol.query_contexts(min_priority=ContextPriority.HIGH)]
+        assert [c.id for c in loaded.get_relevant_contexts("número 3", 3)] == \
+            [c.id for c in protocol.get_relevant_contexts("número 3", 3)]
+
+    def test_content_is_lazy(self, protocol, store_path):
+        """Conteúdo só é lido no primeiro acesso; a busca não o decodifica"""
+        protocol.save(store_path)
+        loaded = MCPProtocol.load(store_path)
+
+        assert not any(context.content_loaded for context in loaded.contexts.values())
+        results = loaded.get_relevant_contexts("documento", 3)
+        assert results
+        assert not any(context.content_loaded for context in loaded.contexts.values())
+
+        context = results[0]
+        assert context.content["text"].startswith("documento")
+        assert context.content_loaded
+
+    def test_mutations_after_load(self, protocol, store_path):
+        """Acervo carregado aceita alterações e pode ser gravado de novo"""
+        protocol.save(store_path)
+        loaded = MCPProtocol.load(store_path)
+        first_id = next(iter(loaded.contexts))
+        loaded.update_context(first_id, {"extra": "sim"})
+        added = MCPContext.create(ContextType.TASK, {"text": "tarefa nova"})
+        loaded.add_context(added)
+
+        loaded.save(store_path)
+        reloaded = MCPProtocol.load(store_path)
+        assert len(reloaded.contexts) == len(protocol.contexts) + 1
+        assert reloaded.contexts[first_id].content["extra"] == "sim"
+        assert [c.id for c in reloaded.get_relevant_contexts("tarefa", 1)] == [added.id]
+
+    def test_pickle_lazy_context(self, protocol, store_path):
+        """Contexto com conteúdo não lido pode ser serializado com pickle"""
+        protocol.save(store_path)
+        context = next(iter(MCPProtocol.load(store_path).contexts.values()))
+        copy = pickle.loads(pickle.dumps(context))
+        assert copy.content == context.content
+
+    def test_invalid_file(self, tmp_path):
+        """Arquivo em outro formato é rejeitado"""
+        path = tmp_path / "invalido.bin"
+        path.write_bytes(b"nao e um acervo MCP" * 4)
+        with pytest.raises(ValueError):
+            MCPProtocol.load(str(path))
+
+    def test_vector_index(self, store_path):
+        """Índice vetorial é gravado fora do pickle e continua alterável"""
+        np = pytest.importorskip("numpy")
+        protocol = MCPProtocol(max_contexts=5000, scoring=ScoringMethod.VECTOR)
+        for i in range(2000):
+            protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": f"vetor {i}"}))
+        protocol.save(store_path)
+        loaded = MCPProtocol.load(store_path)
+
+        assert np.array_equal(loaded.vector_index.matrix, protocol.vector_index.matrix)
+        assert [c.id for c in loaded.get_relevant_contexts("vetor 7", 3)] == \
+            [c.id for c in protocol.get_relevant_contexts("vetor 7", 3)]
+        loaded.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": "vetor novo"}))
+        assert len(loaded.vector_index) == 2001
+
+
+class TestMCPStoreIndex:
+    """Índices invertidos gravados em arrays e lidos sob demanda"""
+
+    @pytest.fixture
+    def protocols(self, store_path):
+        """Protocolo original (palavras-chave, com acentos) e sua cópia carregada"""
+        protocol = MCPProtocol(max_contexts=500)
+        session_id = protocol.create_session("sessão")
+        for i in range(200):
+            text = f"relatório de produção {i % 7} ação {i} " + "termo%d " % (i % 13) * (i % 4 + 1)
+            protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": text}),
+                                 session_id=session_id if i % 3 else None)
+        protocol.save(store_path)
+        return protocol, MCPProtocol.load(store_path)
+
+    def test_index_round_trip(self, protocols):
+        """Postings, tokens por documento e estatísticas são os mesmos após load"""
+        protocol, loaded = protocols
+        assert index_state(loaded.term_index) == index_state(protocol.term_index)
+        for session_id, index in protocol._session_term_index.items():
+            assert index_state(loaded._session_term_index[session_id]) == index_state(index)
+
+    def test_postings_read_on_demand(self, protocols):
+        """Busca lê apenas os postings dos tokens da query"""
+        protocol, loaded = protocols
+        loaded_results = [c.id for c in loaded.get_relevant_contexts("produção termo3", 5)]
+        assert loaded_results == [c.id for c in protocol.get_relevant_contexts("produção termo3", 5)]
+        read = len(loaded.term_index.postings._items)
+        assert 0 < read < len(protocol.term_index.postings) / 2
+
+    def test_mutations_on_unread_index(self, protocols, store_path):
+        """Remoções e atualizações em entradas ainda não lidas mantêm o índice correto"""
+        protocol, loaded = protocols
+        session_id = next(iter(protocol.sessions))
+        ids = list(protocol.contexts)
+        added = MCPContext.create(ContextType.TASK, {"text": "ação nova"}, tags=["n"])
+        for target in (protocol, loaded):
+            target.remove_context(ids[1])
+            target.update_context(ids[2], {"text": "relatório substituído"})
+            target.add_context(MCPContext.from_dict(added.to_dict()), session_id=session_id)
+            target.add_context_to_session(ids[3], session_id)
+        # Mutações não decodificam postings gravados
+        assert set(loaded.term_index.postings._items) <= {"substitu", "u00eddo", "nova"}
+        assert loaded.term_index.document_frequency("termo1") == protocol.term_index.document_frequency("termo1")
+        assert index_state(loaded.term_index) == index_state(protocol.term_index)
+        assert index_state(loaded._session_term_index[session_id]) == \
+            index_state(protocol._session_term_index[session_id])
+        for query in ("relatório", "ação", "substituído", "termo1"):
+            assert [c.id for c in loaded.get_relevant_contexts(query, 5)] == \
+                [c.id for c in protocol.get_relevant_contexts(query, 5)]
+
+        # Gravar de novo um índice parcialmente lido
+        loaded.save(store_path)
+        reloaded = MCPProtocol.load(store_path)
+        assert index_state(reloaded.term_index) == index_state(protocol.term_index)
+
+    def test_unread_token_removed_with_last_document(self, protocols):
+        """Token gravado sai do índice quando o último documento com ele é removido"""
+        protocol, loaded = protocols
+        with_token = [context_id for context_id, terms in protocol.term_index.doc_terms.items()
+                      if "termo3" in terms]
+        for target in (protocol, loaded):
+            target.remove_contexts(with_token)
+        assert "termo3" not in loaded.term_index.postings
+        assert "termo3" not in loaded.term_index.max_tf
+        assert loaded.get_relevant_contexts("termo3", 3) == protocol.get_relevant_contexts("termo3", 3)
+        assert index_state(loaded.term_index) == index_state(protocol.term_index)
+
+    def test_pickle_loaded_index(self, protocols):
+        """Índice carregado vira um índice comum em pickle e cópias"""
+        protocol, loaded = protocols
+        copy = pickle.loads(pickle.dumps(loaded.term_index))
+        assert type(copy) is type(protocol.term_index)
+        assert index_state(copy) == index_state(protocol.term_index)
+
+    def test_load_restores_gc(self, protocols, store_path):
+        """A coleta de lixo, suspensa durante a carga, volta ao estado anterior"""
+        assert gc.isenabled()
+        MCPProtocol.load(store_path)
+        assert gc.isenabled()
+        gc.disable()
+        try:
+            MCPProtocol.load(store_path)
+            assert not gc.isenabled()
+        finally:
+            gc.enable()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para a busca vetorial do protocolo MCP
+"""
+
+import pytest
+import sys
+import os
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip("numpy")
+
+from protocols.mcp import MCPProtocol, MCPContext, ContextType, ScoringMethod
+from protocols.mcp_vector import HashedEmbedder, IVFIndex, VectorIndex
+
+
+class TestHashedEmbedder:
+    """Testes para embeddings por feature hashing"""
+
+    def test_embedding_is_normalized_and_deterministic(self):
+        """Embedding tem norma 1 e não depende da semente de hash do Python"""
+        embedder = HashedEmbedder(dim=64)
+        first = embedder.embed("Análise de dados com Python")
+        second = embedder.embed("Análise de dados com Python")
+
+        assert first.shape == (64,)
+        assert first.dtype == np.float32
+        assert np.linalg.norm(first) == pytest.approx(1.0, rel=1e-5)
+        assert np.array_equal(first, second)
+
+    def test_empty_text(self):
+        """Texto sem tokens gera vetor nulo"""
+        assert not HashedEmbedder(dim=16).embed("  ...  ").any()
+
+    def test_similar_words_are_closer(self):
+        """N-gramas aproximam variações da mesma palavra"""
+        embedder = HashedEmbedder()
+        query = embedder.embed("programação")
+        related = embedder.embed("programador programas")
+        unrelated = embedder.embed("receitas culinárias")
+
+        assert query @ related > query @ unrelated
+
+
+class TestVectorIndex:
+    """Testes para a matriz de embeddings"""
+
+    def test_grows_and_searches(self):
+        """Matriz cresce além da capacidade inicial e busca os mais similares"""
+        index = VectorIndex(dim=4, initial_capacity=1)
+        vectors = {
+            "a": np.array([1, 0, 0, 0], dtype=np.float32),
+            "b": np.array([0, 1, 0, 0], dtype=np.float32),
+            "c": np.array([0.8, 0.6, 0, 0], dtype=np.float32),
+        }
+        for item_id, vector in vectors.items():
+            index.add(item_id, vector)
+
+        assert len(index) == 3
+        assert index.matrix.shape[0] >= 3
+        results = index.search(np.array([1, 0, 0, 0], dtype=np.float32), 2)
+        assert [item_id for _, item_id in results] == ["a", "c"]
+        assert results[0][0] == pytest.approx(1.0)
+
+    def test_remove_keeps_rows_contiguous(self):
+        """Remoção move a última linha para a posição liberada"""
+        index = VectorIndex(dim=2)
+        for i in range(4):
+            index.add(f"id{i}", np.array([i, 1], dtype=np.float32))
+
+        assert index.remove("id1")
+        assert not index.remove("id1")
+        assert index.ids == ["id0", "id3", "id2"]
+        assert index.rows["id3"] == 1
+        assert np.array_equal(index.vector("id3"), [3, 1])
+
+    def test_replace_vector(self):
+        """Adicionar um id existente substitui o vetor"""
+        index = VectorIndex(dim=2)
+        index.add("x", np.array([1, 0], dtype=np.float32))
+        index.add("x", np.array([0, 1], dtype=np.float32))
+
+        assert len(index) == 1
+        assert np.array_equal(index.vector("x"), [0, 1])
+
+
+class TestIVFIndex:
+    """Testes para o índice aproximado IVF"""
+
+    @pytest.fixture
+    def clustered_vectors(self):
+        """Vetores normalizados agrupados em torno de 20 direções"""
+        rng = np.random.default_rng(1)
+        centers = rng.normal(size=(20, 32))
+        vectors = centers[rng.integers(0, 20, size=2000)] + 0.3 * rng.normal(size=(2000, 32))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.astype(np.float32)
+
+    def test_exact_before_training(self):
+        """Abaixo do tamanho de treino a busca é exata"""
+        index = IVFIndex(dim=2, train_size=100)
+        index.add("a", np.array([1, 0], dtype=np.float32))
+        index.add("b", np.array([0, 1], dtype=np.float32))
+
+        assert not index.is_trained
+        assert [item_id for _, item_id in index.search(np.array([0, 1], dtype=np.float32), 1)] == ["b"]
+
+    def test_recall_against_exact_search(self, clustered_vectors):
+        """Recall@10 alto com poucas listas sondadas e total ao sondar todas"""
+        exact = VectorIndex(dim=32)
+        ivf = IVFIndex(dim=32, n_lists=20, n_probe=4, train_size=500)
+        for i, vector in enumerate(clustered_vectors):
+            exact.add(str(i), vector)
+            ivf.add(str(i), vector)
+        assert ivf.is_trained
+
+        recalls = []
+        for query in clustered_vectors[:50]:
+            expected = {item_id for _, item_id in exact.search(query, 10)}
+            found = {item_id for _, item_id in ivf.search(query, 10)}
+            recalls.append(len(expected & found) / 10)
+            assert {item_id for _, item_id in ivf.search(query, 10, n_probe=20)} == expected
+        assert np.mean(recalls) >= 0.9
+
+    def test_tombstones_and_compaction(self, clustered_vectors):
+        """Removidos somem da busca e são compactados acima do limite"""
+        ivf = IVFIndex(dim=32, n_lists=10, train_size=100, compact_ratio=0.5)
+        for i, vector in enumerate(clustered_vectors[:200]):
+            ivf.add(str(i), vector)
+
+        ivf.remove("0")
+        assert ivf.tombstones == 1
+        assert "0" not in {item_id for _, item_id in ivf.search(clustered_vectors[0], 5, n_probe=10)}
+
+        for i in range(1, 120):
+            ivf.remove(str(i))
+        assert ivf.tombstones < 120
+        assert len(ivf) == 80
+        assert len(ivf.ids) - ivf.tombstones == 80
+        results = ivf.search(clustered_vectors[150], 1, n_probe=10)
+        assert results[0][1] == "150"
+
+    def test_retrains_as_index_grows(self, clustered_vectors):
+        """Agrupamento é refeito quando o índice cresce"""
+        ivf = IVFIndex(dim=32, train_size=100, retrain_growth=2.0)
+        for i, vector in enumerate(clustered_vectors[:450]):
+            ivf.add(str(i), vector)
+
+        assert ivf._trained_size == 400
+        assert sum(ivf._list_sizes) == 450
+
+
+class TestMCPVectorScoring:
+    """Testes para a pontuação vetorial no MCPProtocol"""
+
+    @pytest.fixture
+    def protocol(self):
+        """Protocolo com busca vetorial"""
+        return MCPProtocol(max_contexts=100, scoring=ScoringMethod.VECTOR)
+
+    def test_finds_paraphrases(self, protocol):
+        """Variações morfológicas são encontradas sem correspondência exata"""
+        target = MCPContext.create(ContextType.KNOWLEDGE, {"text": "tutorial de programação em Python"})
+        other = MCPContext.create(ContextType.KNOWLEDGE, {"text": "receita de bolo de chocolate"})
+        protocol.add_context(target)
+        protocol.add_context(other)
+
+        assert protocol.get_relevant_contexts("programar pythonico", max_results=1) == [target]
+
+    def test_index_follows_updates_and_removals(self, protocol):
+        """Embeddings acompanham atualização e remoção"""
+        context = MCPContext.create(ContextType.KNOWLEDGE, {"text": "astronomia"})
+        protocol.add_context(context)
+        protocol.update_context(context.id, {"text": "jardinagem"})
+
+        assert protocol.get_relevant_contexts("jardinagem", max_results=1) == [context]
+
+        protocol.remove_context(context.id)
+        assert context.id not in protocol.vector_index
+        assert protocol.get_relevant_contexts("jardinagem") == []
+
+    def test_non_ascii_query(self, protocol):
+        """Termos acentuados da query correspondem ao texto embutido sem escapes"""
+        report = MCPContext.create(ContextType.KNOWLEDGE, {"text": "relatório de produção anual"})
+        protocol.add_context(report)
+        protocol.add_context(MCPContext.create(ContextType.KNOWLEDGE, {"text": "receita de bolo de chocolate"}))
+
+        scored = protocol.score_relevant_contexts("relatório produção", max_results=1)
+        assert [context for _, context in scored] == [report]
+        assert scored[0][0] > 0.5
+
+    def test_accepts_ann_index(self):
+        """Índice aproximado pode ser configurado por instância"""
+        protocol = MCPProtocol(scoring="vector", vector_index=IVFIndex(dim=128, n_probe=2, train_size=2))
+        contexts = [MCPContext.create(ContextType.KNOWLEDGE, {"text": text})
+                    for text in ("astronomia estelar", "jardinagem urbana", "culinária regional")]
+        for context in contexts:
+            protocol.add_context(context)
+
+        assert protocol.vector_index.is_trained
+        assert protocol.get_relevant_contexts("jardinagem", max_results=1) == [contexts[1]]
+
+    def test_session_scope(self, protocol):
+        """Busca com escopo pontua apenas os contextos das sessões"""
+        session_id = protocol.create_session("s")
+        inside = MCPContext.create(ContextType.KNOWLEDGE, {"text": "jardinagem de inverno"})
+        outside = MCPContext.create(ContextType.KNOWLEDGE, {"text": "jardinagem"})
+        protocol.add_context(inside, session_id=session_id)
+        protocol.add_context(outside)
+
+        assert protocol.get_relevant_contexts("jardinagem", session_id=session_id) == [inside]
+        assert protocol.get_relevant_contexts("jardinagem", max_results=1) == [outside]
+
+    def test_vector_index_only_for_vector_scoring(self):
+        """Outros métodos não mantêm embeddings"""
+        assert MCPProtocol().vector_index is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
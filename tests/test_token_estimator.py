@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes unitários para o estimador local de tokens
+"""
+
+import pytest
+import sys
+import os
+
+# Adiciona o diretório pai ao path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocols.mcp import MCPProtocol, MCPContext, ContextType
+from utils.token_estimator import FEATURES, TokenEstimator, estimate_tokens, text_features
+
+
+class TestTokenEstimator:
+    """Testes do estimador linear"""
+
+    def test_features(self):
+        """Palavras, letras, dígitos, símbolos e caracteres não ASCII"""
+        assert text_features('{"ação": 42}') == (1, 4, 2, 5, 2)
+        assert text_features("") == (0, 0, 0, 0, 0)
+
+    def test_estimate_grows_with_text(self):
+        """Texto vazio custa zero e textos maiores custam mais"""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("a") == 1
+        short = estimate_tokens("olá mundo")
+        assert estimate_tokens("olá mundo " * 10) > short * 5
+
+    def test_batch_matches_single(self):
+        """Lote retorna o mesmo que a estimativa individual"""
+        estimator = TokenEstimator()
+        texts = ["", "x", "Relatório de vendas 2024: R$ 1.234,56", '{"message": "hello world"}' * 7]
+        assert estimator.estimate_many(texts) == [estimator.estimate(text) for text in texts]
+        assert estimator.estimate_many([]) == []
+
+    def test_fit_recovers_coefficients(self):
+        """Calibração reproduz contagens geradas por coeficientes conhecidos"""
+        pytest.importorskip("numpy")
+        truth = TokenEstimator((1.0, 0.1, 1.0, 0.5, 0.0))
+        texts = ["palavra " * i + "1" * (i % 7) + "{}" * (i % 5) + "é" * (i % 3) for i in range(1, 60)]
+        counts = [sum(w * f for w, f in zip(truth.coefficients, text_features(text))) for text in texts]
+
+        fitted = TokenEstimator.fit(texts, counts)
+        assert len(fitted.coefficients) == len(FEATURES)
+        assert all(coefficient >= 0 for coefficient in fitted.coefficients)
+        assert fitted.estimate_many(texts) == truth.estimate_many(texts)
+
+    def test_rejects_wrong_coefficients(self):
+        """Número de coeficientes precisa bater com as características"""
+        with pytest.raises(ValueError):
+            TokenEstimator((1.0, 2.0))
+
+
+class TestContextTokenCache:
+    """Testes do cache de contagem nos contextos"""
+
+    def test_cache_invalidated_on_update(self):
+        """Contagem fica no contexto e é refeita depois de update_content"""
+        estimator = TokenEstimator()
+        context = MCPContext.create(ContextType.MEMORY, {"text": "curto"})
+        first = estimator.context_tokens(context)
+        assert context._tokens == (estimator.coefficients, first)
+
+        context.update_content({"text": "bem mais longo " * 20})
+        assert context._tokens is None
+        assert estimator.context_tokens(context) > first
+
+    def test_estimates_prompt_text(self):
+        """Contagem usa o texto do prompt, com acentos literais, e não o JSON escapado"""
+        estimator = TokenEstimator()
+        context = MCPContext.create(ContextType.MEMORY, {"text": "relatório de produção anual"})
+
+        assert estimator.context_tokens(context) == estimator.estimate(str(context.content))
+        assert estimator.context_tokens(context) < estimator.estimate(context.serialized_content())
+        assert text_features(str(context.content))[FEATURES.index("non_ascii")] == 3
+
+    def test_cache_is_per_estimator(self):
+        """Estimadores com coeficientes diferentes não reaproveitam a contagem"""
+        context = MCPContext.create(ContextType.MEMORY, {"text": "texto qualquer"})
+        TokenEstimator().context_tokens(context)
+        doubled = TokenEstimator(tuple(2 * c for c in TokenEstimator().coefficients))
+        assert doubled.context_tokens(context) >= TokenEstimator().context_tokens(context)
+        assert context._tokens[0] == TokenEstimator().coefficients
+
+    def test_protocol_count_tokens(self):
+        """Protocolo estima em lote e ignora IDs ausentes"""
+        protocol = MCPProtocol()
+        contexts = [MCPContext.create(ContextType.MEMORY, {"text": "nota " * i}) for i in range(1, 4)]
+        protocol.add_contexts(contexts)
+        counts = protocol.count_tokens([c.id for c in contexts] + ["ausente"])
+
+        assert list(counts) == [c.id for c in contexts]
+        assert counts[contexts[0].id] < counts[contexts[2].id]
+        assert counts == {c.id: protocol.token_estimator.context_tokens(c) for c in contexts}
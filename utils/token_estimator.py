@@ -0,0 +1,193 @@
+"""
+Estimativa local de tokens
+
+Conta tokens sem chamar o endpoint de contagem do provedor. A estimativa é
+uma combinação linear de características do texto, obtidas classificando
+cada caractere (letra, dígito, espaço ou símbolo):
+
+    palavras, letras, dígitos, símbolos (pontuação, JSON) e caracteres não ASCII
+
+Os coeficientes padrão são provisórios: foram ajustados à mão para
+aproximar tokenizadores BPE/SentencePiece em texto misto português/inglês,
+sem um conjunto de contagens reais gravado no repositório. Para calibrá-los,
+grave contagens do provedor (``scripts/benchmark_mcp.py tokens --record N``)
+e use ``TokenEstimator.fit`` (requer NumPy). ``estimate_many`` pontua
+milhares de textos com um único produto matriz-vetor quando o NumPy está
+disponível.
+
+Contextos MCP são estimados pelo texto que entra no prompt
+(``context_text``, o mesmo de ``mcp_budget.render_context``), não pelo JSON
+escapado. A contagem fica em cache no próprio contexto e é descartada
+quando o conteúdo muda.
+"""
+
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende do ambiente
+    np = None
+
+FEATURES = ("words", "letters", "digits", "symbols", "non_ascii")
+DEFAULT_COEFFICIENTS = (0.8, 0.12, 0.75, 0.9, 0.25)
+
+# Classes de caractere: letra (str.isalpha), dígito (str.isdecimal), espaço
+# e símbolo (o restante, inclusive caracteres fora do plano básico)
+_SYMBOL, _LETTER, _DIGIT, _SPACE = 0, 1, 2, 3
+_BMP = 0x10000
+_WORD_RE = re.compile("a+")
+
+_translation: Optional[Dict[int, str]] = None
+_class_array = None
+
+
+def _class_of(character: str) -> int:
+    if character.isalpha():
+        return _LETTER
+    if character.isdecimal():
+        return _DIGIT
+    if character.isspace():
+        return _SPACE
+    return _SYMBOL
+
+
+def _translation_table() -> Dict[int, str]:
+    """Tabela de ``str.translate`` que marca letras, dígitos e espaços"""
+    global _translation
+    if _translation is None:
+        marks = {_LETTER: "a", _DIGIT: "0", _SPACE: " "}
+        _translation = {code: marks[kind] for code in range(_BMP)
+                        if (kind := _class_of(chr(code))) != _SYMBOL}
+    return _translation
+
+
+def _classes():
+    """Classe de cada code point do plano básico (último índice: fora dele)"""
+    global _class_array
+    if _class_array is None:
+        _class_array = np.array([_class_of(chr(code)) for code in range(_BMP)] + [_SYMBOL], dtype=np.uint8)
+    return _class_array
+
+
+def text_features(text: str) -> Tuple[int, int, int, int, int]:
+    """Características do texto, na ordem de ``FEATURES``"""
+    classes = text.translate(_translation_table())
+    letters = classes.count("a")
+    digits = classes.count("0")
+    return (
+        len(_WORD_RE.findall(classes)),
+        letters,
+        digits,
+        len(text) - letters - digits - classes.count(" "),
+        len(text) - len(text.encode("ascii", "ignore")),
+    )
+
+
+def _features_matrix(texts: List[str]):
+    """Características de vários textos de uma vez, classificando os caracteres com NumPy"""
+    count = len(texts)
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=count)
+    # Textos separados por um espaço, que não altera nenhuma característica
+    codes = np.frombuffer(" ".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    owner = np.repeat(np.arange(count), lengths + 1)[:len(codes)]
+    kinds = _classes()[np.minimum(codes, _BMP)]
+    by_kind = np.bincount(owner * 4 + kinds, minlength=4 * count).reshape(count, 4)
+    letter = kinds == _LETTER
+    word_start = letter.copy()
+    word_start[1:] &= ~letter[:-1]
+    features = np.empty((count, len(FEATURES)), dtype=np.float64)
+    features[:, 0] = np.bincount(owner[word_start], minlength=count)
+    features[:, 1] = by_kind[:, _LETTER]
+    features[:, 2] = by_kind[:, _DIGIT]
+    features[:, 3] = by_kind[:, _SYMBOL]
+    features[:, 4] = np.bincount(owner[codes >= 128], minlength=count)
+    return features
+
+
+def context_text(context) -> str:
+    """Texto do conteúdo de um contexto como aparece no prompt"""
+    return str(context.content)
+
+
+class TokenEstimator:
+    """Estimador linear de tokens com coeficientes calibráveis"""
+
+    def __init__(self, coefficients: Sequence[float] = DEFAULT_COEFFICIENTS):
+        if len(coefficients) != len(FEATURES):
+            raise ValueError(f"São esperados {len(FEATURES)} coeficientes: {', '.join(FEATURES)}")
+        self.coefficients = tuple(float(value) for value in coefficients)
+
+    def estimate(self, text: str) -> int:
+        """Tokens estimados de um texto"""
+        if not text:
+            return 0
+        total = sum(weight * value for weight, value in zip(self.coefficients, text_features(text)))
+        return max(1, math.ceil(round(total, 6)))
+
+    def estimate_many(self, texts: Iterable[str]) -> List[int]:
+        """Tokens estimados de vários textos de uma vez"""
+        texts = list(texts)
+        if np is None:
+            return [self.estimate(text) for text in texts]
+        if not texts:
+            return []
+        features = _features_matrix(texts)
+        totals = np.ceil(np.round(features @ np.array(self.coefficients), 6))
+        totals = np.where(features.any(axis=1), np.maximum(totals, 1), 0)
+        return totals.astype(np.int64).tolist()
+
+    def context_tokens(self, context) -> int:
+        """Tokens do texto do contexto no prompt (``context_text``), em cache no contexto"""
+        cached = context._tokens
+        if cached is not None and cached[0] == self.coefficients:
+            return cached[1]
+        count = self.estimate(context_text(context))
+        context._tokens = (self.coefficients, count)
+        return count
+
+    def context_tokens_many(self, contexts: Iterable) -> List[int]:
+        """Como ``context_tokens`` para vários contextos, estimando os ausentes em lote"""
+        contexts = list(contexts)
+        counts: List[Optional[int]] = []
+        missing = []
+        for position, context in enumerate(contexts):
+            cached = context._tokens
+            if cached is not None and cached[0] == self.coefficients:
+                counts.append(cached[1])
+            else:
+                counts.append(None)
+                missing.append(position)
+        estimates = self.estimate_many(context_text(contexts[position]) for position in missing)
+        for position, count in zip(missing, estimates):
+            contexts[position]._tokens = (self.coefficients, count)
+            counts[position] = count
+        return counts
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], counts: Sequence[int]) -> 'TokenEstimator':
+        """Calibra os coeficientes por mínimos quadrados não negativos sobre contagens reais"""
+        if np is None:
+            raise ImportError("A calibração do estimador de tokens requer NumPy: pip install numpy")
+        features = _features_matrix(list(texts))
+        target = np.asarray(counts, dtype=np.float64)
+        active = list(range(len(FEATURES)))
+        coefficients = np.zeros(len(FEATURES))
+        # Remove uma a uma as características com peso negativo
+        while active:
+            solution, *_ = np.linalg.lstsq(features[:, active], target, rcond=None)
+            if (solution >= 0).all():
+                coefficients[active] = solution
+                break
+            active.pop(int(np.argmin(solution)))
+        return cls(coefficients.tolist())
+
+
+# Estimador compartilhado com os coeficientes padrão
+default_estimator = TokenEstimator()
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokens estimados com o estimador padrão"""
+    return default_estimator.estimate(text)